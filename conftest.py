@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine
+
+import database.models  # noqa: F401  (registers tables on SQLModel.metadata)
+
+
+@pytest.fixture
+def engine():
+    # Single shared in-memory connection so every session sees the same data
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as session:
+        yield session
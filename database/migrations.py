@@ -0,0 +1,212 @@
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session, SQLModel
+
+import database.models  # noqa: F401  (registers tables on SQLModel.metadata)
+
+# Versioned schema migrations. Applied versions are recorded in `schema_version`;
+# run them once per deploy (python scripts/migrate_schema.py) instead of on every
+# worker start. Add new steps at the end of MIGRATIONS with the next version number.
+
+# Kept out of SQLModel.metadata, so backups/restores and create_all never touch it
+schema_metadata = MetaData()
+schema_version = Table(
+    "schema_version", schema_metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+ADVISORY_LOCK_ID = 7_336_401  # Postgres: one migrating process at a time
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable  # apply(connection)
+    # False: runs in autocommit on Postgres (CREATE INDEX CONCURRENTLY can't run in a transaction).
+    # Such steps must be safe to re-run, since a failure can leave them half done.
+    transactional: bool = True
+
+
+# --- Idempotent DDL helpers ---
+
+def add_column(connection, table: str, column: str, ddl: str) -> bool:
+    if column in {c["name"] for c in inspect(connection).get_columns(table)}:
+        return False
+    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def create_index(connection, name: str, table: str, columns: str, unique: bool = False, using: str = None):
+    """
+    CREATE INDEX IF NOT EXISTS. On Postgres the build is CONCURRENTLY, so writes aren't
+    blocked (use it from a non-transactional migration); an invalid index left by an
+    interrupted concurrent build is dropped and built again.
+    """
+    postgres = connection.dialect.name == "postgresql"
+    if postgres:
+        valid = connection.execute(
+            text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"),
+            {"name": name},
+        ).scalar()
+        if valid is False:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    connection.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX {'CONCURRENTLY ' if postgres else ''}IF NOT EXISTS {name} "
+        f"ON {table} {f'USING {using} ' if using else ''}({columns})"
+    ))
+
+
+# --- Migrations ---
+
+def _create_tables(connection):
+    # Only the missing tables: a fresh database gets the whole current schema here
+    SQLModel.metadata.create_all(connection)
+
+
+def _v5_columns(connection):
+    # Columns added after the first deployments (previously /migrate-schema's ALTER list)
+    for table, column, ddl in (
+        ("product", "category", "TEXT"),
+        ("product", "cant_bulto", "INTEGER"),
+        ("product", "numeracion", "TEXT"),
+        ("product", "version", "INTEGER NOT NULL DEFAULT 0"),
+        ("product", "updated_at", "TIMESTAMP"),
+        ("sale", "idempotency_key", "TEXT"),
+        ("client", "razon_social", "TEXT"),
+        ("client", "cuit", "TEXT"),
+        ("client", "iva_category", "TEXT"),
+        ("client", "transport_name", "TEXT"),
+        ("client", "transport_address", "TEXT"),
+        ("client", "balance", "FLOAT NOT NULL DEFAULT 0"),
+    ):
+        add_column(connection, table, column, ddl)
+
+
+def _v5_indexes(connection):
+    create_index(connection, "ix_product_version", "product", "version")
+    create_index(connection, "ix_sale_idempotency_key", "sale", "idempotency_key", unique=True)
+    create_index(connection, "ix_sale_client_id", "sale", "client_id")
+    create_index(connection, "ix_payment_client_id", "payment", "client_id")
+
+
+def _client_balances(connection):
+    from services.client_ledger import ClientLedger
+
+    # Backfill the maintained balances (no-op when already in sync)
+    with Session(bind=connection) as session:
+        drifts = ClientLedger.verify(session, fix=True)
+    if drifts:
+        print(f"INFO: Client balances fixed: {len(drifts)}")
+
+
+def _search_indexes(connection):
+    from services.search_service import ProductSearchService
+
+    ProductSearchService.create_indexes(connection)
+
+
+def _catalog_version_leases(connection):
+    SQLModel.metadata.create_all(connection, tables=[database.models.CatalogVersionLease.__table__])
+
+
+def _picking_batches(connection):
+    SQLModel.metadata.create_all(connection, tables=[database.models.PickingBatch.__table__])
+
+
+def _client_updated_at(connection):
+    add_column(connection, "client", "updated_at", "TIMESTAMP")
+
+
+def _import_job_heartbeat(connection):
+    for column, ddl in (("owner", "TEXT"), ("heartbeat_at", "TIMESTAMP"), ("timing", "TEXT")):
+        add_column(connection, "import_job", column, ddl)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create tables", _create_tables),
+    Migration(2, "v5 columns", _v5_columns),
+    Migration(3, "v5 indexes", _v5_indexes, transactional=False),
+    Migration(4, "client balances", _client_balances),
+    Migration(5, "search indexes", _search_indexes, transactional=False),
+    Migration(6, "catalog version leases", _catalog_version_leases),
+    Migration(7, "picking batches", _picking_batches),
+    Migration(8, "client updated_at", _client_updated_at),
+    Migration(9, "import job heartbeat", _import_job_heartbeat),
+]
+
+
+# --- Runner ---
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version
+
+
+def current_version(engine) -> int:
+    """
+    One query; 0 for a database that has never been migrated.
+    """
+    try:
+        with engine.connect() as connection:
+            return connection.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    except DBAPIError:
+        return 0
+
+
+def migrate(engine) -> List[str]:
+    """
+    Applies the pending migrations in order, each in its own transaction (autocommit for
+    non-transactional ones on Postgres) recorded together with its version.
+    Returns the names applied.
+    """
+    postgres = engine.dialect.name == "postgresql"
+    applied = []
+    # Autocommit: an open transaction here would make CREATE INDEX CONCURRENTLY wait on it forever
+    lock_connection = engine.connect().execution_options(isolation_level="AUTOCOMMIT") if postgres else nullcontext()
+    with lock_connection as lock:
+        if postgres:
+            lock.execute(text("SELECT pg_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        try:
+            with engine.begin() as connection:
+                schema_metadata.create_all(connection)
+                done = set(connection.execute(select(schema_version.c.version)).scalars())
+
+            for migration in MIGRATIONS:
+                if migration.version in done:
+                    continue
+                print(f"INFO: Applying schema migration {migration.version}: {migration.name}")
+                if migration.transactional or not postgres:
+                    context = engine.begin()
+                else:
+                    context = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+                with context as connection:
+                    migration.apply(connection)
+                    connection.execute(schema_version.insert().values(
+                        version=migration.version, name=migration.name, applied_at=datetime.utcnow(),
+                    ))
+                applied.append(migration.name)
+        finally:
+            if postgres:
+                lock.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID})
+    return applied
+
+
+def ensure_current(engine, auto_migrate: bool) -> List[str]:
+    """
+    Startup check: a single query when the schema is up to date. Behind, it migrates
+    if auto_migrate is set and refuses to start otherwise.
+    """
+    version = current_version(engine)
+    if version >= latest_version():
+        return []
+    if not auto_migrate:
+        raise RuntimeError(
+            f"Database schema is at version {version}, this release needs {latest_version()}: "
+            "run `python scripts/migrate_schema.py` (or set AUTO_MIGRATE=1)"
+        )
+    return migrate(engine)
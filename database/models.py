@@ -1,5 +1,5 @@
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, date
 from sqlmodel import Field, SQLModel, Relationship
 
 # --- Settings Model ---
@@ -34,6 +34,11 @@ class Client(SQLModel, table=True):
     transport_name: Optional[str] = None
     transport_address: Optional[str] = None
     
+    # Sales minus payments, maintained by ClientLedger (verify/rebuild: scripts/rebuild_client_balances.py)
+    balance: float = Field(default=0.0)
+    # Set on every edit; part of the cached remito key (RemitoRenderer), so every worker sees the change
+    updated_at: Optional[datetime] = None
+    
     sales: List["Sale"] = Relationship(back_populates="client")
     payments: List["Payment"] = Relationship(back_populates="client")
 
@@ -66,6 +71,30 @@ class Product(SQLModel, table=True):
     numeracion: Optional[str] = None # Size/Numbering
     
     curve_quantity: int = Field(default=1) # Quantity in the curve/pack
+    
+    # Delta sync: bumped from CatalogSequence on every change (see CatalogService)
+    version: int = Field(default=0, index=True)
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
+
+# --- Catalog Sync Models ---
+class CatalogSequence(SQLModel, table=True):
+    # Single-row counter (id=1), see CatalogService.next_version
+    id: Optional[int] = Field(default=None, primary_key=True)
+    value: int = Field(default=0)
+
+class CatalogVersionLease(SQLModel, table=True):
+    __tablename__ = "catalog_version_lease"
+    # Versions handed out but not committed yet (Postgres, see CatalogService.next_version);
+    # deleted by the transaction that uses them
+    version: int = Field(primary_key=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ProductTombstone(SQLModel, table=True):
+    # Deleted products, so delta clients can drop them from their cache
+    id: Optional[int] = Field(default=None, primary_key=True)
+    product_id: int = Field(index=True)
+    version: int = Field(index=True)
+    deleted_at: datetime = Field(default_factory=datetime.utcnow)
 
 # --- Sale Models (Header & Detail) ---
 class Sale(SQLModel, table=True):
@@ -73,12 +102,13 @@ class Sale(SQLModel, table=True):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     total_amount: float = Field(default=0.0)
     payment_method: str = Field(default="cash") # cash, card, transfer
+    idempotency_key: Optional[str] = Field(default=None, unique=True, index=True) # Client-generated, dedupes retries
     
     # Foreign Keys
     user_id: Optional[int] = Field(default=None, foreign_key="user.id")
     user: Optional[User] = Relationship(back_populates="sales")
     
-    client_id: Optional[int] = Field(default=None, foreign_key="client.id")
+    client_id: Optional[int] = Field(default=None, foreign_key="client.id", index=True)
     client: Optional["Client"] = Relationship(back_populates="sales")
     
     items: List["SaleItem"] = Relationship(back_populates="sale")
@@ -95,13 +125,69 @@ class SaleItem(SQLModel, table=True):
     
     sale: Optional[Sale] = Relationship(back_populates="items")
 
+# --- Stock Ledger (append-only) ---
+class StockMovement(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    product_id: int = Field(index=True) # No FK: history outlives deleted products
+    delta: int # +entry / -exit
+    reason: str # sale, picking_exit, picking_entry, adjustment, import, opening, reconciliation
+    sale_id: Optional[int] = Field(default=None, foreign_key="sale.id")
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    # False until compaction folds it into Product.stock_quantity
+    applied: bool = Field(default=False, index=True)
+
+class PickingBatch(SQLModel, table=True):
+    __tablename__ = "picking_batch"
+    # Applied picking entry uploads by client key: a retried upload gets the stored answer instead of adding stock twice
+    id: Optional[int] = Field(default=None, primary_key=True)
+    idempotency_key: str = Field(unique=True, index=True)
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    result: str = Field(default="{}") # JSON, the response sent the first time
+
+# --- Reporting ---
+class SalesDailyRollup(SQLModel, table=True):
+    __tablename__ = "sales_daily_rollup"
+    # One row per store-timezone day and payment method, maintained with every sale
+    day: date = Field(primary_key=True)
+    payment_method: str = Field(primary_key=True)
+    sale_count: int = Field(default=0)
+    total: float = Field(default=0.0)
+
 # --- Payment Model (Current Account) ---
 class Payment(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    client_id: int = Field(foreign_key="client.id")
+    client_id: int = Field(foreign_key="client.id", index=True)
     amount: float
     date: datetime = Field(default_factory=datetime.utcnow)
     note: Optional[str] = None
     
     # Relationship
     client: Optional[Client] = Relationship(back_populates="payments")
+
+# --- Background Jobs ---
+class ImportJob(SQLModel, table=True):
+    __tablename__ = "import_job"
+    # Spreadsheet imports run on a worker thread; progress lives here so any web worker can report it
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str # products, clients
+    filename: str
+    path: str # uploaded file on disk, removed when the job ends
+    status: str = Field(default="queued", index=True) # queued, running, done, failed
+    total_rows: Optional[int] = None
+    processed_rows: int = Field(default=0)
+    added: int = Field(default=0)
+    updated: int = Field(default=0)
+    error_count: int = Field(default=0)
+    errors: str = Field(default="[]") # JSON list, first ImportJobRunner.MAX_ERRORS only
+    message: Optional[str] = None # why a failed job stopped
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Runner process that owns the job and its last sign of life: only jobs whose owner
+    # stopped beating are failed by recovery (see ImportJobRunner.recover)
+    owner: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None
+    timing: Optional[str] = None # JSON, per-phase times (ms) reported by the importer
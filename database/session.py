@@ -1,4 +1,4 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel import create_engine, Session
 import os
 from dotenv import load_dotenv
 
@@ -51,7 +51,9 @@ if "postgresql" in DATABASE_URL and "sslmode" not in DATABASE_URL:
 engine = create_engine(DATABASE_URL, connect_args=connect_args)
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    # Versioned migrations: creates a fresh schema or upgrades an old one, then records it
+    from database.migrations import migrate
+    migrate(engine)
 
 def get_session():
     with Session(engine) as session:
@@ -1,33 +1,74 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, Form, status, Response, UploadFile, File
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Depends, HTTPException, Request, Form, status, Response, UploadFile, File, Header
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select, func
+from sqlmodel import Session, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 from typing import Optional, List
+from datetime import datetime, date
 import shutil
+import json
 import os
 
-from database.session import create_db_and_tables, get_session
-from database.models import Product, Sale, User, Settings, Client, Payment, Tax
-from services.stock_service import StockService
+from database.session import get_session, engine
+from database import migrations
+from database.models import Product, Sale, User, Settings, Client, Payment, Tax, ImportJob
+from services.stock_service import StockService, ProductNotFoundError
 from services.auth_service import AuthService
-import barcode
-from barcode.writer import ImageWriter
+from services.search_service import ProductSearchService
+from services.catalog_service import CatalogService
+from services.stock_events import stock_broadcaster
+from services.stock_ledger import StockLedger
+from services.label_pdf import LabelPdfWriter
+from services.sales_rollup import SalesRollup
+from services.client_ledger import ClientLedger
+from services.client_statement import ClientStatement
+from services.dashboard_metrics import dashboard_metrics
+from services.remito_renderer import RemitoRenderer
+from services.product_import import ProductImporter
+from services.client_import import ClientImporter
+from services.import_jobs import ImportJobRunner
+from services.backup import DatabaseBackup, DatabaseRestore
+from services.legacy_migration import LegacyMigration
 
 # Setup
 stock_service = StockService(static_dir="static/barcodes")
+search_service = ProductSearchService()
+import_jobs = ImportJobRunner(engine, upload_dir=os.getenv("IMPORT_UPLOAD_DIR", "uploads/imports"), handlers={
+    "products": ProductImporter.run,
+    "clients": ClientImporter.run,
+})
 templates = Jinja2Templates(directory="templates")
+remito_renderer = RemitoRenderer(templates.env)
+SALES_PAGE_SIZE = 50
+CLIENTS_PAGE_SIZE = 50
+MAX_REMITO_BATCH = 500
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # On startup
-    create_db_and_tables()
+    # On startup: schema migrations run once per deploy (scripts/migrate_schema.py), so this
+    # is a single version query; SQLite dev databases are migrated in place
+    auto_migrate = os.getenv("AUTO_MIGRATE", "1" if engine.dialect.name == "sqlite" else "0") == "1"
+    migrations.ensure_current(engine, auto_migrate=auto_migrate)
+    search_service.detect(engine)
     # Seed Data
     session = next(get_session())
     AuthService.create_default_user_and_settings(session)
+    CatalogService.ensure_sequence(session)
+    # Fold pending stock movements into the product snapshot
+    stop_compactor = StockLedger.start_compactor(engine, interval=float(os.getenv("STOCK_COMPACT_INTERVAL", "5")))
+    # Only jobs whose owner stopped beating: other workers may be mid-import in a rolling deploy
+    import_jobs.recover()
+    import_jobs.start_heartbeat()
+    # One render pool for label runs, for the life of the worker
+    stock_service.barcode_cache.start_pool(int(os.getenv("LABEL_RENDER_WORKERS", "0")) or None)
     yield
+    stop_compactor.set()
+    import_jobs.shutdown()
+    stock_service.barcode_cache.shutdown_pool()
 
 app = FastAPI(title="NexPos System", lifespan=lifespan)
 
@@ -77,129 +118,127 @@ def logout(request: Request):
 
 @app.get("/", response_class=HTMLResponse)
 def get_dashboard(request: Request, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
-    total_products = session.exec(select(func.count(Product.id))).one()
-    low_stock = session.exec(select(func.count(Product.id)).where(Product.stock_quantity < Product.min_stock_level)).one()
-    recent_sales = session.exec(select(Sale).order_by(Sale.timestamp.desc()).limit(5)).all()
-    
-    # Calculate Today's Sales
-    from datetime import datetime, date
-    today_start = datetime.combine(date.today(), datetime.min.time())
-    
-    # Sum total_amount for sales >= today_start
-    # SQLModel sum might return None if no rows
-    today_sales_total = session.exec(
-        select(func.sum(Sale.total_amount)).where(Sale.timestamp >= today_start)
-    ).one() or 0.0
-    
+    # Cached figures shared by all terminals; the page then polls /api/dashboard/metrics
+    metrics = dashboard_metrics.get(session)
     return templates.TemplateResponse("dashboard.html", {
         "request": request, "active_page": "home", "settings": settings, "user": user,
-        "total_products": total_products, "low_stock": low_stock, "recent_sales": recent_sales,
-        "today_sales_total": today_sales_total
+        **metrics
     })
 
+@app.get("/api/dashboard/metrics")
+def dashboard_metrics_api(session: Session = Depends(get_session), user: User = Depends(require_auth)):
+    return dashboard_metrics.get(session)
+
 @app.get("/pos", response_class=HTMLResponse)
 def get_pos(request: Request, user: User = Depends(require_auth), settings: Settings = Depends(get_settings)):
     return templates.TemplateResponse("pos.html", {"request": request, "active_page": "pos", "settings": settings, "user": user})
 
 @app.get("/products", response_class=HTMLResponse)
 def get_products_page(request: Request, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
-    products = session.exec(select(Product)).all()
+    # Available stock (snapshot + pending receipts): also what the edit form pre-fills
+    products = StockLedger.show_available(session, session.exec(select(Product)).all())
     return templates.TemplateResponse("products.html", {"request": request, "active_page": "products", "settings": settings, "user": user, "products": products})
 
 @app.get("/clients", response_class=HTMLResponse)
-def get_clients_page(request: Request, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
-    clients = session.exec(select(Client)).all()
-    
-    # Calculate balances for each client
-    # Optimization: In a real app, use a SQL aggregation query. simpler loop for now.
-    balances = {}
-    for c in clients:
-        sales_total = session.exec(select(func.sum(Sale.total_amount)).where(Sale.client_id == c.id)).one() or 0.0
-        payments_total = session.exec(select(func.sum(Payment.amount)).where(Payment.client_id == c.id)).one() or 0.0
-        balances[c.id] = float(sales_total - payments_total)
+def get_clients_page(request: Request, page: int = 1, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
+    # Balances are maintained on the client row (ClientLedger): one query per page
+    page = max(1, page)
+    clients = session.exec(
+        select(Client).order_by(Client.name, Client.id)
+        .offset((page - 1) * CLIENTS_PAGE_SIZE).limit(CLIENTS_PAGE_SIZE + 1)
+    ).all()
+    has_next = len(clients) > CLIENTS_PAGE_SIZE
+    clients = clients[:CLIENTS_PAGE_SIZE]
+    balances = {c.id: round(c.balance or 0.0, 2) for c in clients}
         
-    return templates.TemplateResponse("clients.html", {"request": request, "active_page": "clients", "settings": settings, "user": user, "clients": clients, "balances": balances})
+    return templates.TemplateResponse("clients.html", {"request": request, "active_page": "clients", "settings": settings, "user": user, "clients": clients, "balances": balances, "page": page, "has_next": has_next})
+
+def _date_range(date_from: Optional[str], date_to: Optional[str]):
+    # Filter forms send empty strings for blank date inputs
+    try:
+        return (date.fromisoformat(date_from) if date_from else None,
+                date.fromisoformat(date_to) if date_to else None)
+    except ValueError:
+        raise HTTPException(400, "Invalid date (expected YYYY-MM-DD)")
 
 @app.get("/clients/{id}/account", response_class=HTMLResponse)
-def get_client_account(id: int, request: Request, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
+def get_client_account(id: int, request: Request, date_from: Optional[str] = None, date_to: Optional[str] = None, cursor: Optional[str] = None, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
     client = session.get(Client, id)
     if not client: raise HTTPException(404, "Client not found")
     
-    # 1. Get Sales
-    sales = session.exec(select(Sale).where(Sale.client_id == id)).all()
-    
-    # 2. Get Payments
-    payments_list = session.exec(select(Payment).where(Payment.client_id == id)).all()
-    
-    # 3. Calculate Balance & Mix Movements
-    total_debt = sum(s.total_amount for s in sales)
-    total_paid = sum(p.amount for p in payments_list)
-    balance = float(total_debt - total_paid)
-    
-    movements = []
-    for s in sales:
-        movements.append({
-            "date": s.timestamp,
-            "description": f"Venta #{s.id}",
-            "amount": s.total_amount,
-            "type": "sale"
-        })
-    for p in payments_list:
-        movements.append({
-            "date": p.date,
-            "description": f"Abono: {p.note or ''}",
-            "amount": p.amount,
-            "type": "payment"
-        })
-        
-    # Sort by date descending
-    movements.sort(key=lambda x: x["date"], reverse=True)
-    
+    date_from, date_to = _date_range(date_from, date_to)
+    try:
+        statement = ClientStatement.page(session, id, date_from=date_from, date_to=date_to, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
     return templates.TemplateResponse("client_account.html", {
         "request": request, 
         "active_page": "clients", 
         "settings": settings, 
         "user": user, 
         "client": client,
-        "balance": round(balance, 2),
-        "movements": movements
+        "balance": round(client.balance, 2),
+        "movements": statement["items"],
+        "next_cursor": statement["next_cursor"],
+        "date_from": date_from,
+        "date_to": date_to
     })
 
+@app.get("/clients/{id}/statement.{fmt}")
+def export_client_statement(id: int, fmt: str, date_from: Optional[str] = None, date_to: Optional[str] = None, user: User = Depends(require_auth), session: Session = Depends(get_session)):
+    client = session.get(Client, id)
+    if not client: raise HTTPException(404, "Client not found")
+
+    date_from, date_to = _date_range(date_from, date_to)
+    # Rows stream straight from the window-function query; nothing is accumulated here
+    filename = f"estado_cuenta_{id}"
+    if fmt == "csv":
+        return StreamingResponse(
+            ClientStatement.stream_csv(engine, id, date_from, date_to),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'}
+        )
+    if fmt == "pdf":
+        return StreamingResponse(
+            ClientStatement.stream_pdf(engine, id, date_from, date_to),
+            media_type="application/pdf",
+            headers={"Content-Disposition": f'inline; filename="{filename}.pdf"'}
+        )
+    raise HTTPException(404, "Unsupported format")
+
 @app.post("/api/clients/{id}/pay")
 def register_payment(id: int, amount: float = Form(...), note: Optional[str] = Form(None), session: Session = Depends(get_session), user: User = Depends(require_auth)):
     client = session.get(Client, id)
     if not client: raise HTTPException(404, "Client not found")
     
-    payment = Payment(client_id=id, amount=amount, note=note)
-    session.add(payment)
+    ClientLedger.register_payment(session, id, amount, note)
     session.commit()
     
     return RedirectResponse(f"/clients/{id}/account", status_code=303)
 
 @app.get("/sales", response_class=HTMLResponse)
-def get_sales_page(request: Request, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
-    # All sales ordered by date
-    sales = session.exec(select(Sale).order_by(Sale.timestamp.desc())).all()
-    low_stock_products = session.exec(select(Product).where(Product.stock_quantity < Product.min_stock_level)).all()
-    
-    # Calculate Daily Sales Totals
-    # We do this in Python to avoid complex SQL grouping with SQLite/SQLModel which can be tricky with timezone awareness
-    from collections import defaultdict
-    daily_stats = defaultdict(float)
-    
-    for sale in sales:
-        date_str = sale.timestamp.strftime('%Y-%m-%d')
-        daily_stats[date_str] += sale.total_amount
-        
-    # Convert to list of dicts for template
-    daily_sales = [{"date": k, "total": v} for k, v in daily_stats.items()]
-    # Sort by date desc
-    daily_sales.sort(key=lambda x: x['date'], reverse=True)
+def get_sales_page(request: Request, page: int = 1, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
+    # Recent sales, one page at a time (items loaded in one extra query, not one per sale)
+    page = max(1, page)
+    sales = session.exec(
+        select(Sale).options(selectinload(Sale.items))
+        .order_by(Sale.timestamp.desc(), Sale.id.desc())
+        .offset((page - 1) * SALES_PAGE_SIZE).limit(SALES_PAGE_SIZE + 1)
+    ).all()
+    has_next = len(sales) > SALES_PAGE_SIZE
+    sales = sales[:SALES_PAGE_SIZE]
+    low_stock_products = StockLedger.show_available(session, session.exec(
+        select(Product).where(StockLedger.available_expression() < Product.min_stock_level)
+    ).all())
+    
+    # Daily totals come from the maintained rollup (store timezone), not from scanning every sale
+    daily_sales = SalesRollup.daily(session, limit=60)
 
     return templates.TemplateResponse("sales.html", {
         "request": request, "active_page": "sales", "settings": settings, "user": user, 
         "sales": sales, "low_stock_products": low_stock_products,
-        "daily_sales": daily_sales
+        "daily_sales": daily_sales, "page": page, "has_next": has_next
     })
 
 @app.get("/settings", response_class=HTMLResponse)
@@ -223,7 +262,37 @@ async def update_settings(request: Request, company_name: str = Form(...), logo_
 # --- Products ---
 @app.get("/api/products")
 def get_products_api(session: Session = Depends(get_session), user: User = Depends(require_auth)):
-    return session.exec(select(Product)).all()
+    return StockLedger.show_available(session, session.exec(select(Product)).all())
+
+@app.get("/api/products/search")
+def search_products_api(
+    q: str = "",
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session),
+    user: User = Depends(require_auth)
+):
+    # Read the version first: anything committed during the search is re-sent by /changes
+    version = CatalogService.current_version(session)
+    try:
+        result = search_service.search(session, q=q, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    StockLedger.show_available(session, result["items"])
+    result["version"] = version
+    return result
+
+@app.get("/api/products/changes")
+def get_product_changes_api(
+    since: Optional[int] = None,
+    after_id: int = 0,
+    limit: int = 500,
+    session: Session = Depends(get_session),
+    user: User = Depends(require_auth)
+):
+    # Delta feed: without `since` this is a full (paged) snapshot
+    limit = max(1, min(limit, 5000))
+    return CatalogService.changes_since(session, since=since, after_id=after_id, limit=limit)
 
 @app.post("/api/products")
 def create_product_api(
@@ -264,7 +333,12 @@ def create_product_api(
     if not product.barcode:
         product.barcode = stock_service.generate_barcode(product.id)
         session.add(product)
-        session.commit()
+    
+    if stock:
+        StockLedger.append(session, [{"product_id": product.id, "delta": stock, "reason": "opening", "user_id": user.id, "applied": True}])
+    CatalogService.touch_products(session, [product.id])
+    session.commit()
+    session.refresh(product)
         
     return product
 
@@ -287,7 +361,8 @@ def update_product_api(
     if not product: raise HTTPException(404, "Not found")
     product.name = name
     product.price = price
-    product.stock_quantity = stock
+    # The form shows available stock; the difference goes to the ledger
+    StockLedger.set_stock(session, product, stock, "adjustment", user.id)
     product.description = description
     product.category = category
     product.cant_bulto = cant_bulto
@@ -307,79 +382,131 @@ def update_product_api(
         product.image_url = f"/{file_location}"
         
     session.add(product)
+    CatalogService.touch_products(session, [product.id])
     session.commit()
-    return product
+    session.refresh(product)
+    return StockLedger.show_available(session, [product])[0]
 
 @app.delete("/api/products/{id}")
 def delete_product_api(id: int, session: Session = Depends(get_session), user: User = Depends(require_auth)):
     product = session.get(Product, id)
     if not product: raise HTTPException(404, "Not found")
     session.delete(product)
+    CatalogService.record_deletion(session, id)
     session.commit()
     return {"ok": True}
 
+# --- Stock ledger ---
+@app.get("/api/products/{id}/movements")
+def product_movements_api(id: int, limit: int = 100, before_id: Optional[int] = None, session: Session = Depends(get_session), user: User = Depends(require_auth)):
+    # Audit trail, newest first; page with before_id=next_before_id
+    product = session.get(Product, id)
+    if not product: raise HTTPException(404, "Not found")
+    limit = max(1, min(limit, 1000))
+    movements = StockLedger.history(session, id, limit=limit, before_id=before_id)
+    pending = StockLedger.pending_deltas(session, [id]).get(id, 0)
+    return {
+        "product_id": id,
+        "snapshot": product.stock_quantity,
+        "pending": pending,
+        "available": product.stock_quantity + pending,
+        "movements": movements,
+        "next_before_id": movements[-1].id if len(movements) == limit else None,
+    }
+
+@app.post("/api/stock/reconcile")
+def reconcile_stock_api(fix: bool = False, session: Session = Depends(get_session), user: User = Depends(require_auth)):
+    if user.role != "admin": raise HTTPException(403)
+    compacted = StockLedger.compact(session)
+    drifts = StockLedger.reconcile(session, fix=fix)
+    return {"compacted": compacted, "drifts": drifts, "fixed": fix}
+
+# --- Live stock updates (SSE) ---
+@app.get("/api/stream/stock")
+async def stream_stock(request: Request):
+    # Session cookie check only: a DB-session dependency would hold a pooled connection for the whole stream
+    if not request.session.get("user_id"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    sub = stock_broadcaster.subscribe()
+    return StreamingResponse(
+        stock_broadcaster.stream(sub, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # --- Products: Label Printing ---
 @app.get("/products/labels", response_class=HTMLResponse)
 def get_labels_page(request: Request, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
     products = session.exec(select(Product)).all()
     return templates.TemplateResponse("print_labels_selection.html", {"request": request, "active_page": "products", "settings": settings, "user": user, "products": products})
 
+def _selected_labels(session: Session, form) -> List[tuple]:
+    """
+    (label, copies) pairs for the products selected in the labels form, in form order.
+    One query for every selected product, one UPDATE for the missing barcodes.
+    """
+    ids = [int(pid_str) for pid_str in form.getlist("selected_products")]
+    products = session.exec(select(Product).where(Product.id.in_(ids))).all() if ids else []
+    assigned = stock_service.assign_missing_barcodes(session, products)
+    # Plain values: the commit below expires the instances, reloading them would be one query each
+    by_id = {p.id: {"name": p.name, "price": p.price, "barcode": p.barcode} for p in products}
+    if assigned:
+        session.commit()
+    return [(by_id[pid], int(form.get(f"qty_{pid}", 1))) for pid in ids if pid in by_id]
+
 @app.post("/products/labels/print", response_class=HTMLResponse)
 async def print_labels(request: Request, session: Session = Depends(get_session)):
     form = await request.form()
-    selected_ids = form.getlist("selected_products")
     
+    # Images come from GET /barcodes/{code}.svg, rendered lazily and cached by the browser
     labels_to_print = []
-    
-    for pid_str in selected_ids:
-        pid = int(pid_str)
-        product = session.get(Product, pid)
-        if product:
-            qty = int(form.get(f"qty_{pid}", 1))
-            
-            # Ensure barcode image exists
-            if not product.barcode:
-                 # If no barcode string, generate one (fallback)
-                 product.barcode = stock_service.generate_barcode(product.id)
-                 session.add(product)
-                 session.commit()
-                 session.refresh(product)
-            
-            # Check if file exists, if not recreate
-            # We want the image filename. 
-            # Re-using generate_barcode logic to ensure file existence for the string.
-            
-            # Sanitize barcode for filename
-            safe_filename = "".join([c for c in product.barcode if c.isalnum()])
-            # If empty fallback to id
-            if not safe_filename: safe_filename = f"prod_{product.id}"
-            
-            file_path = f"static/barcodes/{safe_filename}"
-            # Format: try EAN13 if 12/13 digits, else Code128
-            b_class = barcode.get_barcode_class('ean13') if len(product.barcode) in [12, 13] and product.barcode.isdigit() else barcode.get_barcode_class('code128')
-            
-            # Create image
-            try:
-                my_code = b_class(product.barcode, writer=ImageWriter())
-                my_code.save(file_path) # saves as file_path.png
-                img_filename = f"{safe_filename}.png"
-            except Exception as e:
-                # Fallback implementation if validation fails (e.g. invalid checksum for EAN)
-                # Force Code128
-                my_code = barcode.get('code128', product.barcode, writer=ImageWriter())
-                my_code.save(file_path)
-                img_filename = f"{safe_filename}.png"
-
-            for _ in range(qty):
-                labels_to_print.append({
-                    "name": product.name,
-                    "price": product.price,
-                    "barcode": product.barcode,
-                    "barcode_file": img_filename
-                })
+    for label, qty in _selected_labels(session, form):
+        for _ in range(qty):
+            labels_to_print.append(label)
     
     return templates.TemplateResponse("print_layout.html", {"request": request, "labels": labels_to_print})
 
+@app.post("/products/labels/print.pdf")
+async def print_labels_pdf(request: Request, session: Session = Depends(get_session), user: User = Depends(require_auth)):
+    # Large jobs: the sheet is composed server-side and streamed page by page
+    form = await request.form()
+    labels = _selected_labels(session, form)
+    writer = LabelPdfWriter(stock_service.barcode_cache)
+    return StreamingResponse(
+        writer.stream(labels),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'inline; filename="etiquetas.pdf"'}
+    )
+
+@app.get("/barcodes/{filename:path}")
+def get_barcode_image(filename: str, request: Request, session: Session = Depends(get_session)):
+    # {code}.png or {code}.svg. Public and immutable: the image depends only on the URL
+    code, _, fmt = filename.rpartition(".")
+    if fmt not in stock_service.barcode_cache.FORMATS or not code:
+        raise HTTPException(404, "Not found")
+    
+    cache = stock_service.barcode_cache
+    symbology = cache.resolve_symbology(code)
+    try:
+        cache.validate(code, symbology)
+    except ValueError:
+        raise HTTPException(404, "Invalid barcode")
+    etag = f'"{cache.key(symbology, code, fmt=fmt)}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    # Only product barcodes get a file on disk; any other code lives in the bounded LRU,
+    # so random URLs can't fill the disk
+    known = session.exec(select(Product.id).where(Product.barcode == code)).first() is not None
+    try:
+        data = cache.get(code, symbology, fmt=fmt, persist=known)
+    except ValueError:
+        # Passed the charset check but the symbology still refused it
+        raise HTTPException(404, "Invalid barcode")
+    media_type = "image/svg+xml" if fmt == "svg" else "image/png"
+    return Response(content=data, media_type=media_type, headers=headers)
+
 # --- Clients ---
 @app.get("/api/clients")
 def get_clients_api(session: Session = Depends(get_session), user: User = Depends(require_auth)):
@@ -437,6 +564,7 @@ def update_client_api(
     client.iva_category = iva_category
     client.transport_name = transport_name
     client.transport_address = transport_address
+    client.updated_at = datetime.utcnow()  # cached remitos show the client's contact details
     
     session.add(client)
     session.commit()
@@ -452,25 +580,98 @@ def delete_client_api(id: int, session: Session = Depends(get_session), user: Us
 
 # --- Sales ---
 @app.post("/api/sales")
-def create_sale_api(sale_data: dict, session: Session = Depends(get_session), user: User = Depends(require_auth)):
+def create_sale_api(
+    sale_data: dict,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=100),
+    session: Session = Depends(get_session),
+    user: User = Depends(require_auth)
+):
+    # Replayed request (client retry): return the original sale, stock untouched
+    existing = stock_service.get_sale_by_idempotency_key(session, idempotency_key)
+    if existing:
+        response.headers["Idempotent-Replayed"] = "true"
+        return existing
     try:
         sale = stock_service.process_sale(
             session, 
             user_id=user.id, 
             items_data=sale_data["items"], 
             client_id=sale_data.get("client_id"),
-            amount_paid=sale_data.get("amount_paid")
+            amount_paid=sale_data.get("amount_paid"),
+            idempotency_key=idempotency_key
         )
         return sale
+    except IntegrityError:
+        # Lost the race against a concurrent retry with the same key
+        session.rollback()
+        existing = stock_service.get_sale_by_idempotency_key(session, idempotency_key)
+        if not existing:
+            raise
+        response.headers["Idempotent-Replayed"] = "true"
+        return existing
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+class BatchSaleItem(BaseModel):
+    product_id: int
+    quantity: int
+
+class BatchSale(BaseModel):
+    idempotency_key: str
+    items: List[BatchSaleItem]
+    client_id: Optional[int] = None
+    amount_paid: Optional[float] = None
+    payment_method: str = "cash"
+    timestamp: Optional[datetime] = None # When the till closed the sale (may be offline)
+
+class SaleBatchRequest(BaseModel):
+    sales: List[BatchSale]
+
+@app.post("/api/sales/batch")
+def create_sales_batch_api(data: SaleBatchRequest, session: Session = Depends(get_session), user: User = Depends(require_auth)):
+    # Offline tills upload their whole queue at once; results come back per sale, in order
+    if len(data.sales) > 500:
+        raise HTTPException(status_code=413, detail="Too many sales in one batch (max 500)")
+    sales_data = []
+    for sale in data.sales:
+        entry = sale.model_dump()
+        if sale.timestamp and sale.timestamp.tzinfo:
+            # Sale timestamps are stored as naive server-local time
+            entry["timestamp"] = sale.timestamp.astimezone().replace(tzinfo=None)
+        sales_data.append(entry)
+    return {"results": stock_service.process_sale_batch(session, user_id=user.id, sales_data=sales_data)}
+
+@app.get("/sales/remitos", response_class=HTMLResponse)
+def get_sales_remitos(ids: Optional[str] = None, day: Optional[str] = None, clients_only: bool = True, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
+    # End-of-day dispatch: many remitos in one printable document (?ids=1,2,3 or ?day=YYYY-MM-DD)
+    if ids:
+        try:
+            sale_ids = [int(x) for x in ids.split(",") if x.strip()]
+        except ValueError:
+            raise HTTPException(400, "ids must be comma-separated sale ids")
+    elif day:
+        try:
+            sale_ids = RemitoRenderer.sale_ids_for_day(session, date.fromisoformat(day), clients_only=clients_only, limit=MAX_REMITO_BATCH + 1)
+        except ValueError:
+            raise HTTPException(400, "Invalid date (expected YYYY-MM-DD)")
+    else:
+        raise HTTPException(400, "Pass ids or day")
+    if len(sale_ids) > MAX_REMITO_BATCH:
+        raise HTTPException(status_code=413, detail=f"Too many remitos in one document (max {MAX_REMITO_BATCH})")
+
+    html = remito_renderer.render_page(session, sale_ids, settings)
+    if html is None:
+        raise HTTPException(status_code=404, detail="No sales found")
+    return HTMLResponse(html)
+
 @app.get("/sales/{id}/remito", response_class=HTMLResponse)
-def get_sale_remito(id: int, request: Request, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
-    sale = session.get(Sale, id)
-    if not sale:
+def get_sale_remito(id: int, user: User = Depends(require_auth), settings: Settings = Depends(get_settings), session: Session = Depends(get_session)):
+    # Issued remitos never change: rendered once, then served from the LRU
+    html = remito_renderer.render_page(session, [id], settings)
+    if html is None:
         raise HTTPException(status_code=404, detail="Sale not found")
-    return templates.TemplateResponse("remito.html", {"request": request, "sale": sale, "settings": settings})
+    return HTMLResponse(html)
 
 # --- Migration Endpoint (Temporary) ---
 @app.get("/migrate-legacy")
@@ -478,81 +679,28 @@ def migrate_legacy_data(session: Session = Depends(get_session), user: User = De
     # Only admin can migrate
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Unauthorized")
-        
-    import re
-    import os
     
     # Path to dump file
     sql_path = "legacy_data/dump.sql"
     if not os.path.exists(sql_path):
         return {"error": "Dump file not found"}
-        
-    with open(sql_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    results = {"clients": 0, "products": 0, "errors": []}
-    
-    def parse_mysql_insert(line):
-        match = re.search(r"VALUES\s+(.*);", line, re.IGNORECASE)
-        if not match: return []
-        values_str = match.group(1)
-        rows_raw = re.split(r"\),\s*\(", values_str)
-        parsed_rows = []
-        for row in rows_raw:
-            row = row.strip("()")
-            values = []
-            current_val = ""
-            in_quote = False
-            for char in row:
-                if char == "'" and not in_quote: in_quote = True
-                elif char == "'" and in_quote: in_quote = False
-                elif char == "," and not in_quote:
-                    values.append(current_val.strip().strip("'"))
-                    current_val = ""
-                    continue
-                current_val += char
-            values.append(current_val.strip().strip("'"))
-            parsed_rows.append(values)
-        return parsed_rows
     
-    # Client Migration... (omitted for brevity, keep existing logic if needed)
-    # Just returning simple results for now to avoid huge file context duplication in this replace
-    return {"status": "omitted_for_brevity", "message": "Use previous logic or fix implementation"}
+    # Streamed row by row; duplicates (by name / barcode) are skipped, so re-running is safe
+    try:
+        return LegacyMigration.run(session, sql_path, user.id)
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid dump: {e}")
 
-# --- Schema Migration Endpoint (V5) ---
+# --- Schema Migration Endpoint ---
 @app.get("/migrate-schema")
-def migrate_schema_v5(session: Session = Depends(get_session), user: User = Depends(require_auth)):
+def migrate_schema(user: User = Depends(require_auth)):
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    from sqlalchemy import text
-    from database.session import create_db_and_tables
-    
-    # 1. Create new tables (like Tax)
-    create_db_and_tables() 
-
-    # 2. Add New Columns
-    alter_statements = [
-        "ALTER TABLE product ADD COLUMN category TEXT;",
-        "ALTER TABLE product ADD COLUMN cant_bulto INTEGER;",
-        "ALTER TABLE product ADD COLUMN numeracion TEXT;",
-        "ALTER TABLE client ADD COLUMN razon_social TEXT;",
-        "ALTER TABLE client ADD COLUMN cuit TEXT;",
-        "ALTER TABLE client ADD COLUMN iva_category TEXT;",
-        "ALTER TABLE client ADD COLUMN transport_name TEXT;",
-        "ALTER TABLE client ADD COLUMN transport_address TEXT;"
-    ]
-    
-    results = []
-    for stmt in alter_statements:
-        try:
-            session.exec(text(stmt))
-            session.commit()
-            results.append(f"Success: {stmt}")
-        except Exception as e:
-            results.append(f"Skipped (likely exists): {stmt} - {str(e)[:50]}")
-
-    return {"status": "success", "results": results}
+    # Pending versioned migrations (database/migrations.py); deploys normally run them first
+    applied = migrations.migrate(engine)
+    search_service.detect(engine)
+    return {"status": "success", "version": migrations.current_version(engine), "applied": applied}
 
 
 # --- Settings & Admin (v2.4) ---
@@ -588,139 +736,67 @@ def update_settings_api(
     return {"ok": True}
 
 # --- Import / Export (Excel) ---
-@app.post("/api/import/products")
-async def import_products(file: UploadFile = File(...), session: Session = Depends(get_session), user: User = Depends(require_auth)):
+@app.post("/api/import/products", status_code=202)
+def import_products(file: UploadFile = File(...), session: Session = Depends(get_session), user: User = Depends(require_auth)):
     if user.role != "admin": raise HTTPException(403)
-    
-    import pandas as pd
-    import io
-    
-    contents = await file.read()
-    df = pd.read_excel(io.BytesIO(contents))
-    
-    added = 0
-    updated = 0
-    errors = []
-    
-    # Expected: Name, Price, Stock. Optional: Barcode, Category, Description, CantBulto, Numeracion
-    for index, row in df.iterrows():
-        try:
-            name = str(row.get('Name', '')).strip()
-            if not name or pd.isna(name): continue
-            
-            barcode = str(row.get('Barcode', '')).strip()
-            if pd.isna(barcode) or barcode == 'nan': barcode = None
-            
-            # Helper to get optional fields safely
-            def get_val(col, default=None):
-                val = row.get(col)
-                return str(val).strip() if not pd.isna(val) else default
-                
-            category = get_val('Category')
-            description = get_val('Description')
-            numeracion = get_val('Numeracion')
-            
-            cant_bulto = row.get('CantBulto')
-            if pd.isna(cant_bulto): cant_bulto = None
-            else: cant_bulto = int(cant_bulto)
-            
-            existing = None
-            if barcode:
-                existing = session.exec(select(Product).where(Product.barcode == barcode)).first()
-            
-            if existing:
-                # Update
-                existing.price = float(row.get('Price', existing.price))
-                existing.stock_quantity = int(row.get('Stock', existing.stock_quantity))
-                if category: existing.category = category
-                if description: existing.description = description
-                if numeracion: existing.numeracion = numeracion
-                if cant_bulto is not None: existing.cant_bulto = cant_bulto
-                
-                session.add(existing)
-                updated += 1
-            else:
-                # Create
-                prod = Product(
-                    name=name,
-                    price=float(row.get('Price', 0)),
-                    stock_quantity=int(row.get('Stock', 0)),
-                    barcode=barcode,
-                    category=category,
-                    description=description,
-                    numeracion=numeracion,
-                    cant_bulto=cant_bulto
-                )
-                session.add(prod)
-                added += 1
-                
-        except Exception as e:
-            errors.append(f"Row {index}: {str(e)}")
-            
-    session.commit()
-    return {"added": added, "updated": updated, "errors": errors}
+    # Saved to disk and processed in the background (set-based, committed per chunk)
+    return _queue_import(session, "products", file, user)
 
-@app.post("/api/import/clients")
-async def import_clients(file: UploadFile = File(...), session: Session = Depends(get_session), user: User = Depends(require_auth)):
+@app.post("/api/import/clients", status_code=202)
+def import_clients(file: UploadFile = File(...), session: Session = Depends(get_session), user: User = Depends(require_auth)):
     if user.role != "admin": raise HTTPException(403)
-    
-    import pandas as pd
-    import io
-    
-    contents = await file.read()
-    df = pd.read_excel(io.BytesIO(contents))
-    
-    added = 0
-    errors = []
-    
-    for index, row in df.iterrows():
-        try:
-            name = str(row.get('Name', '')).strip()
-            if not name or pd.isna(name): continue
-            
-            # Check duplicate by name?
-            existing = session.exec(select(Client).where(Client.name == name)).first()
-            if existing: continue # Skip if exists
-            
-            client = Client(
-                name=name,
-                phone=str(row.get('Phone', '')) if not pd.isna(row.get('Phone')) else None,
-                email=str(row.get('Email', '')) if not pd.isna(row.get('Email')) else None,
-                address=str(row.get('Address', '')) if not pd.isna(row.get('Address')) else None
-            )
-            session.add(client)
-            added += 1
-        except Exception as e:
-            errors.append(f"Row {index}: {str(e)}")
-            
-    session.commit()
-    return {"added": added, "errors": errors}
+    return _queue_import(session, "clients", file, user)
+
+def _queue_import(session: Session, kind: str, file: UploadFile, user: User) -> dict:
+    try:
+        job = import_jobs.submit(session, kind, file.file, file.filename, user.id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {"job_id": job.id, "status_url": f"/api/jobs/{job.id}"}
+
+@app.get("/api/jobs/{id}")
+def get_job(id: int, session: Session = Depends(get_session), user: User = Depends(require_auth)):
+    if user.role != "admin": raise HTTPException(403)
+    job = session.get(ImportJob, id)
+    if not job: raise HTTPException(404, "Job not found")
+    return ImportJobRunner.to_dict(job)
 
 # --- Backup ---
 @app.get("/api/backup")
-def download_backup(user: User = Depends(require_auth), session: Session = Depends(get_session)):
+def download_backup(since: Optional[str] = None, user: User = Depends(require_auth)):
     if user.role != "admin": raise HTTPException(403)
     
-    import json
-    from datetime import datetime
-    
-    # Simple JSON dump of main tables
-    data = {
-        "generated_at": datetime.now().isoformat(),
-        "products": [p.model_dump() for p in session.exec(select(Product)).all()],
-        "clients": [c.model_dump() for c in session.exec(select(Client)).all()],
-        "sales": [s.model_dump() for s in session.exec(select(Sale)).all()]
-    }
-    
-    json_str = json.dumps(data, indent=2, default=str)
-    
-    from fastapi.responses import Response
-    return Response(
-        content=json_str,
-        media_type="application/json",
-        headers={"Content-Disposition": f"attachment; filename=backup_{datetime.now().strftime('%Y%m%d')}.json"}
+    # since: the previous backup's manifest "watermarks" (JSON) -> incremental backup
+    watermarks = None
+    if since:
+        try:
+            watermarks = json.loads(since)
+            if not isinstance(watermarks, dict) or not all(isinstance(v, int) for v in watermarks.values()):
+                raise ValueError
+        except ValueError:
+            raise HTTPException(400, "since must be the watermarks object of a previous backup manifest")
+    
+    # Every table as gzip NDJSON with a manifest (row counts, checksums), streamed with flat memory
+    kind = "incremental" if watermarks is not None else "backup"
+    return StreamingResponse(
+        DatabaseBackup.stream(engine, since=watermarks),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f"attachment; filename={kind}_{datetime.now().strftime('%Y%m%d_%H%M')}.ndjson.gz"}
     )
 
+@app.post("/api/restore")
+def restore_backup(file: UploadFile = File(...), user: User = Depends(require_auth)):
+    if user.role != "admin": raise HTTPException(403)
+    
+    # One transaction: a bad or truncated file leaves the database as it was
+    try:
+        result = DatabaseRestore.restore(engine, file.file)
+    except (ValueError, OSError, EOFError) as e:
+        raise HTTPException(400, f"Invalid backup: {e}")
+    dashboard_metrics.invalidate()
+    remito_renderer.clear()
+    return result
+
 # --- Users (Refined) ---
 @app.get("/api/users")
 def get_users(session: Session = Depends(get_session), user: User = Depends(require_auth)):
@@ -793,12 +869,10 @@ def picking_entry(
     if not product:
         raise HTTPException(404, "Producto no encontrado")
     
-    product.stock_quantity += qty
-    session.add(product)
-    session.commit()
-    session.refresh(product)
+    # Append-only: the product row is not locked, compaction applies it later
+    available = stock_service.receive_stock(session, user.id, {product.id: qty})
     
-    return {"status": "ok", "product": {"name": product.name, "new_stock": product.stock_quantity}}
+    return {"status": "ok", "product": {"name": product.name, "new_stock": available[product.id]}}
 
 class PickingItem(BaseModel):
     barcode: str
@@ -807,54 +881,62 @@ class PickingItem(BaseModel):
 class PickingExitRequest(BaseModel):
     items: List[PickingItem]
 
+class PickingEntryBatchRequest(BaseModel):
+    items: List[PickingItem]
+
+@app.post("/api/picking/entry/batch")
+def picking_entry_batch(
+    data: PickingEntryBatchRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=100),
+    session: Session = Depends(get_session),
+    user: User = Depends(require_auth)
+):
+    # Buffered scans from picking.html: one lookup, one transaction for the whole batch
+    if len(data.items) > 5000:
+        raise HTTPException(413, "Too many items in one batch (max 5000)")
+    # Replayed upload (client retry after a lost response): the stock was already added
+    replayed = stock_service.get_picking_batch(session, idempotency_key)
+    if replayed is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+        return {"status": "ok", **replayed}
+    try:
+        result = stock_service.receive_stock_by_barcode(
+            session,
+            user_id=user.id,
+            items_data=[{"barcode": item.barcode, "quantity": item.qty} for item in data.items],
+            idempotency_key=idempotency_key,
+        )
+    except IntegrityError:
+        # Lost the race against a concurrent retry with the same key
+        session.rollback()
+        replayed = stock_service.get_picking_batch(session, idempotency_key)
+        if replayed is None:
+            raise
+        response.headers["Idempotent-Replayed"] = "true"
+        return {"status": "ok", **replayed}
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {"status": "ok", **result}
+
 @app.post("/api/picking/exit")
 def picking_exit(
     data: PickingExitRequest,
     session: Session = Depends(get_session),
     user: User = Depends(require_auth)
 ):
-    # Reuse stock logic but simpler
-    # Validate items
-    products_map = {}
-    total_amount = 0.0
-    
-    # 1. Validate and fetch products
-    for item in data.items:
-        prod = session.exec(select(Product).where(Product.barcode == item.barcode)).first()
-        if not prod:
-            raise HTTPException(404, f"Producto no encontrado: {item.barcode}")
-        
-        # Check stock (optional in picking? usually yes)
-        if prod.stock_quantity < item.qty:
-            raise HTTPException(400, f"Stock insuficente para: {prod.name}")
-            
-        products_map[item.barcode] = prod
-        total_amount += prod.price * item.qty
-
-    # 2. Create Sale
-    new_sale = Sale(client_id=None, user_id=user.id, total_amount=total_amount)
-    session.add(new_sale)
-    session.commit()
-    session.refresh(new_sale)
-    
-    # 3. Create items and deduct stock
-    for item in data.items:
-        prod = products_map[item.barcode]
-        
-        sale_item = SaleItem(
-            sale_id=new_sale.id,
-            product_id=prod.id,
-            quantity=item.qty,
-            unit_price=prod.price,
-            subtotal=prod.price * item.qty
+    # Same sale engine as /api/sales: one IN lookup by barcode, one transaction, bulk items
+    try:
+        new_sale = stock_service.process_sale_by_barcode(
+            session,
+            user_id=user.id,
+            items_data=[{"barcode": item.barcode, "quantity": item.qty} for item in data.items],
+            reason="picking_exit",
         )
-        session.add(sale_item)
-        
-        # Deduct Stock
-        prod.stock_quantity -= item.qty
-        session.add(prod)
-        
-    session.commit()
+    except ProductNotFoundError as e:
+        raise HTTPException(404, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     
     return {
         "status": "ok", 
@@ -877,6 +959,7 @@ def seed_test_products(session: Session = Depends(get_session), user: User = Dep
     ]
     
     added = 0
+    new_products = []
     for p in products_data:
         existing = session.exec(select(Product).where(Product.barcode == p["barcode"])).first()
         if not existing:
@@ -890,8 +973,15 @@ def seed_test_products(session: Session = Depends(get_session), user: User = Dep
                 stock_quantity=100 # Default stock for testing
             )
             session.add(new_prod)
+            new_products.append(new_prod)
             added += 1
             
+    session.flush()  # assign ids to new rows
+    StockLedger.append(session, [
+        {"product_id": p.id, "delta": p.stock_quantity, "reason": "opening", "user_id": user.id, "applied": True}
+        for p in new_products
+    ])
+    CatalogService.touch_products(session, [p.id for p in new_products])
     session.commit()
     return {"status": "success", "added": added, "message": f"Se agregaron {added} productos de prueba."}
 
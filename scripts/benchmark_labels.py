@@ -0,0 +1,44 @@
+import sys
+import os
+import tempfile
+import time
+
+# Add backend directory to path so we can import app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from services.barcode_cache import BarcodeCache
+
+LABELS = 1000
+
+def run(workers: int, codes):
+    # Fresh cache directory per run: every code is a miss
+    with tempfile.TemporaryDirectory() as directory:
+        cache = BarcodeCache(directory)
+        if workers > 1:
+            cache.start_pool(workers)
+        try:
+            start = time.perf_counter()
+            cache.ensure_files(codes, parallel_threshold=0)
+            elapsed = time.perf_counter() - start
+
+            # Second run over the same store: no rendering at all
+            start = time.perf_counter()
+            cache.ensure_files(codes)
+            warm = time.perf_counter() - start
+        finally:
+            cache.shutdown_pool()
+    return elapsed, warm
+
+if __name__ == "__main__":
+    labels = int(sys.argv[1]) if len(sys.argv) > 1 else LABELS
+    # Mix of EAN-13 (12 digits, check digit appended) and Code128 codes, like a real catalog
+    codes = [f"779{i:09d}" if i % 2 else f"{i} NEGRO" for i in range(labels)]
+
+    print(f"Rendering {labels} labels...")
+    serial, warm = run(1, codes)
+    print(f"Serial:            {serial:.2f}s ({labels / serial:.0f} labels/s), cached re-run {warm * 1000:.0f}ms")
+    for workers in sorted({2, min(4, os.cpu_count() or 1), os.cpu_count() or 1}):
+        if workers < 2:
+            continue
+        parallel, _ = run(workers, codes)
+        print(f"Parallel ({workers} procs): {parallel:.2f}s ({labels / parallel:.0f} labels/s), speedup x{serial / parallel:.1f}")
@@ -0,0 +1,70 @@
+import sys
+import os
+import resource
+import tempfile
+import time
+
+# Add backend directory to path so we can import app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlmodel import Session, SQLModel, create_engine
+import database.models  # noqa: F401  (registers tables on SQLModel.metadata)
+from services.legacy_migration import LegacyMigration
+from services.mysql_dump import MysqlDump
+
+SIZE_MB = 2048
+ROWS_PER_INSERT = 500
+
+PRODUCT_COLUMNS = "`id`,`codigo`,`nombre`,`preciocosto`,`precioventa`,`proveedor`,`departamento`,`stock`,`stockMin`,`impuesto`,`medida`,`especificaciones`,`habilitado`"
+
+def write_dump(path: str, size_mb: int):
+    # Shaped like legacy_data/dump.sql: extended INSERTs, escaped quotes, commas and parentheses in strings
+    target = size_mb * 1024 * 1024
+    written, pid, cid = 0, 0, 0
+    specs = repr_sql("Suela de goma; capellada 100% PVC\nColor: negro")
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            rows = []
+            for _ in range(ROWS_PER_INSERT // 10):
+                cid += 1
+                rows.append(f"({cid},'Cliente {cid} d\\'Amico (mayorista)','0',1)")
+            statement = f"INSERT  INTO `cliente`(`id`,`nombre`,`descuento`,`habilitado`) VALUES {','.join(rows)};\n"
+            rows = []
+            for _ in range(ROWS_PER_INSERT):
+                pid += 1
+                rows.append(
+                    f"({pid},'779{pid:010d}','Ojota {pid} \"Playa\" (talle 35/36), negra',{pid % 97}.5,{pid % 89 + 100}.25,1,1,"
+                    f"{pid % 50},5,0,'U',{'NULL' if pid % 3 else specs},1)"
+                )
+            statement += f"INSERT  INTO `producto`({PRODUCT_COLUMNS}) VALUES {','.join(rows)};\n"
+            f.write(statement)
+            written += len(statement.encode("utf-8"))
+    return written
+
+def repr_sql(text: str) -> str:
+    return "'" + text.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+if __name__ == "__main__":
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE_MB
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dump.sql")
+        print(f"Writing a {size_mb} MB synthetic dump...")
+        size = write_dump(path, size_mb) / (1024 * 1024)
+
+        start = time.perf_counter()
+        rows = sum(1 for _ in MysqlDump.rows(path, ("cliente", "producto")))
+        elapsed = time.perf_counter() - start
+        print(f"Tokenize:  {rows} rows in {elapsed:.1f}s ({size / elapsed:.1f} MB/s, {rows / elapsed:.0f} rows/s), peak RSS {peak_rss_mb():.0f} MB")
+
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            start = time.perf_counter()
+            result = LegacyMigration.run(session, path)
+            elapsed = time.perf_counter() - start
+        rows = result["clients"] + result["products"]
+        print(f"Migrate:   {rows} rows in {elapsed:.1f}s ({size / elapsed:.1f} MB/s, {rows / elapsed:.0f} rows/s), peak RSS {peak_rss_mb():.0f} MB")
+        engine.dispose()
@@ -0,0 +1,20 @@
+import sys
+import os
+
+# Add backend directory to path so we can import app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from database.session import engine
+from database import migrations
+
+def migrate():
+    # Run once per deploy, before the workers start (see Dockerfile / render.yaml)
+    before = migrations.current_version(engine)
+    applied = migrations.migrate(engine)
+    if applied:
+        print(f"SUCCESS: Schema migrated from version {before} to {migrations.current_version(engine)} ({', '.join(applied)}).")
+    else:
+        print(f"SUCCESS: Schema already at version {before}.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,25 @@
+import sys
+import os
+
+# Add backend directory to path so we can import app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlmodel import Session
+from database.session import engine
+from services.client_ledger import ClientLedger
+
+def verify(fix: bool):
+    with Session(engine) as session:
+        drifts = ClientLedger.verify(session, fix=fix)
+        for d in drifts:
+            print(f"Client {d['client_id']}: balance={d['balance']} expected={d['expected']}")
+
+        if not drifts:
+            print("SUCCESS: All client balances match sales and payments.")
+        elif fix:
+            print(f"SUCCESS: Rebuilt {len(drifts)} client balances.")
+        else:
+            print(f"Found {len(drifts)} drifted balances. Run with --fix to rebuild them.")
+
+if __name__ == "__main__":
+    verify(fix="--fix" in sys.argv)
@@ -0,0 +1,19 @@
+import sys
+import os
+
+# Add backend directory to path so we can import app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlmodel import Session
+from database.session import engine, create_db_and_tables
+from services.sales_rollup import SalesRollup
+
+def rebuild():
+    create_db_and_tables()  # makes sure sales_daily_rollup exists
+    with Session(engine) as session:
+        print("Rebuilding sales_daily_rollup from sale history...")
+        rows = SalesRollup.rebuild(session)
+        print(f"SUCCESS: {rows} day/payment-method rows written.")
+
+if __name__ == "__main__":
+    rebuild()
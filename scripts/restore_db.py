@@ -0,0 +1,24 @@
+import sys
+import os
+
+# Add backend directory to path so we can import app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from database.session import engine, create_db_and_tables
+from services.backup import DatabaseRestore
+
+def restore(paths):
+    create_db_and_tables()  # restoring into an empty database
+    # A full backup first, then its incrementals in order
+    for path in paths:
+        print(f"Restoring {path}...")
+        result = DatabaseRestore.restore(engine, path)
+        for table, rows in result["tables"].items():
+            print(f"  {table}: {rows} rows" + (f", {result['pruned'][table]} removed" if table in result["pruned"] else ""))
+    print("SUCCESS: Database restored.")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python scripts/restore_db.py FULL_BACKUP [INCREMENTAL ...]")
+        sys.exit(1)
+    restore(sys.argv[1:])
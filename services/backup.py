@@ -0,0 +1,390 @@
+import gzip
+import hashlib
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, func, insert, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import SQLModel
+
+FORMAT = "nexpos-backup"
+FORMAT_VERSION = 1
+
+
+class DatabaseBackup:
+    """
+    Backups as one gzip-compressed NDJSON stream, produced on the fly:
+
+        {"_backup": {"format", "version", "generated_at", "tables", "incremental", "since"}}
+        {"_table": "product", "columns": [...], "mode": "full"}
+        {"id": 1, "name": ..., ...}                 one line per row
+        ...next tables, parents before children...
+        {"_manifest": {"tables": {name: {"rows", "sha256"}}, "watermarks", "generated_at"}}
+
+    Rows are read with yield_per and compressed as they go, so memory stays flat
+    whatever the database size. Each table's sha256 covers exactly its row lines.
+
+    Incremental backups (since=a previous manifest's "watermarks") ship only the
+    append-only history past each primary-key watermark ("mode": "append", "after": id);
+    the other tables are small and always shipped whole. Restore with DatabaseRestore.
+
+    A watermark only covers ids that can no longer appear: Postgres hands out ids when
+    rows are inserted, not in commit order, so while write transactions are in flight
+    it stops before the first gap in the ids. Rows above it ship again next time, and
+    restoring an incremental upserts, so that overlap is harmless.
+    """
+
+    YIELD_PER = 1000
+    FLUSH_BYTES = 64 * 1024
+    # Rows are only ever added to these tables, so "id > last backup's max id" is exactly what's new
+    APPEND_ONLY = ("sale", "saleitem", "payment", "stockmovement")
+    # Rows that can still change in place (compaction flips `applied`): the watermark stays
+    # below the first of them, so they ship again once settled
+    UNSETTLED = {"stockmovement": lambda table: table.c.applied == False}  # noqa: E712
+    # Gaps are looked for among the last GAP_SCAN ids: a transaction still in flight got
+    # its ids after every older one, and never that many ids ago
+    GAP_SCAN = 100_000
+
+    @staticmethod
+    def tables() -> List:
+        # Dependency order: restoring in this order satisfies foreign keys
+        return list(SQLModel.metadata.sorted_tables)
+
+    @staticmethod
+    def stream(engine, tables: Optional[List] = None, since: Optional[Dict[str, int]] = None) -> Iterator[bytes]:
+        tables = tables if tables is not None else DatabaseBackup.tables()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+        buf: List[bytes] = []
+        size = 0
+        generated_at = datetime.utcnow().isoformat()
+        manifest, watermarks = {}, {}
+
+        def emit(line: bytes):
+            nonlocal size
+            out = compressor.compress(line)
+            if out:
+                buf.append(out)
+                size += len(out)
+
+        emit(DatabaseBackup._line({"_backup": {
+            "format": FORMAT, "version": FORMAT_VERSION, "generated_at": generated_at,
+            "tables": [t.name for t in tables],
+            "incremental": since is not None, "since": since,
+        }}))
+
+        connection = engine.connect()
+        if engine.dialect.name == "postgresql":
+            # One snapshot for every table, without blocking writers
+            connection = connection.execution_options(isolation_level="REPEATABLE READ")
+        try:
+            with connection.begin():
+                # First statement: on Postgres this also takes the snapshot everything below reads
+                in_flight = DatabaseBackup._writers_in_flight(connection)
+                for table in tables:
+                    columns = [c.name for c in table.columns]
+                    query = select(table).order_by(*table.primary_key.columns)
+                    section = {"_table": table.name, "columns": columns, "mode": "full"}
+                    if table.name in DatabaseBackup.APPEND_ONLY:
+                        # Same snapshot as the rows below
+                        watermarks[table.name] = DatabaseBackup._watermark(connection, table, (since or {}).get(table.name), in_flight)
+                        if since and table.name in since:
+                            query = query.where(table.c.id > since[table.name])
+                            section.update(mode="append", after=since[table.name])
+                    emit(DatabaseBackup._line(section))
+                    digest = hashlib.sha256()
+                    rows = 0
+                    result = connection.execution_options(yield_per=DatabaseBackup.YIELD_PER).execute(query)
+                    for row in result:
+                        line = DatabaseBackup._line(dict(zip(columns, row)))
+                        digest.update(line)
+                        emit(line)
+                        rows += 1
+                        if size >= DatabaseBackup.FLUSH_BYTES:
+                            yield b"".join(buf)
+                            buf, size = [], 0
+                    manifest[table.name] = {"rows": rows, "sha256": digest.hexdigest()}
+        finally:
+            connection.close()
+
+        emit(DatabaseBackup._line({"_manifest": {"generated_at": generated_at, "tables": manifest, "watermarks": watermarks}}))
+        buf.append(compressor.flush())
+        yield b"".join(buf)
+
+    @staticmethod
+    def read_manifest(source) -> dict:
+        """
+        The manifest of a backup file (path or binary file-like): pass its "watermarks"
+        as `since` to take the next incremental backup.
+        """
+        last = None
+        with gzip.open(source, "rb") as f:
+            for line in f:
+                last = line
+        manifest = json.loads(last).get("_manifest") if last else None
+        if manifest is None:
+            raise ValueError("Backup is truncated (no manifest)")
+        return manifest
+
+    @staticmethod
+    def _writers_in_flight(connection) -> bool:
+        if connection.dialect.name != "postgresql":
+            return False  # SQLite: one writer at a time, rowids handed out in commit order
+        # Transactions with an xid (writers) running when the snapshot was taken
+        return connection.execute(text("SELECT EXISTS (SELECT 1 FROM txid_snapshot_xip(txid_current_snapshot()))")).scalar()
+
+    @staticmethod
+    def _watermark(connection, table, since: Optional[int], in_flight: bool) -> int:
+        top = connection.execute(select(func.max(table.c.id))).scalar() or 0
+        unsettled = DatabaseBackup.UNSETTLED.get(table.name)
+        if unsettled is not None:
+            first = connection.execute(select(func.min(table.c.id)).where(unsettled(table))).scalar()
+            if first is not None:
+                top = first - 1
+        if not in_flight:
+            return top
+
+        # A missing id may belong to a transaction that commits after this snapshot: the
+        # watermark stops at the last id before the first gap (a rolled-back insert looks
+        # the same and only holds the watermark back until a backup without writers)
+        floor = max(since or 0, top - DatabaseBackup.GAP_SCAN)
+        first = connection.execute(select(func.min(table.c.id)).where(table.c.id > floor)).scalar()
+        if first is None or first > floor + 1:
+            return min(floor, top)
+        ids = select(table.c.id, func.lead(table.c.id).over(order_by=table.c.id).label("next")) \
+            .where(table.c.id >= first, table.c.id <= top).subquery()
+        before_gap = connection.execute(select(func.min(ids.c.id)).where(ids.c.next > ids.c.id + 1)).scalar()
+        return before_gap if before_gap is not None else top
+
+    @staticmethod
+    def _line(obj: dict) -> bytes:
+        return json.dumps(obj, default=DatabaseBackup._encode, separators=(",", ":"), ensure_ascii=False).encode() + b"\n"
+
+    @staticmethod
+    def _encode(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class DatabaseRestore:
+    """
+    Loads a DatabaseBackup stream in a single transaction, so a failed or corrupt
+    restore leaves the database untouched.
+
+    A full backup replaces the tables it contains: COPY on Postgres (psycopg2),
+    executemany batches elsewhere. An incremental backup is applied on top of its base:
+    rows are upserted by primary key, and full sections also drop the rows that are
+    no longer in them. Row counts and checksums are checked against the manifest
+    before committing; Postgres sequences are then moved past the restored ids.
+    """
+
+    BATCH = 5000
+
+    @staticmethod
+    def restore(engine, source) -> dict:
+        """
+        source: path or binary file-like of a .ndjson.gz backup.
+        Returns {"incremental", "generated_at", "tables": {name: rows}, "pruned": {name: rows}}.
+        Raises ValueError if the file is not a usable backup.
+        """
+        tables = {t.name: t for t in SQLModel.metadata.sorted_tables}
+        with gzip.open(source, "rb") as f, engine.begin() as connection:
+            lines = iter(f)
+            header = json.loads(next(lines, b"{}")).get("_backup")
+            if not header or header.get("format") != FORMAT:
+                raise ValueError("Not a NexPos backup")
+            if header["version"] > FORMAT_VERSION:
+                raise ValueError(f"Backup format v{header['version']} is newer than this version of NexPos")
+            unknown = [name for name in header["tables"] if name not in tables]
+            if unknown:
+                raise ValueError(f"Unknown tables in backup: {', '.join(unknown)}")
+
+            incremental = header.get("incremental", False)
+            if not incremental:
+                DatabaseRestore._clear(connection, [tables[name] for name in header["tables"]])
+
+            sections: Dict[str, _Section] = {}
+            section = manifest = None
+            for line in lines:
+                if not line.startswith(b'{"_'):
+                    if section is None:
+                        raise ValueError("Backup rows before any table header")
+                    section.add(line)
+                    continue
+                record = json.loads(line)
+                if section:
+                    section.flush()
+                if "_manifest" in record:
+                    manifest = record["_manifest"]
+                    break
+                table = tables[record["_table"]]
+                if incremental and record.get("mode") == "append":
+                    DatabaseRestore._check_base(connection, table, record["after"])
+                section = sections[table.name] = _Section(connection, table, record["columns"], upsert=incremental)
+
+            if manifest is None:
+                raise ValueError("Backup is truncated (no manifest)")
+            for name, expected in manifest["tables"].items():
+                loaded = sections.get(name)
+                if loaded is None or loaded.rows != expected["rows"] or loaded.digest.hexdigest() != expected["sha256"]:
+                    raise ValueError(f"Table {name} does not match the backup manifest")
+
+            pruned = {}
+            if incremental:
+                for name in reversed(header["tables"]):
+                    if name in sections and name not in DatabaseBackup.APPEND_ONLY:
+                        pruned[name] = sections[name].prune()
+            DatabaseRestore._fix_sequences(connection, [tables[name] for name in sections])
+
+        print(f"INFO: Restored {'incremental' if incremental else 'full'} backup of {header['generated_at']} ({sum(s.rows for s in sections.values())} rows)")
+        return {
+            "incremental": incremental,
+            "generated_at": header["generated_at"],
+            "tables": {name: s.rows for name, s in sections.items()},
+            "pruned": {name: n for name, n in pruned.items() if n},
+        }
+
+    @staticmethod
+    def _clear(connection, tables: List):
+        if connection.dialect.name == "postgresql":
+            names = ", ".join(connection.dialect.identifier_preparer.format_table(t) for t in tables)
+            connection.execute(text(f"TRUNCATE {names}"))
+            return
+        for table in reversed(tables):  # children first
+            connection.execute(delete(table))
+
+    @staticmethod
+    def _check_base(connection, table, after: int):
+        last = connection.execute(select(func.max(table.c.id))).scalar() or 0
+        if last < after:
+            raise ValueError(
+                f"Incremental backup continues {table.name} after #{after}, but this database stops at #{last}: restore its base backup first"
+            )
+
+    @staticmethod
+    def _fix_sequences(connection, tables: List):
+        if connection.dialect.name != "postgresql":
+            return  # SQLite hands out max(rowid) + 1 by itself
+        preparer = connection.dialect.identifier_preparer
+        for table in tables:
+            pk = list(table.primary_key.columns)
+            if len(pk) != 1 or pk[0].autoincrement not in (True, "auto") or pk[0].type.python_type is not int:
+                continue
+            # Next id = MAX(id) + 1; setval on a NULL sequence (no serial) is a no-op
+            connection.execute(
+                text(f"SELECT setval(pg_get_serial_sequence(:table, :column), COALESCE(MAX({preparer.quote(pk[0].name)}), 0) + 1, false) FROM {preparer.format_table(table)}"),
+                {"table": preparer.format_table(table), "column": pk[0].name},
+            )
+
+
+class _Section:
+    """
+    Rows of one table being restored, written in batches of DatabaseRestore.BATCH.
+    """
+
+    def __init__(self, connection, table, columns: List[str], upsert: bool):
+        self.connection = connection
+        self.table = table
+        self.columns = columns
+        self.upsert = upsert
+        self.digest = hashlib.sha256()
+        self.rows = 0
+        self.batch: List[dict] = []
+        self.keys = set()  # primary keys seen, for prune()
+        self.pk = [c.name for c in table.primary_key.columns]
+        self.copy = connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2" and not upsert
+        self.parsers = {} if self.copy else {
+            name: parser for name, parser in ((c.name, _Section._parser(c)) for c in table.columns) if parser
+        }
+
+    def add(self, line: bytes):
+        self.digest.update(line)
+        self.rows += 1
+        row = json.loads(line)
+        if self.upsert:
+            self.keys.add(tuple(row[k] for k in self.pk))
+        self.batch.append(row)
+        if len(self.batch) >= DatabaseRestore.BATCH:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        if self.copy:
+            self._copy(self.batch)
+        else:
+            for row in self.batch:
+                for name, parse in self.parsers.items():
+                    if row.get(name) is not None:
+                        row[name] = parse(row[name])
+            self.connection.execute(self._statement(), self.batch)
+        self.batch = []
+
+    def prune(self) -> int:
+        """
+        Deletes the rows that are not in this section. Returns how many.
+        """
+        pk = [self.table.c[k] for k in self.pk]
+        existing = self.connection.execute(select(*pk)).all()
+        gone = [tuple(r) for r in existing if tuple(_Section._plain(v) for v in r) not in self.keys]
+        for start in range(0, len(gone), 500):
+            chunk = gone[start:start + 500]
+            condition = pk[0].in_([r[0] for r in chunk]) if len(pk) == 1 else tuple_(*pk).in_(chunk)
+            self.connection.execute(delete(self.table).where(condition))
+        return len(gone)
+
+    def _statement(self):
+        if not self.upsert:
+            return insert(self.table)
+        dialect = self.connection.dialect.name
+        if dialect not in ("postgresql", "sqlite"):
+            raise ValueError(f"Incremental restore is not supported on {dialect}")
+        stmt = (pg_insert if dialect == "postgresql" else sqlite_insert)(self.table)
+        values = {c: stmt.excluded[c] for c in self.columns if c not in self.pk}
+        if not values:
+            return stmt.on_conflict_do_nothing(index_elements=self.pk)
+        return stmt.on_conflict_do_update(index_elements=self.pk, set_=values)
+
+    def _copy(self, rows: List[dict]):
+        preparer = self.connection.dialect.identifier_preparer
+        buf = io.StringIO()
+        for row in rows:
+            buf.write("\t".join(_Section._copy_value(row.get(c)) for c in self.columns))
+            buf.write("\n")
+        buf.seek(0)
+        columns = ", ".join(preparer.quote(c) for c in self.columns)
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {preparer.format_table(self.table)} ({columns}) FROM STDIN", buf)
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _copy_value(value) -> str:
+        # COPY text format
+        if value is None:
+            return "\\N"
+        if isinstance(value, bool):
+            return "t" if value else "f"
+        return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+    @staticmethod
+    def _parser(column):
+        # JSON has dates as ISO strings; the SQLite driver wants Python objects
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            return None
+        if python_type is datetime:
+            return datetime.fromisoformat
+        if python_type is date:
+            return date.fromisoformat
+        return None
+
+    @staticmethod
+    def _plain(value):
+        return value.isoformat() if isinstance(value, (datetime, date)) else value
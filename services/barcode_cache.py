@@ -0,0 +1,233 @@
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import barcode
+from barcode.errors import BarcodeError
+from barcode.writer import SVGWriter
+
+
+class BarcodeCache:
+    """
+    Content-addressed cache of rendered barcode images.
+    Key = sha256 of (symbology, code, format, writer options), so the same label is only
+    ever rendered once: hot entries live in an in-memory LRU, everything else on disk
+    under `directory/<key>.<png|svg>`. Disk writes go through a temp file + os.replace,
+    so concurrent prints of the same code never see a half-written image.
+
+    Large label runs render on a process pool that lives as long as the app
+    (start_pool / shutdown_pool, from the lifespan); without one they render inline.
+    """
+
+    def __init__(self, directory: str = "static/barcodes", max_entries: int = 512):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lru: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._workers = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    # --- Render pool ---
+
+    def start_pool(self, max_workers: Optional[int] = None):
+        """
+        Creates the shared render pool. Spawned (not forked) workers: forking a process
+        that runs threads and holds DB connections copies locks and sockets mid-use.
+        Workers start on demand, on the first large batch.
+        """
+        if self._pool is None:
+            self._workers = max_workers or min(4, os.cpu_count() or 1)
+            self._pool = ProcessPoolExecutor(max_workers=self._workers, mp_context=get_context("spawn"))
+
+    def shutdown_pool(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    # --- Keys ---
+
+    @staticmethod
+    def resolve_symbology(code: str) -> str:
+        """
+        EAN-13 for 12 digit codes (check digit appended) and 13 digit codes with a
+        valid check digit, Code128 otherwise.
+        """
+        if code.isdigit() and len(code) in (12, 13):
+            try:
+                # python-barcode silently replaces a wrong check digit: compare to catch it
+                if len(code) == 12 or barcode.get("ean13", code).get_fullcode() == code:
+                    return "ean13"
+            except Exception:
+                pass
+        return "code128"
+
+    FORMATS = ("png", "svg")
+    MAX_CODE_LENGTH = 48
+    _CODE128_CHARS = re.compile(r"[ -~]+")  # printable ASCII (Code128 sets A/B)
+
+    @staticmethod
+    def validate(code: str, symbology: str):
+        """
+        Raises ValueError unless the symbology can encode the code. Cheap: run it
+        before rendering anything that comes from a URL.
+        """
+        if not code or len(code) > BarcodeCache.MAX_CODE_LENGTH:
+            raise ValueError(f"Barcode must have 1 to {BarcodeCache.MAX_CODE_LENGTH} characters")
+        if symbology == "ean13":
+            if not (code.isdigit() and len(code) in (12, 13)):
+                raise ValueError("EAN-13 needs 12 or 13 digits")
+        elif not BarcodeCache._CODE128_CHARS.fullmatch(code):
+            raise ValueError("Code128 only encodes printable ASCII")
+
+    @staticmethod
+    def key(symbology: str, code: str, options: Optional[dict] = None, fmt: str = "png") -> str:
+        raw = json.dumps([symbology, code, fmt, options or {}], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def filename(self, symbology: str, code: str, options: Optional[dict] = None, fmt: str = "png") -> str:
+        return f"{self.key(symbology, code, options, fmt)}.{fmt}"
+
+    # --- Lookups ---
+
+    def get_png(self, code: str, symbology: Optional[str] = None, options: Optional[dict] = None) -> bytes:
+        return self.get(code, symbology, options, "png")
+
+    def get(self, code: str, symbology: Optional[str] = None, options: Optional[dict] = None, fmt: str = "png", persist: bool = True) -> bytes:
+        """
+        Image bytes for the code: LRU, then disk, then render (and store). With
+        persist=False a newly rendered image only goes to the bounded LRU.
+        Raises ValueError for a code the symbology cannot encode.
+        """
+        symbology = symbology or self.resolve_symbology(code)
+        key = self.key(symbology, code, options, fmt)
+
+        data = self._lru_get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        path = os.path.join(self.directory, f"{key}.{fmt}")
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            self.hits += 1
+        except FileNotFoundError:
+            data = self.render(symbology, code, options, fmt)
+            if persist:
+                self._atomic_write(path, data)
+            self.misses += 1
+
+        self._lru_put(key, data)
+        return data
+
+    def ensure_file(self, code: str, symbology: Optional[str] = None, options: Optional[dict] = None) -> str:
+        """
+        Makes sure the image is on disk and returns its filename (relative to `directory`).
+        Does no rendering and no reads when the file already exists.
+        """
+        symbology = symbology or self.resolve_symbology(code)
+        name = self.filename(symbology, code, options)
+        if os.path.exists(os.path.join(self.directory, name)):
+            self.hits += 1
+        else:
+            self.get_png(code, symbology, options)
+        return name
+
+    def ensure_files(self, codes: Iterable[str], options: Optional[dict] = None, parallel_threshold: int = 32) -> Dict[str, str]:
+        """
+        Batch version of ensure_file for label runs: returns {code: filename}.
+        Uncached codes are rendered on the shared process pool when there is one (PIL is
+        CPU bound and holds the GIL); small batches render inline, where the round trip
+        to the workers would cost more than it saves.
+        """
+        names = {}
+        todo = []
+        for code in dict.fromkeys(codes):
+            symbology = self.resolve_symbology(code)
+            names[code] = self.filename(symbology, code, options)
+            if os.path.exists(os.path.join(self.directory, names[code])):
+                self.hits += 1
+            else:
+                todo.append((symbology, code, options))
+
+        pool = self._pool
+        if pool is None or len(todo) < parallel_threshold:
+            self._store_rendered(todo, (self.render(*args) for args in todo))
+            return names
+        try:
+            # Results are written from this process, so disk writes stay atomic and in one place
+            rendered = list(pool.map(_render_args, todo, chunksize=max(1, len(todo) // (self._workers * 4))))
+        except BrokenProcessPool:
+            # A worker died (OOM kill...): replace the pool, render this batch inline
+            print("WARNING: Barcode render pool broken, restarting it")
+            if self._pool is pool:
+                self._pool = None
+                self.start_pool(self._workers)
+            rendered = [self.render(*args) for args in todo]
+        self._store_rendered(todo, rendered)
+        return names
+
+    # --- Rendering ---
+
+    @staticmethod
+    def render(symbology: str, code: str, options: Optional[dict] = None, fmt: str = "png") -> bytes:
+        if fmt == "svg":
+            writer = SVGWriter()  # pure Python, no PIL
+        else:
+            from barcode.writer import ImageWriter  # needs Pillow
+            writer = ImageWriter()
+        buf = io.BytesIO()
+        try:
+            barcode.get(symbology, code, writer=writer).write(buf, options or {})
+        except BarcodeError as e:
+            raise ValueError(f"Invalid {symbology} code: {e}")
+        return buf.getvalue()
+
+    def _store_rendered(self, todo: List[Tuple], rendered: Iterable[bytes]):
+        for (symbology, code, options), data in zip(todo, rendered):
+            self._atomic_write(os.path.join(self.directory, self.filename(symbology, code, options)), data)
+            self.misses += 1
+
+    # --- Internals ---
+
+    def _atomic_write(self, path: str, data: bytes):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)  # atomic on POSIX and Windows
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _lru_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._lru.get(key)
+            if data is not None:
+                self._lru.move_to_end(key)
+            return data
+
+    def _lru_put(self, key: str, data: bytes):
+        with self._lock:
+            self._lru[key] = data
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+
+def _render_args(args: Tuple) -> bytes:
+    # Module-level so it can be pickled into pool workers
+    return BarcodeCache.render(*args)
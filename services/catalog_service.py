@@ -0,0 +1,236 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import create_engine, delete, event, func, insert, update, and_, or_
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from database.models import Product, CatalogSequence, CatalogVersionLease, ProductTombstone
+from services.dashboard_metrics import DashboardMetrics
+
+
+class CatalogService:
+    """
+    Row versioning for the product catalog, so POS/picking clients can keep a
+    local cache and only pull what changed (GET /api/products/changes).
+    """
+
+    SEQUENCE_ID = 1
+    # Dialects where versions are leased in a short transaction of their own (see next_version)
+    LEASED_DIALECTS = ("postgresql",)
+    # A lease older than this belongs to a dead process and no longer holds back current_version
+    LEASE_TTL = timedelta(minutes=10)
+
+    @staticmethod
+    def ensure_sequence(session: Session):
+        if not session.get(CatalogSequence, CatalogService.SEQUENCE_ID):
+            session.add(CatalogSequence(id=CatalogService.SEQUENCE_ID, value=0))
+            session.commit()
+
+    @staticmethod
+    def current_version(session: Session) -> int:
+        """
+        Highest version whose changes are all committed: with leases, one below the
+        oldest version still in flight.
+        """
+        if not CatalogService._leased(session):
+            seq = session.get(CatalogSequence, CatalogService.SEQUENCE_ID)
+            return seq.value if seq else 0
+        # One statement, so the counter and the leases come from the same snapshot
+        in_flight = (
+            select(func.min(CatalogVersionLease.version))
+            .where(CatalogVersionLease.created_at > datetime.utcnow() - CatalogService.LEASE_TTL)
+            .scalar_subquery()
+        )
+        row = session.exec(
+            select(CatalogSequence.value, in_flight).where(CatalogSequence.id == CatalogService.SEQUENCE_ID)
+        ).first()
+        if row is None:
+            return 0
+        value, oldest = row
+        return min(value, oldest - 1) if oldest is not None else value
+
+    @staticmethod
+    def next_version(session: Session) -> int:
+        """
+        Returns a fresh catalog version for the changes in the current transaction.
+
+        Postgres: the counter is bumped in a short transaction of its own (on a separate
+        small pool, see _lease_engine), which also records a lease for the version. The
+        lease is deleted once the caller's outer transaction has ended, committed or not
+        (savepoints rolled back in between don't matter), so current_version never moves
+        past changes still in flight. The counter row is never locked for the length of
+        a sale. One version per transaction.
+
+        SQLite (single writer anyway): the counter is bumped inside the current
+        transaction and stays locked until commit, so call it as late as possible.
+        """
+        # Every product write (create, edit, delete, sale, compaction) goes through here
+        DashboardMetrics.mark_stale(session)
+        if CatalogService._leased(session):
+            lease = session.info.get(_LEASE_KEY)
+            if lease is None:
+                session.connection()  # begin the transaction whose end releases the lease
+                engine = CatalogService._lease_engine(session.get_bind().engine)
+                lease = session.info[_LEASE_KEY] = (engine, CatalogService._lease(engine))
+            return lease[1]
+
+        result = session.execute(
+            update(CatalogSequence)
+            .where(CatalogSequence.id == CatalogService.SEQUENCE_ID)
+            .values(value=CatalogSequence.value + 1)
+        )
+        if result.rowcount == 0:
+            session.add(CatalogSequence(id=CatalogService.SEQUENCE_ID, value=1))
+            session.flush()
+            return 1
+        return session.exec(
+            select(CatalogSequence.value).where(CatalogSequence.id == CatalogService.SEQUENCE_ID)
+        ).one()
+
+    @staticmethod
+    def _leased(session: Session) -> bool:
+        return session.get_bind().dialect.name in CatalogService.LEASED_DIALECTS
+
+    @staticmethod
+    def _lease_engine(engine) -> Engine:
+        # Its own small pool: a writer that already holds a connection from the app pool
+        # (and product row locks) must never wait on that same pool for its lease
+        key = engine.url.render_as_string(hide_password=False)
+        with _lease_engines_lock:
+            lease_engine = _lease_engines.get(key)
+            if lease_engine is None:
+                lease_engine = _lease_engines[key] = create_engine(engine.url, pool_size=2, max_overflow=2, pool_pre_ping=True)
+            return lease_engine
+
+    @staticmethod
+    def _lease(engine) -> int:
+        sequence, leases = CatalogSequence.__table__, CatalogVersionLease.__table__
+        now = datetime.utcnow()
+        with engine.begin() as connection:
+            version = connection.execute(
+                update(sequence)
+                .where(sequence.c.id == CatalogService.SEQUENCE_ID)
+                .values(value=sequence.c.value + 1)
+                .returning(sequence.c.value)
+            ).scalar()
+            if version is None:
+                version = 1
+                connection.execute(insert(sequence).values(id=CatalogService.SEQUENCE_ID, value=version))
+            connection.execute(delete(leases).where(leases.c.created_at < now - CatalogService.LEASE_TTL))
+            connection.execute(insert(leases).values(version=version, created_at=now))
+        return version
+
+    @staticmethod
+    def _release(engine, version: int):
+        # After commit the changes are visible; after rollback the version is simply skipped
+        with engine.begin() as connection:
+            table = CatalogVersionLease.__table__
+            connection.execute(delete(table).where(table.c.version == version))
+
+    @staticmethod
+    def touch_products(session: Session, product_ids: Iterable[int]) -> Optional[int]:
+        """
+        Stamps the given products with a fresh version. All products changed in the
+        same transaction share one version. New rows must be flushed first. Does not commit.
+        """
+        ids = sorted({pid for pid in product_ids if pid is not None})
+        if not ids:
+            return None
+        session.flush()  # pending ORM changes go out before the Core UPDATE
+        version = CatalogService.next_version(session)
+        session.execute(
+            update(Product)
+            .where(Product.id.in_(ids))
+            .values(version=version, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        # Keep loaded instances in sync with the Core UPDATE
+        for obj in session.identity_map.values():
+            if isinstance(obj, Product) and obj.id in ids:
+                session.expire(obj, ["version", "updated_at"])
+        return version
+
+    @staticmethod
+    def record_deletion(session: Session, product_id: int) -> int:
+        """
+        Leaves a tombstone for a deleted product. Does not commit.
+        """
+        version = CatalogService.next_version(session)
+        session.add(ProductTombstone(product_id=product_id, version=version))
+        return version
+
+    @staticmethod
+    def changes_since(session: Session, since: Optional[int] = None, after_id: int = 0, limit: int = 500) -> dict:
+        """
+        Products with version > since (all products when since is None), paged by (version, id).
+        When has_more is true, call again with since=version and after_id=after_id.
+        stock_quantity is available stock, as on every other screen.
+        Versions above current_version() are left for a later call: an older version
+        may still be in flight, and the client would skip it.
+        """
+        current = CatalogService.current_version(session)
+
+        stmt = select(Product).where(Product.version <= current)
+        if since is not None and after_id:
+            # Resuming a page inside version `since`
+            stmt = stmt.where(or_(
+                Product.version > since,
+                and_(Product.version == since, Product.id > after_id),
+            ))
+        elif since is not None:
+            stmt = stmt.where(Product.version > since)
+        stmt = stmt.order_by(Product.version, Product.id).limit(limit + 1)
+        products = session.exec(stmt).all()
+
+        has_more = len(products) > limit
+        products = products[:limit]
+        # Imported here: stock_ledger -> catalog_service
+        from services.stock_ledger import StockLedger
+        StockLedger.show_available(session, products)
+
+        deleted = []
+        if since is not None:
+            tombstones = session.exec(
+                select(ProductTombstone)
+                .where(ProductTombstone.version > since, ProductTombstone.version <= current)
+                .order_by(ProductTombstone.version)
+            ).all()
+            deleted = [{"id": t.product_id, "version": t.version} for t in tombstones]
+
+        if has_more:
+            next_version, next_after_id = products[-1].version, products[-1].id
+        else:
+            next_version, next_after_id = max(current, since or 0), 0
+
+        return {
+            "products": products,
+            "deleted": deleted,
+            "version": next_version,
+            "after_id": next_after_id,
+            "has_more": has_more,
+        }
+
+
+# --- Session hooks: leases end with the outer transaction that took them ---
+
+_LEASE_KEY = "catalog_version_lease"
+_lease_engines: Dict[str, Engine] = {}
+_lease_engines_lock = threading.Lock()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _release_lease(session, transaction):
+    # Outer transaction only: a rolled-back savepoint must not release the lease while
+    # the rest of the transaction may still commit with its version
+    if transaction.parent is not None:
+        return
+    lease = session.info.pop(_LEASE_KEY, None)
+    if lease is None:
+        return
+    try:
+        CatalogService._release(*lease)
+    except Exception as e:
+        # Left behind, it holds current_version back until LEASE_TTL
+        print(f"WARNING: Catalog version lease {lease[1]} not released: {e}")
@@ -0,0 +1,99 @@
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from database.models import Client
+from services.spreadsheet import CHUNK_ROWS, as_text, find_column, fold, read_chunks
+
+
+class ClientImporter:
+    """
+    Spreadsheet client import, set-based: existing names and CUITs are loaded once into a
+    normalized index (case and accent folded; CUIT digits only), the incoming rows are
+    deduplicated with vectorized pandas, and new clients are bulk-inserted in chunks.
+    A row is skipped when its name or its CUIT already exists (in the DB or earlier in the file).
+    """
+
+    INSERT_CHUNK = 1000
+    # Client field -> accepted headers (matched ignoring case, accents and spaces)
+    COLUMNS = {
+        "name": ("Name", "Nombre"),
+        "phone": ("Phone", "Telefono"),
+        "email": ("Email", "Mail"),
+        "address": ("Address", "Direccion"),
+        "cuit": ("CUIT",),
+        "razon_social": ("RazonSocial",),
+        "iva_category": ("IvaCategory", "IVA", "CondicionIVA"),
+        "transport_name": ("TransportName", "Transporte"),
+        "transport_address": ("TransportAddress", "DireccionTransporte"),
+    }
+
+    @staticmethod
+    def run(session: Session, source, user_id: int, chunk_size: int = CHUNK_ROWS, progress: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Imports chunk by chunk, committing after each one; progress(chunk_result) runs
+        just before each commit. Returns {"added", "skipped", "errors"}.
+        """
+        index = ClientImporter.load_index(session)
+        added = skipped = 0
+        errors: List[str] = []
+        for df in read_chunks(source, chunk_size):
+            result = ClientImporter.import_chunk(session, df, index)
+            if progress:
+                progress(result)
+            session.commit()
+            added += result["added"]
+            skipped += result["skipped"]
+            errors += result["errors"]
+        print(f"INFO: Client import: {added} added, {skipped} skipped as duplicates")
+        return {"added": added, "skipped": skipped, "errors": errors}
+
+    @staticmethod
+    def load_index(session: Session) -> Dict[str, Set[str]]:
+        """
+        {"names": folded names, "cuits": CUIT digits} of every existing client, one query.
+        """
+        import pandas as pd
+
+        rows = session.exec(select(Client.name, Client.cuit).execution_options(yield_per=10000)).all()
+        existing = pd.DataFrame(rows, columns=["name", "cuit"], dtype="string")
+        return {
+            "names": set(fold(existing["name"]).dropna()),
+            "cuits": set(ClientImporter.cuit_digits(existing["cuit"]).dropna()),
+        }
+
+    @staticmethod
+    def import_chunk(session: Session, df, index: Optional[Dict[str, Set[str]]] = None) -> dict:
+        """
+        Does not commit. Adds the inserted keys to `index`.
+        Returns {"rows", "added", "updated", "skipped", "errors"}.
+        """
+        import pandas as pd
+
+        index = index if index is not None else ClientImporter.load_index(session)
+        frame = pd.DataFrame({field: as_text(find_column(df, aliases)) for field, aliases in ClientImporter.COLUMNS.items()}, index=df.index)
+        frame = frame[frame["name"].notna()]
+
+        names = fold(frame["name"])
+        cuits = ClientImporter.cuit_digits(frame["cuit"])
+        duplicate = (
+            names.isin(index["names"]) | names.duplicated()
+            | (cuits.notna() & (cuits.isin(index["cuits"]) | cuits.duplicated()))
+        )
+        new = frame[~duplicate]
+        rows = new.astype(object).where(new.notna(), None).to_dict("records")
+
+        table = Client.__table__
+        for start in range(0, len(rows), ClientImporter.INSERT_CHUNK):
+            session.execute(insert(table), rows[start:start + ClientImporter.INSERT_CHUNK])
+        index["names"].update(names[~duplicate])
+        index["cuits"].update(cuits[~duplicate].dropna())
+
+        return {"rows": len(df), "added": len(rows), "updated": 0, "skipped": int(duplicate.sum()), "errors": []}
+
+    @staticmethod
+    def cuit_digits(values):
+        # "20-12345678-9", "20 12345678 9" and 20123456789 are the same CUIT
+        digits = values.astype("string").str.replace(r"\D", "", regex=True)
+        return digits.mask(digits == "")
@@ -0,0 +1,82 @@
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import case, func, literal, union_all, update
+from sqlmodel import Session, select
+
+from database.models import Client, Payment, Sale
+
+
+class ClientLedger:
+    """
+    Current-account balances. Client.balance (sales - payments) is updated in the same
+    transaction as the sale or payment that changes it, with an atomic
+    `balance = balance + delta`, so listing clients never has to aggregate history.
+    """
+
+    @staticmethod
+    def apply(session: Session, client_id: Optional[int], delta: float):
+        """
+        Adds delta to the client's balance (positive = debt). Does not commit.
+        """
+        if not client_id or not delta:
+            return
+        session.execute(
+            update(Client)
+            .where(Client.id == client_id)
+            .values(balance=Client.balance + delta)
+            .execution_options(synchronize_session=False)
+        )
+        client = session.identity_map.get(session.identity_key(Client, client_id))
+        if client is not None:
+            session.expire(client, ["balance"])
+
+    @staticmethod
+    def register_payment(session: Session, client_id: int, amount: float, note: Optional[str] = None) -> Payment:
+        """
+        Records a payment and lowers the balance. Does not commit.
+        """
+        payment = Payment(client_id=client_id, amount=amount, note=note)
+        session.add(payment)
+        ClientLedger.apply(session, client_id, -amount)
+        return payment
+
+    @staticmethod
+    def computed_balances(session: Session, client_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+        """
+        Balances recomputed from history in one grouped query: {client_id: sales - payments}.
+        """
+        sales = select(Sale.client_id.label("client_id"), Sale.total_amount.label("amount")).where(Sale.client_id.is_not(None))
+        payments = select(Payment.client_id.label("client_id"), (-Payment.amount).label("amount"))
+        if client_ids is not None:
+            ids = list(client_ids)
+            sales = sales.where(Sale.client_id.in_(ids))
+            payments = payments.where(Payment.client_id.in_(ids))
+        movements = union_all(sales, payments).subquery()
+        rows = session.exec(
+            select(movements.c.client_id, func.sum(movements.c.amount)).group_by(movements.c.client_id)
+        ).all()
+        return {client_id: float(total or 0.0) for client_id, total in rows}
+
+    @staticmethod
+    def verify(session: Session, fix: bool = False, tolerance: float = 0.005) -> List[dict]:
+        """
+        Compares every maintained balance against history. With fix=True the drifted
+        balances are rewritten (one UPDATE) and committed.
+        """
+        computed = ClientLedger.computed_balances(session)
+        drifts = []
+        for client_id, balance in session.exec(select(Client.id, Client.balance)).all():
+            expected = round(computed.get(client_id, 0.0), 2)
+            if abs((balance or 0.0) - expected) > tolerance:
+                drifts.append({"client_id": client_id, "balance": balance, "expected": expected})
+
+        if fix and drifts:
+            fixed = {d["client_id"]: d["expected"] for d in drifts}
+            session.execute(
+                update(Client)
+                .where(Client.id.in_(list(fixed)))
+                .values(balance=case(fixed, value=Client.id, else_=literal(0.0)))
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+        return drifts
@@ -0,0 +1,231 @@
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Optional
+
+from sqlalchemy import Float, Integer, String, and_, func, literal, or_, union_all
+from sqlmodel import Session, select
+
+from database.models import Client, Payment, Sale
+from services.pdf_stream import MM, PdfStreamWriter
+
+
+class ClientStatement:
+    """
+    Current-account statement: sales (debit) and payments (credit) merged by one
+    UNION ALL query, with the running balance computed by a window function over the
+    client's whole history, so any page or date range shows the true balance per row.
+    """
+
+    KIND_SALE = 0
+    KIND_PAYMENT = 1  # same timestamp: the sale goes first (immediate payment in POS)
+    PAGE_SIZE = 50
+
+    # --- Query ---
+
+    @staticmethod
+    def _ledger(client_id: int):
+        sales = select(
+            literal(ClientStatement.KIND_SALE, Integer).label("kind"),
+            Sale.id.label("ref_id"),
+            Sale.timestamp.label("date"),
+            Sale.total_amount.label("debit"),
+            literal(0.0, Float).label("credit"),
+            literal(None, String).label("note"),
+        ).where(Sale.client_id == client_id)
+        payments = select(
+            literal(ClientStatement.KIND_PAYMENT, Integer),
+            Payment.id,
+            Payment.date,
+            literal(0.0, Float),
+            Payment.amount,
+            Payment.note,
+        ).where(Payment.client_id == client_id)
+        movements = union_all(sales, payments).subquery("movements")
+
+        balance = func.sum(movements.c.debit - movements.c.credit).over(
+            order_by=(movements.c.date, movements.c.kind, movements.c.ref_id),
+            rows=(None, 0),
+        )
+        return select(movements, balance.label("balance")).subquery("ledger")
+
+    @staticmethod
+    def _filtered(client_id: int, date_from: Optional[date], date_to: Optional[date]):
+        ledger = ClientStatement._ledger(client_id)
+        stmt = select(*ledger.c)
+        # Filters apply after the window, so balances still include earlier history
+        if date_from:
+            stmt = stmt.where(ledger.c.date >= datetime.combine(date_from, datetime.min.time()))
+        if date_to:
+            stmt = stmt.where(ledger.c.date < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+        return ledger, stmt
+
+    @staticmethod
+    def _row(r) -> dict:
+        if r.kind == ClientStatement.KIND_SALE:
+            description = f"Venta #{r.ref_id}"
+        else:
+            description = f"Abono: {r.note or ''}"
+        return {
+            "type": "sale" if r.kind == ClientStatement.KIND_SALE else "payment",
+            "id": r.ref_id,
+            "date": r.date,
+            "description": description,
+            "debit": round(r.debit or 0.0, 2),
+            "credit": round(r.credit or 0.0, 2),
+            "balance": round(r.balance or 0.0, 2),
+        }
+
+    # --- Cursor helpers ---
+
+    @staticmethod
+    def encode_cursor(row: dict) -> str:
+        kind = ClientStatement.KIND_SALE if row["type"] == "sale" else ClientStatement.KIND_PAYMENT
+        raw = json.dumps([row["date"].isoformat(), kind, row["id"]]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        try:
+            when, kind, ref_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(when), int(kind), int(ref_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    # --- Reading ---
+
+    @staticmethod
+    def page(session: Session, client_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None, cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> dict:
+        """
+        Newest first, keyset-paged by (date, kind, id). Returns {"items", "next_cursor"}.
+        """
+        ledger, stmt = ClientStatement._filtered(client_id, date_from, date_to)
+        if cursor:
+            c_date, c_kind, c_id = ClientStatement.decode_cursor(cursor)
+            stmt = stmt.where(or_(
+                ledger.c.date < c_date,
+                and_(ledger.c.date == c_date, ledger.c.kind < c_kind),
+                and_(ledger.c.date == c_date, ledger.c.kind == c_kind, ledger.c.ref_id < c_id),
+            ))
+        stmt = stmt.order_by(ledger.c.date.desc(), ledger.c.kind.desc(), ledger.c.ref_id.desc()).limit(limit + 1)
+        rows = [ClientStatement._row(r) for r in session.exec(stmt).all()]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = ClientStatement.encode_cursor(rows[-1])
+        return {"items": rows, "next_cursor": next_cursor}
+
+    @staticmethod
+    def iter_rows(session: Session, client_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None, batch_size: int = 1000) -> Iterator[dict]:
+        """
+        Chronological rows for exports, fetched in batches of `batch_size`.
+        """
+        ledger, stmt = ClientStatement._filtered(client_id, date_from, date_to)
+        stmt = stmt.order_by(ledger.c.date, ledger.c.kind, ledger.c.ref_id).execution_options(yield_per=batch_size)
+        for r in session.exec(stmt):
+            yield ClientStatement._row(r)
+
+    # --- Exports ---
+
+    @staticmethod
+    def stream_csv(engine, client_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None) -> Iterator[str]:
+        # Own session: the request's session is closed before a streaming body runs
+        with Session(engine) as session:
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(["Fecha", "Descripción", "Debe", "Haber", "Saldo"])
+            for i, row in enumerate(ClientStatement.iter_rows(session, client_id, date_from, date_to), start=1):
+                writer.writerow([row["date"].strftime("%Y-%m-%d %H:%M"), row["description"], row["debit"] or "", row["credit"] or "", row["balance"]])
+                if i % 500 == 0:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            yield buf.getvalue()
+
+    @staticmethod
+    def stream_pdf(engine, client_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None) -> Iterator[bytes]:
+        with Session(engine) as session:
+            client = session.get(Client, client_id)
+            rows = ClientStatement.iter_rows(session, client_id, date_from, date_to)
+            yield from StatementPdfWriter(client.name if client else "", date_from, date_to).stream(rows)
+
+
+class StatementPdfWriter(PdfStreamWriter):
+    """
+    A4 statement, one table row per movement; each page is written as soon as it fills.
+    """
+
+    PAGE_WIDTH = 210 * MM
+    PAGE_HEIGHT = 297 * MM
+    MARGIN = 15 * MM
+    ROW_HEIGHT = 14
+    FONT_SIZE = 9
+    # Column x positions (left edge for text, right edge for amounts)
+    COL_DATE, COL_DESC = MARGIN, MARGIN + 80
+    COL_DEBIT, COL_CREDIT, COL_BALANCE = PAGE_WIDTH - MARGIN - 150, PAGE_WIDTH - MARGIN - 75, PAGE_WIDTH - MARGIN
+
+    def __init__(self, client_name: str, date_from: Optional[date] = None, date_to: Optional[date] = None):
+        self.client_name = client_name
+        self.period = f"{date_from or 'inicio'} a {date_to or 'hoy'}"
+
+    def stream(self, rows: Iterator[dict]) -> Iterator[bytes]:
+        self._begin()
+        self._resources = b"<< /Font << /F1 %d 0 R /F2 %d 0 R >> >>" % (self.font, self.bold)
+        per_page = int((self.PAGE_HEIGHT - 2 * self.MARGIN - 60) // self.ROW_HEIGHT)
+
+        page_rows: List[dict] = []
+        page_no = 0
+        for row in rows:
+            page_rows.append(row)
+            if len(page_rows) == per_page:
+                page_no += 1
+                self._write_page(page_rows, page_no)
+                page_rows = []
+                if self._should_flush():
+                    yield self._drain()
+        if page_rows or page_no == 0:
+            self._write_page(page_rows, page_no + 1)
+        yield self._finish()
+
+    def _write_page(self, rows: List[dict], page_no: int):
+        top = self.PAGE_HEIGHT - self.MARGIN
+        ops = [
+            self._text(self.MARGIN, top, f"Estado de Cuenta - {self.client_name}", 13, bold=True),
+            self._text(self.MARGIN, top - 16, f"Período: {self.period}", 9),
+            self._text_right(self.COL_BALANCE, top - 16, f"Página {page_no}", 9),
+        ]
+        y = top - 44
+        ops += [
+            self._text(self.COL_DATE, y, "Fecha", self.FONT_SIZE, bold=True),
+            self._text(self.COL_DESC, y, "Descripción", self.FONT_SIZE, bold=True),
+            self._text_right(self.COL_DEBIT, y, "Debe", self.FONT_SIZE, bold=True),
+            self._text_right(self.COL_CREDIT, y, "Haber", self.FONT_SIZE, bold=True),
+            self._text_right(self.COL_BALANCE, y, "Saldo", self.FONT_SIZE, bold=True),
+            f"{self.MARGIN:.2f} {y - 4:.2f} m {self.COL_BALANCE:.2f} {y - 4:.2f} l S",
+        ]
+        for row in rows:
+            y -= self.ROW_HEIGHT
+            description = self._fit(row["description"], self.FONT_SIZE, self.COL_DEBIT - self.COL_DESC - 60)
+            ops += [
+                self._text(self.COL_DATE, y, row["date"].strftime("%Y-%m-%d %H:%M"), self.FONT_SIZE),
+                self._text(self.COL_DESC, y, description, self.FONT_SIZE),
+                self._text_right(self.COL_DEBIT, y, f"${row['debit']:.2f}" if row["debit"] else "", self.FONT_SIZE),
+                self._text_right(self.COL_CREDIT, y, f"${row['credit']:.2f}" if row["credit"] else "", self.FONT_SIZE),
+                self._text_right(self.COL_BALANCE, y, f"${row['balance']:.2f}", self.FONT_SIZE),
+            ]
+        if not rows and page_no == 1:
+            ops.append(self._text(self.MARGIN, y - self.ROW_HEIGHT, "Sin movimientos registrados.", self.FONT_SIZE))
+
+        content = self._add_stream(b"<<", "\n".join(op for op in ops if op).encode("cp1252", "replace"))
+        self._add_page(self.PAGE_WIDTH, self.PAGE_HEIGHT, content, self._resources)
+
+    def _text(self, x: float, y: float, text: str, size: float, bold: bool = False) -> str:
+        if not text:
+            return ""
+        return f"BT /{'F2' if bold else 'F1'} {size} Tf {x:.2f} {y:.2f} Td ({self._escape(text)}) Tj ET"
+
+    def _text_right(self, right: float, y: float, text: str, size: float, bold: bool = False) -> str:
+        return self._text(right - self._text_width(text, size), y, text, size, bold)
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlmodel import Session, func, select
+
+from database.models import Product, Sale, SalesDailyRollup
+
+
+class DashboardMetrics:
+    """
+    Home-page figures (product count, low stock, today's sales, recent sales) cached
+    for `ttl` seconds and shared by every terminal. Code paths that change them mark
+    the session with mark_stale(); the cache is dropped only once that session commits.
+    """
+
+    RECENT_SALES = 5
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value: Optional[dict] = None
+        self._expires = 0.0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session: Session) -> dict:
+        with self._lock:
+            if self._value is not None and time.monotonic() < self._expires:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            generation = self._generation
+
+        value = self._compute(session)
+        with self._lock:
+            # An invalidation while computing means the figures may predate that commit
+            if generation == self._generation:
+                self._value = value
+                self._expires = time.monotonic() + self.ttl
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._value = None
+
+    @staticmethod
+    def mark_stale(session: Session):
+        """
+        Drop the cached figures after this session's next successful commit.
+        """
+        session.info[_STALE_KEY] = True
+
+    def _compute(self, session: Session) -> dict:
+        # Imported here: stock_ledger -> catalog_service -> this module
+        from services.sales_rollup import SalesRollup
+        from services.stock_ledger import StockLedger
+
+        total_products = session.exec(select(func.count(Product.id))).one()
+        # Available stock (snapshot + pending receipts), like POS and picking show it
+        low_stock = session.exec(
+            select(func.count(Product.id))
+            .where(StockLedger.available_expression() < Product.min_stock_level)
+        ).one()
+        # Today in the store timezone, from the daily rollup instead of scanning sales
+        today_sales_total = session.exec(
+            select(func.sum(SalesDailyRollup.total))
+            .where(SalesDailyRollup.day == SalesRollup.store_day(datetime.now()))
+        ).one() or 0.0
+        recent_sales = session.exec(
+            select(Sale.id, Sale.timestamp, Sale.total_amount, Sale.payment_method)
+            .order_by(Sale.timestamp.desc(), Sale.id.desc())
+            .limit(self.RECENT_SALES)
+        ).all()
+
+        return {
+            "total_products": total_products,
+            "low_stock": low_stock,
+            "today_sales_total": round(today_sales_total, 2),
+            "recent_sales": [
+                {"id": s.id, "timestamp": s.timestamp, "total_amount": s.total_amount, "payment_method": s.payment_method}
+                for s in recent_sales
+            ],
+        }
+
+
+dashboard_metrics = DashboardMetrics(ttl=float(os.getenv("DASHBOARD_METRICS_TTL", "30")))
+
+
+# --- Session hooks: invalidate only for changes that actually committed ---
+
+_STALE_KEY = "dashboard_metrics_stale"
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop(_STALE_KEY, None):
+        dashboard_metrics.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_STALE_KEY, None)
@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import BinaryIO, Callable, Dict, Optional
+
+from sqlalchemy import or_, update
+from sqlmodel import Session
+
+from database.models import ImportJob
+from services.spreadsheet import count_rows
+
+
+class ImportJobRunner:
+    """
+    Background spreadsheet imports. The upload is written to disk and a job row is
+    queued; a worker thread then runs the importer, which commits chunk by chunk and
+    reports progress into the job row in the same transaction as each chunk.
+    Request handlers return immediately; clients poll GET /api/jobs/{id}.
+
+    Every job row names the runner that owns it, and the runner refreshes the
+    heartbeat of its unfinished jobs every HEARTBEAT_INTERVAL. Recovery only fails
+    jobs whose heartbeat is older than STALE_AFTER, so a rolling deploy never
+    fails jobs that another live worker is still running.
+
+    handlers: {kind: importer.run(session, path, user_id, progress=...)}; a "timing"
+    dict in the importer's result is kept on the job.
+    """
+
+    EXTENSIONS = (".xlsx", ".csv")
+    MAX_ERRORS = 200  # kept on the job row; error_count has the full total
+    COPY_BUFFER = 1024 * 1024
+    HEARTBEAT_INTERVAL = 15.0  # seconds
+    STALE_AFTER = timedelta(minutes=2)
+
+    def __init__(self, engine, upload_dir: str, handlers: Dict[str, Callable], max_workers: int = 1):
+        self.engine = engine
+        self.upload_dir = upload_dir
+        self.handlers = handlers
+        # Unique per process (and per runner), even when pids repeat across containers
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="import-job")
+        self._stop_heartbeat: Optional[threading.Event] = None
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+    def submit(self, session: Session, kind: str, fileobj: BinaryIO, filename: str, user_id: int) -> ImportJob:
+        """
+        Saves the upload and queues it. Raises ValueError for an unknown kind or file type.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown import: {kind}")
+        ext = os.path.splitext(filename or "")[1].lower()
+        if ext not in self.EXTENSIONS:
+            raise ValueError(f"Unsupported file type '{ext}' (use .xlsx or .csv)")
+
+        path = os.path.join(self.upload_dir, f"{uuid.uuid4().hex}{ext}")
+        with open(path, "wb") as out:
+            shutil.copyfileobj(fileobj, out, self.COPY_BUFFER)
+        try:
+            total = count_rows(path)
+        except Exception as e:
+            os.remove(path)
+            raise ValueError(f"Unreadable file: {e}")
+
+        job = ImportJob(
+            kind=kind, filename=filename, path=path, total_rows=total, user_id=user_id,
+            owner=self.owner, heartbeat_at=datetime.utcnow(),
+        )
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+        self._executor.submit(self._run, job.id)
+        return job
+
+    def recover(self) -> int:
+        """
+        Jobs whose owner stopped beating (crashed or restarted process) can't be
+        resumed: mark them failed. Runs at startup and with every heartbeat; a single
+        conditional UPDATE, so runners recovering at the same time never collide.
+        """
+        now = datetime.utcnow()
+        job = ImportJob.__table__
+        with Session(self.engine) as session:
+            stale = session.execute(
+                update(job)
+                .where(
+                    job.c.status.in_(["queued", "running"]),
+                    or_(job.c.heartbeat_at.is_(None), job.c.heartbeat_at < now - self.STALE_AFTER),
+                )
+                .values(
+                    status="failed",
+                    message="Interrupted by a server restart; upload the file again",
+                    finished_at=now,
+                )
+                .returning(job.c.id, job.c.path)
+            ).all()
+            session.commit()
+        for _, path in stale:
+            self._remove(path)  # only exists if the owner ran on this host
+        if stale:
+            print(f"WARNING: Marked {len(stale)} interrupted import job(s) as failed")
+        return len(stale)
+
+    def heartbeat(self):
+        """
+        Refreshes the heartbeat of this runner's unfinished jobs (queued ones included).
+        """
+        job = ImportJob.__table__
+        with Session(self.engine) as session:
+            session.execute(
+                update(job)
+                .where(job.c.owner == self.owner, job.c.status.in_(["queued", "running"]))
+                .values(heartbeat_at=datetime.utcnow())
+            )
+            session.commit()
+
+    def start_heartbeat(self, interval: Optional[float] = None):
+        """
+        Beats (and recovers other runners' stale jobs) every `interval` seconds in a
+        daemon thread until shutdown().
+        """
+        if self._stop_heartbeat is not None:
+            return
+        stop = self._stop_heartbeat = threading.Event()
+        interval = interval or self.HEARTBEAT_INTERVAL
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.heartbeat()
+                    self.recover()
+                except Exception as e:
+                    print(f"WARNING: Import job heartbeat failed: {e}")
+
+        threading.Thread(target=loop, name="import-job-heartbeat", daemon=True).start()
+
+    def shutdown(self, wait: bool = False):
+        if self._stop_heartbeat is not None:
+            self._stop_heartbeat.set()
+            self._stop_heartbeat = None
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    @staticmethod
+    def to_dict(job: ImportJob) -> dict:
+        percent = None
+        if job.status == "done":
+            percent = 100
+        elif job.total_rows:
+            percent = min(99, int(job.processed_rows * 100 / job.total_rows))
+        return {
+            "id": job.id,
+            "kind": job.kind,
+            "filename": job.filename,
+            "status": job.status,
+            "total_rows": job.total_rows,
+            "processed_rows": job.processed_rows,
+            "percent": percent,
+            "added": job.added,
+            "updated": job.updated,
+            "error_count": job.error_count,
+            "errors": json.loads(job.errors),
+            "message": job.message,
+            "timing": json.loads(job.timing) if job.timing else None,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+
+    # --- Worker ---
+
+    def _run(self, job_id: int):
+        with Session(self.engine) as session:
+            job = session.get(ImportJob, job_id)
+            if job.status != "queued":
+                return  # failed by recovery while waiting (heartbeat lost)
+            job.status = "running"
+            job.started_at = job.heartbeat_at = datetime.utcnow()
+            session.add(job)
+            session.commit()
+            errors = []
+
+            def progress(result: dict):
+                job.processed_rows += result["rows"]
+                job.added += result["added"]
+                job.updated += result.get("updated", 0)
+                job.error_count += len(result["errors"])
+                if len(errors) < self.MAX_ERRORS:
+                    errors.extend(result["errors"][:self.MAX_ERRORS - len(errors)])
+                    job.errors = json.dumps(errors)
+                job.heartbeat_at = datetime.utcnow()
+                session.add(job)
+
+            try:
+                result = self.handlers[job.kind](session, job.path, job.user_id, progress=progress)
+                if isinstance(result, dict) and result.get("timing"):
+                    job.timing = json.dumps(result["timing"])
+                job.status = "done"
+            except Exception as e:
+                # Chunks committed so far stay imported; the job says where it stopped
+                session.rollback()
+                print(f"WARNING: Import job {job_id} failed: {e}")
+                job = session.get(ImportJob, job_id)
+                job.status = "failed"
+                job.message = str(e)[:500]
+            job.finished_at = datetime.utcnow()
+            session.add(job)
+            session.commit()
+            self._remove(job.path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,89 @@
+import io
+from typing import Iterable, Iterator, Tuple
+
+from PIL import Image
+
+from services.barcode_cache import BarcodeCache
+from services.pdf_stream import MM, PdfStreamWriter
+
+
+class LabelPdfWriter(PdfStreamWriter):
+    """
+    Streams a PDF of barcode labels, one label per page (Zebra 50x25mm, like print_layout.html).
+
+    Each distinct label is drawn once as a Form XObject with its barcode raster, plus one
+    shared page content stream that stamps it; every copy is then just a small page
+    dictionary pointing at them, so memory stays flat however many copies are printed.
+    """
+
+    PAGE_WIDTH = 50 * MM
+    PAGE_HEIGHT = 25 * MM
+    # Raster without human-readable text: the PDF draws the code itself
+    RASTER_OPTIONS = {"write_text": False, "module_height": 10.0, "quiet_zone": 2.0}
+    RENDER_CHUNK = 64
+
+    def __init__(self, barcode_cache: BarcodeCache):
+        self.barcode_cache = barcode_cache
+
+    def stream(self, labels: Iterable[Tuple[dict, int]]) -> Iterator[bytes]:
+        """
+        labels: ({"name", "price", "barcode"}, copies) pairs. Yields the PDF in chunks.
+        """
+        self._begin()
+        chunk = []
+        for item in labels:
+            chunk.append(item)
+            if len(chunk) >= self.RENDER_CHUNK:
+                yield from self._write_labels(chunk)
+                chunk = []
+        yield from self._write_labels(chunk)
+        yield self._finish()
+
+    # --- Labels ---
+
+    def _write_labels(self, chunk) -> Iterator[bytes]:
+        if not chunk:
+            return
+        # Missing rasters for this chunk render in one batch (process pool when large)
+        self.barcode_cache.ensure_files([label["barcode"] for label, _ in chunk], options=self.RASTER_OPTIONS)
+        for label, copies in chunk:
+            if copies <= 0:
+                continue
+            png = self.barcode_cache.get_png(label["barcode"], options=self.RASTER_OPTIONS)
+            content, resources = self._draw_label(label, png)
+            for _ in range(copies):
+                self._add_page(self.PAGE_WIDTH, self.PAGE_HEIGHT, content, resources)
+                if self._should_flush():
+                    yield self._drain()
+
+    def _draw_label(self, label: dict, png: bytes) -> Tuple[int, bytes]:
+        """
+        Writes the label once (image + form XObject + stamping stream).
+        Returns the stream object number and the page resources that go with it.
+        """
+        image = Image.open(io.BytesIO(png)).convert("L")
+        img_obj = self._add_stream(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray /BitsPerComponent 8"
+            % image.size,
+            image.tobytes(),
+        )
+
+        w, h = self.PAGE_WIDTH, self.PAGE_HEIGHT
+        bar_w, bar_h = w * 0.8, 12 * MM
+        name = self._fit(label["name"] or "", 8, w - 4)
+        ops = [
+            f"BT /F2 8 Tf {self._center(name, 8, w):.2f} {h - 9:.2f} Td ({self._escape(name)}) Tj ET",
+            f"q {bar_w:.2f} 0 0 {bar_h:.2f} {(w - bar_w) / 2:.2f} {h - 11 - bar_h:.2f} cm /Im Do Q",
+            f"BT /F1 7 Tf {self._center(label['barcode'], 7, w):.2f} {h - 19 - bar_h:.2f} Td ({self._escape(label['barcode'])}) Tj ET",
+        ]
+        price = f"${label['price']}"
+        ops.append(f"BT /F2 9 Tf {self._center(price, 9, w):.2f} 3 Td ({self._escape(price)}) Tj ET")
+        form = self._add_stream(
+            b"<< /Type /XObject /Subtype /Form /BBox [0 0 %.2f %.2f] /Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> /XObject << /Im %d 0 R >> >>"
+            % (w, h, self.font, self.bold, img_obj),
+            "\n".join(ops).encode("cp1252", "replace"),
+        )
+        return self._add_stream(b"<<", b"/L Do"), b"<< /XObject << /L %d 0 R >> >>" % form
+
+    def _center(self, text: str, size: float, width: float) -> float:
+        return max(2.0, (width - self._text_width(text, size)) / 2)
@@ -0,0 +1,132 @@
+import re
+import unicodedata
+from datetime import datetime
+from typing import List, Optional, Set
+
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from database.models import Client, Product
+from services.catalog_service import CatalogService
+from services.mysql_dump import MysqlDump
+from services.stock_ledger import StockLedger
+
+
+class LegacyMigration:
+    """
+    Imports `cliente` and `producto` rows from the old MySQL system's dump
+    (legacy_data/dump.sql). The dump is streamed row by row (MysqlDump); existing client
+    names and barcodes are loaded once into key sets, so duplicates are skipped without
+    a query per row, and new rows are bulk-inserted in batches, committing after each one.
+    """
+
+    BATCH = 2000
+    MAX_ERRORS = 200  # listed in the result; error_count has the full total
+
+    @staticmethod
+    def run(session: Session, source, user_id: Optional[int] = None, batch_size: int = BATCH) -> dict:
+        """
+        Returns {"clients", "products", "skipped", "errors", "error_count"}.
+        Raises ValueError if the dump is malformed (batches committed so far stay imported).
+        """
+        names = {LegacyMigration.name_key(n) for n in session.exec(select(Client.name)) if n}
+        barcodes: Set[str] = set(session.exec(select(Product.barcode)))
+        result = {"clients": 0, "products": 0, "skipped": 0, "errors": [], "error_count": 0}
+        clients: List[dict] = []
+        products: List[dict] = []
+
+        def error(message: str):
+            result["error_count"] += 1
+            if len(result["errors"]) < LegacyMigration.MAX_ERRORS:
+                result["errors"].append(message)
+
+        for table, columns, values in MysqlDump.rows(source, ("cliente", "producto")):
+            row = dict(zip(columns, values))
+            if table == "cliente":
+                name = (row.get("nombre") or "").strip()
+                key = LegacyMigration.name_key(name)
+                if not key or key in names:
+                    result["skipped"] += 1
+                    continue
+                names.add(key)
+                clients.append({"name": name})
+                if len(clients) >= batch_size:
+                    result["clients"] += LegacyMigration._insert_clients(session, clients)
+                    clients = []
+            else:
+                code = (row.get("codigo") or "").strip()
+                if not code:
+                    error(f"Producto {row.get('id')}: sin código")
+                    continue
+                if code in barcodes:
+                    result["skipped"] += 1
+                    continue
+                try:
+                    product = LegacyMigration._product(row, code)
+                except ValueError as e:
+                    error(f"Producto {row.get('id')}: {e}")
+                    continue
+                barcodes.add(code)
+                products.append(product)
+                if len(products) >= batch_size:
+                    result["products"] += LegacyMigration._insert_products(session, products, user_id)
+                    products = []
+
+        result["clients"] += LegacyMigration._insert_clients(session, clients)
+        result["products"] += LegacyMigration._insert_products(session, products, user_id)
+        print(f"INFO: Legacy migration: {result['clients']} clients, {result['products']} products, {result['skipped']} skipped, {result['error_count']} errors")
+        return result
+
+    @staticmethod
+    def name_key(name: str) -> str:
+        # Same comparison as the spreadsheet client import: case, accents and spacing ignored
+        text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+        return re.sub(r"\s+", " ", text.casefold()).strip()
+
+    @staticmethod
+    def _product(row: dict, code: str) -> dict:
+        name = (row.get("nombre") or "").strip()
+        if not name:
+            raise ValueError("sin nombre")
+
+        def number(field, default, kind=float):
+            value = row.get(field)
+            if value is None or value.strip() == "":
+                return default
+            try:
+                return kind(float(value))
+            except ValueError:
+                raise ValueError(f"{field} inválido '{value}'")
+
+        return {
+            "name": name,
+            "barcode": code,
+            "description": (row.get("especificaciones") or "").strip() or None,
+            "cost_price": number("preciocosto", 0.0),
+            "price": number("precioventa", 0.0),
+            "stock_quantity": number("stock", 0, int),
+            "min_stock_level": number("stockMin", 5, int),
+            "updated_at": datetime.utcnow(),
+        }
+
+    @staticmethod
+    def _insert_clients(session: Session, rows: List[dict]) -> int:
+        if rows:
+            session.execute(insert(Client.__table__), rows)
+            session.commit()
+        return len(rows)
+
+    @staticmethod
+    def _insert_products(session: Session, rows: List[dict], user_id: Optional[int]) -> int:
+        if not rows:
+            return 0
+        table = Product.__table__
+        ids = dict(session.execute(insert(table).returning(table.c.id, table.c.stock_quantity), rows).all())
+        # Legacy stock becomes the opening balance in the ledger
+        StockLedger.append(session, [
+            {"product_id": pid, "delta": stock, "reason": "opening", "user_id": user_id, "applied": True}
+            for pid, stock in ids.items() if stock
+        ])
+        CatalogService.touch_products(session, ids)
+        session.commit()
+        return len(rows)
@@ -0,0 +1,140 @@
+import io
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Quoted strings: '' / \' escapes; unrolled so a string cut at the buffer end fails in linear time
+_SINGLE = r"'[^'\\]*(?:(?:\\.|'')[^'\\]*)*'"
+_DOUBLE = r'"[^"\\]*(?:(?:\\.|"")[^"\\]*)*"'
+
+_STATEMENT = re.compile(
+    r"INSERT\s+(?:(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|IGNORE)\s+)*INTO\s+`?(\w+)`?\s*(?:\(([^)]*)\)\s*)?VALUES\s*"
+    r"|CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?(\w+)`?\s*\(",
+    re.I,
+)
+_ROW = re.compile(r"\s*\(((?:[^'\"()]|%s|%s)*)\)\s*([,;])?" % (_SINGLE, _DOUBLE), re.S)
+_VALUE = re.compile(r"%s|%s|[^,\s]+" % (_SINGLE, _DOUBLE), re.S)
+_CREATE_END = re.compile(r"\)(?:[^;()']|'[^']*')*;")
+_CREATE_COLUMN = re.compile(r"^\s*`(\w+)`", re.M)
+_IDENTIFIER = re.compile(r"`?(\w+)`?")
+_ESCAPE = re.compile(r"\\(.)|''|\"\"", re.S)
+_ESCAPES = {"0": "\x00", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+
+class MysqlDump:
+    """
+    Streaming reader for mysqldump / SQLyog dumps. Only INSERT ... VALUES statements
+    are parsed (CREATE TABLE just provides column names for INSERTs without a column
+    list); everything else is skipped. The file is read in blocks and rows are
+    yielded one at a time, so memory stays flat whatever the dump size.
+
+    Values come back as text (numbers are not converted) or None for NULL, with
+    MySQL escapes resolved: quotes, parentheses and commas inside strings are safe.
+    """
+
+    READ_SIZE = 1 << 20
+    MAX_ROW = 64 << 20  # a row (or CREATE TABLE) that doesn't end within this is a broken dump
+
+    @staticmethod
+    def rows(source, tables: Optional[Iterable[str]] = None, encoding: str = "utf-8") -> Iterator[Tuple[str, List[str], list]]:
+        """
+        Yields (table, columns, values) for every row inserted into `tables` (all when None).
+        source: path or text file-like.
+        """
+        wanted = set(tables) if tables is not None else None
+        f = open(source, encoding=encoding, errors="replace") if isinstance(source, (str, os.PathLike)) else source
+        try:
+            yield from _Scanner(f).rows(wanted)
+        finally:
+            if f is not source:
+                f.close()
+
+    @staticmethod
+    def split_values(row: str) -> list:
+        # No capture groups: findall returns plain strings, the quotes tell strings apart
+        unescape = MysqlDump.unescape
+        return [
+            unescape(v[1:-1]) if v[0] in "'\"" else (None if v == "NULL" or v == "null" else v)
+            for v in _VALUE.findall(row)
+        ]
+
+    @staticmethod
+    def unescape(text: str) -> str:
+        if "\\" not in text and "''" not in text and '""' not in text:
+            return text
+        return _ESCAPE.sub(lambda m: _ESCAPES.get(m.group(1), m.group(1)) if m.group(1) is not None else m.group(0)[0], text)
+
+
+class _Scanner:
+    def __init__(self, f: io.TextIOBase):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.columns: Dict[str, List[str]] = {}  # from CREATE TABLE
+
+    def _more(self) -> bool:
+        if self.eof:
+            return False
+        block = self.f.read(MysqlDump.READ_SIZE)
+        if not block:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def _need_more(self):
+        if not self._more():
+            raise ValueError(f"Unexpected end of dump near: {self.buf[self.pos:self.pos + 80]!r}")
+        if len(self.buf) - self.pos > MysqlDump.MAX_ROW:
+            raise ValueError(f"Unterminated statement near: {self.buf[self.pos:self.pos + 80]!r}")
+
+    def rows(self, wanted: Optional[set]) -> Iterator[Tuple[str, List[str], list]]:
+        while True:
+            m = _STATEMENT.search(self.buf, self.pos)
+            if m is None:
+                # Keep a tail: the next statement keyword may straddle the block boundary
+                self.pos = max(self.pos, len(self.buf) - 4096)
+                if not self._more():
+                    return
+                continue
+            if m.group(3):
+                self.pos = m.start()
+                self._read_create(m.group(3))
+                continue
+            if m.end() == len(self.buf) and self._more():
+                continue  # the header may go on in the next block
+            table = m.group(1)
+            if m.group(2) is not None:
+                columns = _IDENTIFIER.findall(m.group(2))
+            else:
+                columns = self.columns.get(table, [])
+            self.pos = m.end()
+            parse = wanted is None or table in wanted
+            for row in self._read_rows():
+                if parse:
+                    yield table, columns, MysqlDump.split_values(row)
+
+    def _read_create(self, table: str):
+        while True:
+            end = _CREATE_END.search(self.buf, self.pos)
+            if end is not None:
+                break
+            self._need_more()
+        self.columns[table] = _CREATE_COLUMN.findall(self.buf, self.pos, end.start())
+        self.pos = end.end()
+
+    def _read_rows(self) -> Iterator[str]:
+        while True:
+            m = _ROW.match(self.buf, self.pos)
+            if m is None or (m.end() == len(self.buf) and m.group(2) is None and not self.eof):
+                # Row cut by the block boundary (or not a row at all: give up at EOF)
+                if m is None and self.eof:
+                    raise ValueError(f"Malformed row near: {self.buf[self.pos:self.pos + 80]!r}")
+                self._need_more()
+                continue
+            self.pos = m.end()
+            yield m.group(1)
+            if m.group(2) != ",":
+                return
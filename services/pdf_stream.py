@@ -0,0 +1,92 @@
+import io
+import zlib
+from array import array
+
+MM = 72 / 25.4  # points per millimetre
+
+
+class PdfStreamWriter:
+    """
+    Minimal PDF 1.4 writer that emits objects as they are produced (no reportlab needed).
+    Only xref offsets and page object ids are kept in memory, as compact arrays, so
+    documents of any length stream with flat memory. The page tree and catalog are
+    written last; pages reference the reserved page tree object (2) up front.
+
+    Subclasses call _begin(), add pages with _add_page() (yielding _drain() whenever
+    _should_flush() is true) and end with _finish().
+    """
+
+    FLUSH_BYTES = 64 * 1024
+
+    def _begin(self):
+        self._buf = io.BytesIO()
+        self._offset = 0
+        self._offsets = array("Q", [0, 0, 0])  # 1 = catalog, 2 = page tree: written last
+        self._kids = array("Q")
+
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.font = self._add_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        self.bold = self._add_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    def _add_page(self, width: float, height: float, content: int, resources: bytes) -> int:
+        page = self._add_object(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R /Resources %s >>"
+            % (width, height, content, resources)
+        )
+        self._kids.append(page)
+        return page
+
+    def _finish(self) -> bytes:
+        kids = b" ".join(b"%d 0 R" % k for k in self._kids)
+        self._add_object(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._kids)), number=2)
+        self._add_object(b"<< /Type /Catalog /Pages 2 0 R >>", number=1)
+
+        xref = self._offset
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % len(self._offsets))
+        for off in self._offsets[1:]:
+            self._write(b"%010d 00000 n \n" % off)
+        self._write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(self._offsets), xref))
+        return self._drain()
+
+    # --- Text helpers (Helvetica has no metrics here: ~0.55em per glyph is close enough) ---
+
+    @staticmethod
+    def _text_width(text: str, size: float) -> float:
+        return len(text) * size * 0.55
+
+    @staticmethod
+    def _fit(text: str, size: float, width: float) -> str:
+        max_chars = int(width / (size * 0.55))
+        return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+    @staticmethod
+    def _escape(text: str) -> str:
+        return str(text).replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    # --- Low level object writing ---
+
+    def _should_flush(self) -> bool:
+        return self._buf.tell() >= self.FLUSH_BYTES
+
+    def _write(self, data: bytes):
+        self._buf.write(data)
+        self._offset += len(data)
+
+    def _drain(self) -> bytes:
+        data = self._buf.getvalue()
+        self._buf = io.BytesIO()
+        return data
+
+    def _add_object(self, body: bytes, number: int = 0) -> int:
+        if number:
+            self._offsets[number] = self._offset
+        else:
+            number = len(self._offsets)
+            self._offsets.append(self._offset)
+        self._write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        return number
+
+    def _add_stream(self, dict_head: bytes, data: bytes) -> int:
+        # dict_head is an unterminated "<< ..." dictionary; length and filter are appended here
+        packed = zlib.compress(data)
+        return self._add_object(dict_head + b" /Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream" % (len(packed), packed))
@@ -0,0 +1,250 @@
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from database.models import Product
+from services.catalog_service import CatalogService
+from services.spreadsheet import CHUNK_ROWS, as_text, read_chunks
+from services.stock_ledger import StockLedger
+
+
+class ProductImporter:
+    """
+    Spreadsheet price-list import, set-based: columns are normalized with vectorized pandas,
+    existing barcodes are resolved with one query per chunk, and rows are written with
+    a bulk INSERT ... ON CONFLICT (barcode) DO UPDATE (Postgres and SQLite).
+
+    Expected columns: Name, Price, Stock. Optional: Barcode, Category, Description,
+    CantBulto, Numeracion. Existing products keep their name; empty cells keep the
+    current value; Stock sets the available stock through the ledger.
+    """
+
+    CHUNK_SIZE = 500
+    TEXT_COLUMNS = {"Category": "category", "Description": "description", "Numeracion": "numeracion"}
+    NUMBER_COLUMNS = {"Price": "price", "Stock": "stock", "CantBulto": "cant_bulto"}
+
+    @staticmethod
+    def run(session: Session, source, user_id: int, chunk_size: int = CHUNK_ROWS, progress: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Imports a spreadsheet (xlsx or CSV, path or file-like) chunk by chunk, committing
+        after each one. progress(chunk_result) runs just before each commit, in the same
+        transaction. Returns {"added", "updated", "errors", "timing": {..._ms}}.
+        """
+        timing = dict.fromkeys(("read_ms", "normalize_ms", "lookup_ms", "write_ms"), 0.0)
+        started = time.perf_counter()
+        added = updated = 0
+        errors: List[str] = []
+
+        chunks = read_chunks(source, chunk_size)
+        while True:
+            mark = time.perf_counter()
+            df = next(chunks, None)
+            timing["read_ms"] += (time.perf_counter() - mark) * 1000
+            if df is None:
+                break
+            result = ProductImporter.import_chunk(session, df, user_id, timing)
+            if progress:
+                progress(result)
+            mark = time.perf_counter()
+            session.commit()
+            timing["write_ms"] += (time.perf_counter() - mark) * 1000
+            added += result["added"]
+            updated += result["updated"]
+            errors += result["errors"]
+
+        timing = {name: round(ms, 1) for name, ms in timing.items()}
+        timing["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        print(f"INFO: Product import: {added} added, {updated} updated, {len(errors)} errors in {timing['total_ms']:.0f}ms")
+        return {"added": added, "updated": updated, "errors": errors, "timing": timing}
+
+    @staticmethod
+    def import_chunk(session: Session, df, user_id: int, timing: Optional[Dict[str, float]] = None) -> dict:
+        """
+        One DataFrame of spreadsheet rows. Does not commit.
+        Returns {"rows", "added", "updated", "errors"}; adds phase times (ms) to `timing`.
+        """
+        timing = timing if timing is not None else {}
+        mark = time.perf_counter()
+
+        def lap(name):
+            nonlocal mark
+            now = time.perf_counter()
+            timing[name] = timing.get(name, 0.0) + (now - mark) * 1000
+            mark = now
+
+        frame, errors, duplicates = ProductImporter.normalize(df)
+        lap("normalize_ms")
+        existing = ProductImporter.lookup(session, frame["barcode"].dropna().tolist())
+        lap("lookup_ms")
+        added, updated = ProductImporter.write(session, frame, existing, user_id)
+        lap("write_ms")
+        return {"rows": len(df), "added": added, "updated": updated + duplicates, "errors": errors}
+
+    # --- Steps ---
+
+    @staticmethod
+    def normalize(df) -> Tuple["pd.DataFrame", List[str], int]:
+        """
+        Returns (rows to write, errors, in-file duplicate count). Rows without a name are
+        skipped; rows with a non-numeric Price/Stock/CantBulto are reported and skipped.
+        A barcode repeated in the file keeps its last row (earlier ones count as updates).
+        """
+        import numpy as np
+        import pandas as pd
+
+        def column(name):
+            if name in df.columns:
+                return df[name]
+            return pd.Series(None, index=df.index, dtype="object")
+
+        frame = pd.DataFrame(index=df.index)
+        frame["name"] = as_text(column("Name"))
+        frame["barcode"] = as_text(column("Barcode"))
+        for col, field in ProductImporter.TEXT_COLUMNS.items():
+            frame[field] = as_text(column(col))
+
+        keep = frame["name"].notna()
+        invalid = pd.Series(False, index=df.index)
+        errors = {}
+        for col, field in ProductImporter.NUMBER_COLUMNS.items():
+            raw = column(col)
+            values = pd.to_numeric(raw, errors="coerce")
+            bad = keep & values.isna() & as_text(raw).notna()
+            for index in df.index[bad]:
+                errors.setdefault(index, f"Row {index}: invalid {col} '{raw[index]}'")
+            invalid |= bad
+            # Stock and CantBulto are whole numbers (truncated, like int())
+            frame[field] = values if field == "price" else np.trunc(values).astype("Int64")
+
+        frame = frame[keep & ~invalid]
+        duplicated = frame["barcode"].notna() & frame.duplicated("barcode", keep="last")
+        frame = frame[~duplicated]
+        return frame, [errors[i] for i in sorted(errors)], int(duplicated.sum())
+
+    @staticmethod
+    def lookup(session: Session, barcodes: List[str]) -> Dict[str, Tuple[int, float]]:
+        """
+        {barcode: (id, price)} for the barcodes that already exist.
+        """
+        existing = {}
+        for start in range(0, len(barcodes), ProductImporter.CHUNK_SIZE):
+            chunk = barcodes[start:start + ProductImporter.CHUNK_SIZE]
+            rows = session.exec(select(Product.barcode, Product.id, Product.price).where(Product.barcode.in_(chunk))).all()
+            existing.update({barcode: (pid, price) for barcode, pid, price in rows})
+        return existing
+
+    @staticmethod
+    def write(session: Session, frame, existing: Dict[str, Tuple[int, float]], user_id: int) -> Tuple[int, int]:
+        """
+        Upserts the normalized rows, then fixes stock through the ledger. Does not commit.
+        Returns (added, updated).
+        """
+        now = datetime.utcnow()
+        records = frame.astype(object).where(frame.notna(), None).to_dict("records")
+        rows, stock_targets = [], {}
+        for r in records:
+            known = existing.get(r["barcode"]) if r["barcode"] else None
+            if known and r["stock"] is not None:
+                stock_targets[known[0]] = r["stock"]
+            rows.append({
+                "name": r["name"],
+                # Empty price keeps the current one; new products start at 0
+                "price": r["price"] if r["price"] is not None else (known[1] if known else 0.0),
+                # Existing products get their stock through the ledger below, not here
+                "stock_quantity": (r["stock"] or 0) if not known else 0,
+                "barcode": r["barcode"],
+                "category": r["category"],
+                "description": r["description"],
+                "numeracion": r["numeracion"],
+                "cant_bulto": r["cant_bulto"],
+                "updated_at": now,
+            })
+
+        with_code = [r for r in rows if r["barcode"]]
+        without_code = [r for r in rows if not r["barcode"]]
+        ids = ProductImporter._upsert(session, with_code, existing)
+        ids.update(ProductImporter._insert_without_barcode(session, without_code))
+
+        # Opening movements for new products, ledger adjustments for existing ones
+        known_ids = {pid for pid, _ in existing.values()}
+        StockLedger.append(session, [
+            {"product_id": pid, "delta": stock, "reason": "import", "user_id": user_id, "applied": True}
+            for pid, stock in ids.items() if pid not in known_ids and stock
+        ])
+        StockLedger.set_stock_many(session, stock_targets, "import", user_id)
+        CatalogService.touch_products(session, ids.keys())
+
+        updated = sum(1 for r in with_code if r["barcode"] in existing)
+        return len(rows) - updated, updated
+
+    @staticmethod
+    def _upsert(session: Session, rows: List[dict], existing: Dict[str, Tuple[int, float]]) -> Dict[int, int]:
+        """
+        Returns {product_id: stock_quantity written}.
+        """
+        ids = {}
+        if not rows:
+            return ids
+        table = Product.__table__
+        dialect = session.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            dialect_insert = pg_insert if dialect == "postgresql" else sqlite_insert
+            stmt = dialect_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["barcode"],
+                set_={
+                    "price": stmt.excluded.price,
+                    "category": func.coalesce(stmt.excluded.category, table.c.category),
+                    "description": func.coalesce(stmt.excluded.description, table.c.description),
+                    "numeracion": func.coalesce(stmt.excluded.numeracion, table.c.numeracion),
+                    "cant_bulto": func.coalesce(stmt.excluded.cant_bulto, table.c.cant_bulto),
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            ).returning(table.c.id, table.c.barcode)
+            stock = {r["barcode"]: r["stock_quantity"] for r in rows}
+            # One compiled statement; the driver batches it into multi-row VALUES (insertmanyvalues)
+            for start in range(0, len(rows), ProductImporter.CHUNK_SIZE):
+                written = session.execute(stmt, rows[start:start + ProductImporter.CHUNK_SIZE]).all()
+                ids.update({pid: stock[barcode] for pid, barcode in written})
+            return ids
+
+        # Other dialects: the lookup already split new from existing rows
+        new = [r for r in rows if r["barcode"] not in existing]
+        for start in range(0, len(new), ProductImporter.CHUNK_SIZE):
+            written = session.execute(insert(table).returning(table.c.id, table.c.stock_quantity), new[start:start + ProductImporter.CHUNK_SIZE]).all()
+            ids.update(dict(written))
+        fields = ("price", "category", "description", "numeracion", "cant_bulto", "updated_at")
+        for r in rows:
+            if r["barcode"] in existing:
+                pid = existing[r["barcode"]][0]
+                session.execute(update(table).where(table.c.id == pid).values(**{f: r[f] for f in fields if r[f] is not None}))
+                ids[pid] = 0
+        return ids
+
+    @staticmethod
+    def _insert_without_barcode(session: Session, rows: List[dict]) -> Dict[int, int]:
+        """
+        New products without a barcode get the id-based code (see StockService.generate_barcode),
+        so they are inserted with unique placeholders and recoded in one CASE UPDATE.
+        """
+        ids = {}
+        table = Product.__table__
+        token = uuid.uuid4().hex
+        stmt = insert(table).returning(table.c.id, table.c.stock_quantity)
+        for start in range(0, len(rows), ProductImporter.CHUNK_SIZE):
+            chunk = [dict(r, barcode=f"import-{token}-{start + i}") for i, r in enumerate(rows[start:start + ProductImporter.CHUNK_SIZE])]
+            ids.update(dict(session.execute(stmt, chunk).all()))
+        if ids:
+            session.execute(
+                update(Product)
+                .where(Product.id.in_(list(ids)))
+                .values(barcode=case({pid: str(pid).zfill(8) for pid in ids}, value=Product.id))
+                .execution_options(synchronize_session=False)
+            )
+        return ids
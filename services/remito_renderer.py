@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+from jinja2 import Environment
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
+
+from database.models import Client, Sale, Settings
+from services.sales_rollup import STORE_TIMEZONE
+
+
+class RemitoRenderer:
+    """
+    Renders remitos (delivery notes). A sale never changes once issued, so each
+    rendered remito body is kept in an LRU keyed by sale id and the company header
+    it was drawn with; reprints and batch documents reuse it after one light query.
+    The remito shows the client's contact details, so the client's id and updated_at
+    are part of the key too: an edit or deletion in any worker misses the old entry.
+    """
+
+    BODY_TEMPLATE = "remito_body.html"
+    PAGE_TEMPLATE = "remito.html"
+
+    def __init__(self, env: Environment, max_entries: int = 512):
+        self.env = env
+        self.max_entries = max_entries
+        self._bodies: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render_page(self, session: Session, sale_ids: List[int], settings: Settings) -> Optional[str]:
+        """
+        One printable HTML document with a remito per sale (page break between them),
+        in the given order. Sales that do not exist are skipped; None when none exist.
+        """
+        bodies = self.render_bodies(session, sale_ids, settings)
+        if not bodies:
+            return None
+        title = f"Remito #{sale_ids[0]}" if len(sale_ids) == 1 else f"Remitos ({len(bodies)})"
+        return self.env.get_template(self.PAGE_TEMPLATE).render(title=title, remitos=bodies)
+
+    def render_bodies(self, session: Session, sale_ids: List[int], settings: Settings) -> List[str]:
+        header = (settings.company_name, settings.logo_url) if settings else (None, None)
+        keys = {
+            sale_id: (sale_id, client_id, client_updated_at, header)
+            for sale_id, client_id, client_updated_at in self.client_stamps(session, list(dict.fromkeys(sale_ids)))
+        }
+        found: Dict[int, str] = {}
+        missing = []
+        with self._lock:
+            for sale_id, key in keys.items():
+                body = self._bodies.get(key)
+                if body is None:
+                    missing.append(sale_id)
+                    continue
+                self._bodies.move_to_end(key)
+                found[sale_id] = body
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            template = self.env.get_template(self.BODY_TEMPLATE)
+            rendered = {sale.id: template.render(sale=sale, settings=settings) for sale in self.load_sales(session, missing)}
+            with self._lock:
+                for sale_id, body in rendered.items():
+                    self._bodies[keys[sale_id]] = body
+                    self._bodies.move_to_end(keys[sale_id])
+                while len(self._bodies) > self.max_entries:
+                    self._bodies.popitem(last=False)
+            found.update(rendered)
+
+        return [found[sale_id] for sale_id in dict.fromkeys(sale_ids) if sale_id in found]
+
+    def clear(self):
+        with self._lock:
+            self._bodies.clear()
+
+    @staticmethod
+    def client_stamps(session: Session, sale_ids: List[int]) -> List[tuple]:
+        # (sale_id, client_id, client updated_at) for the sales that exist; client columns
+        # are None for counter sales and deleted clients
+        if not sale_ids:
+            return []
+        return session.exec(
+            select(Sale.id, Client.id, Client.updated_at)
+            .outerjoin(Client, Sale.client_id == Client.id)
+            .where(Sale.id.in_(sale_ids))
+        ).all()
+
+    @staticmethod
+    def load_sales(session: Session, sale_ids: List[int]) -> List[Sale]:
+        # Items, client and user in one query each, whatever the number of sales
+        return session.exec(
+            select(Sale)
+            .where(Sale.id.in_(sale_ids))
+            .options(selectinload(Sale.items), selectinload(Sale.client), selectinload(Sale.user))
+        ).all()
+
+    @staticmethod
+    def sale_ids_for_day(session: Session, day: date, clients_only: bool = True, limit: int = 500) -> List[int]:
+        """
+        Sales of a store-timezone day, oldest first (end-of-day dispatch).
+        Counter sales without a client are not dispatched, so they are left out by default.
+        """
+        # Sale timestamps are naive server-local time
+        start = datetime.combine(day, time.min, tzinfo=STORE_TIMEZONE).astimezone().replace(tzinfo=None)
+        end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=STORE_TIMEZONE).astimezone().replace(tzinfo=None)
+        stmt = select(Sale.id).where(Sale.timestamp >= start, Sale.timestamp < end)
+        if clients_only:
+            stmt = stmt.where(Sale.client_id.is_not(None))
+        return list(session.exec(stmt.order_by(Sale.timestamp, Sale.id).limit(limit)).all())
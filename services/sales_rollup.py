@@ -0,0 +1,119 @@
+import os
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from database.models import Sale, SalesDailyRollup
+
+STORE_TIMEZONE = ZoneInfo(os.getenv("STORE_TIMEZONE", "America/Argentina/Buenos_Aires"))
+
+
+class SalesRollup:
+    """
+    Per-day sales totals (store timezone, split by payment method) kept in
+    sales_daily_rollup, so reports never scan the whole sale history.
+    """
+
+    @staticmethod
+    def store_day(timestamp: datetime) -> date:
+        # Sale timestamps are naive server-local time (datetime.now())
+        return timestamp.astimezone(STORE_TIMEZONE).date()
+
+    @staticmethod
+    def record_sale(session: Session, sale: Sale):
+        """
+        Adds the sale to its day bucket with one upsert, in the sale's transaction.
+        Call it as late as possible before commit: the bucket row stays locked until then.
+        """
+        dialect = session.get_bind().dialect.name
+        values = {
+            "day": SalesRollup.store_day(sale.timestamp),
+            "payment_method": sale.payment_method,
+            "sale_count": 1,
+            "total": sale.total_amount,
+        }
+        if dialect in ("postgresql", "sqlite"):
+            dialect_insert = pg_insert if dialect == "postgresql" else sqlite_insert
+            stmt = dialect_insert(SalesDailyRollup).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["day", "payment_method"],
+                set_={
+                    "sale_count": SalesDailyRollup.sale_count + 1,
+                    "total": SalesDailyRollup.total + stmt.excluded.total,
+                },
+            )
+            session.execute(stmt)
+            return
+
+        row = session.get(SalesDailyRollup, (values["day"], values["payment_method"]))
+        if row:
+            row.sale_count += 1
+            row.total += sale.total_amount
+        else:
+            row = SalesDailyRollup(**values)
+        session.add(row)
+
+    @staticmethod
+    def rebuild(session: Session, batch_size: int = 5000) -> int:
+        """
+        Recomputes the whole table from the sale history (one streamed pass). Returns rows written.
+        Runs in one transaction that locks the rollup first: a sale upserting its bucket
+        meanwhile waits and lands on the rebuilt rows instead of being overwritten.
+        """
+        SalesRollup._lock_for_rebuild(session)
+        buckets: Dict[Tuple[date, str], List] = {}
+        rows = session.exec(
+            select(Sale.timestamp, Sale.payment_method, Sale.total_amount).execution_options(yield_per=batch_size)
+        )
+        for timestamp, payment_method, total in rows:
+            bucket = buckets.setdefault((SalesRollup.store_day(timestamp), payment_method), [0, 0.0])
+            bucket[0] += 1
+            bucket[1] += total or 0.0
+
+        session.execute(delete(SalesDailyRollup))
+        if buckets:
+            session.execute(insert(SalesDailyRollup), [
+                {"day": day, "payment_method": method, "sale_count": count, "total": total}
+                for (day, method), (count, total) in buckets.items()
+            ])
+        session.commit()
+        return len(buckets)
+
+    @staticmethod
+    def _lock_for_rebuild(session: Session):
+        conn = session.connection()
+        if conn.dialect.name == "postgresql":
+            # Blocks writers (record_sale) until commit, not readers; a sale that already
+            # upserted holds its own lock, so this waits for it and the scan then sees it
+            conn.exec_driver_sql("LOCK TABLE sales_daily_rollup IN EXCLUSIVE MODE")
+        elif conn.dialect.name == "sqlite" and not conn.connection.dbapi_connection.in_transaction:
+            # Take the single write lock before reading (pysqlite would only take it at the DELETE)
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    @staticmethod
+    def daily(session: Session, limit: int = 60, offset: int = 0) -> List[dict]:
+        """
+        Most recent days first: [{"date", "count", "total", "by_method": {method: total}}].
+        """
+        days = session.exec(
+            select(SalesDailyRollup.day)
+            .group_by(SalesDailyRollup.day)
+            .order_by(SalesDailyRollup.day.desc())
+            .offset(offset)
+            .limit(limit)
+        ).all()
+        if not days:
+            return []
+
+        result = {d: {"date": d.isoformat(), "count": 0, "total": 0.0, "by_method": {}} for d in days}
+        for row in session.exec(select(SalesDailyRollup).where(SalesDailyRollup.day.in_(days))).all():
+            day = result[row.day]
+            day["count"] += row.sale_count
+            day["total"] += row.total
+            day["by_method"][row.payment_method] = row.total
+        return [result[d] for d in days]
@@ -0,0 +1,205 @@
+import base64
+import json
+from typing import List, Optional
+
+from sqlalchemy import Integer, case, func, literal, or_, and_, text
+from sqlmodel import Session, select
+
+from database.models import Product
+
+
+class ProductSearchService:
+    """
+    Server-side product search for the POS and picking screens.
+    Uses pg_trgm GIN indexes on Postgres and an FTS5 trigram table on SQLite,
+    falling back to plain LIKE scans when neither is available.
+    """
+
+    # Rank tiers (lower is better)
+    RANK_BARCODE_EXACT = 0
+    RANK_BARCODE_PREFIX = 1
+    RANK_NAME_PREFIX = 2
+    RANK_CONTAINS = 3
+
+    MAX_LIMIT = 100
+
+    def __init__(self):
+        self.fts_enabled = False  # set by detect()
+
+    # --- Index management ---
+
+    def ensure_indexes(self, engine):
+        """
+        Creates the search indexes for the current backend. Deploys do this once through
+        the schema migrations (database/migrations.py); workers only call detect().
+        """
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            ProductSearchService.create_indexes(connection)
+        self.detect(engine)
+
+    def detect(self, engine):
+        """
+        Cheap startup check (no DDL): whether the SQLite FTS index exists.
+        """
+        if engine.dialect.name != "sqlite":
+            return
+        with engine.connect() as conn:
+            self.fts_enabled = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='product_fts'")).first() is not None
+
+    @staticmethod
+    def create_indexes(connection):
+        dialect = connection.dialect.name
+        if dialect == "postgresql":
+            ProductSearchService._ensure_pg_trgm(connection)
+        elif dialect == "sqlite":
+            ProductSearchService._ensure_sqlite_fts(connection)
+
+    @staticmethod
+    def _ensure_pg_trgm(conn):
+        from database.migrations import create_index
+
+        try:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            # Built concurrently: the catalog stays writable meanwhile
+            create_index(conn, "ix_product_name_trgm", "product", "name gin_trgm_ops", using="gin")
+            create_index(conn, "ix_product_barcode_trgm", "product", "barcode gin_trgm_ops", using="gin")
+        except Exception as e:
+            # Missing privileges for CREATE EXTENSION on hosted DBs: search still works, just slower
+            print(f"WARNING: Could not create pg_trgm search indexes: {e}")
+
+    @staticmethod
+    def _ensure_sqlite_fts(conn):
+        try:
+            exists = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='product_fts'")).first()
+            if not exists:
+                # External content table: FTS only stores the index, rows live in `product`
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE product_fts USING fts5("
+                    "name, barcode, content='product', content_rowid='id', tokenize='trigram')"
+                ))
+                conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN "
+                "INSERT INTO product_fts(rowid, name, barcode) VALUES (new.id, new.name, new.barcode); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN "
+                "INSERT INTO product_fts(product_fts, rowid, name, barcode) VALUES ('delete', old.id, old.name, old.barcode); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, barcode ON product BEGIN "
+                "INSERT INTO product_fts(product_fts, rowid, name, barcode) VALUES ('delete', old.id, old.name, old.barcode); "
+                "INSERT INTO product_fts(rowid, name, barcode) VALUES (new.id, new.name, new.barcode); END"
+            ))
+        except Exception as e:
+            # Older SQLite builds without FTS5/trigram tokenizer
+            print(f"WARNING: Could not create FTS5 search index: {e}")
+
+    # --- Cursor helpers ---
+
+    @staticmethod
+    def encode_cursor(rank: int, name: str, product_id: int) -> str:
+        raw = json.dumps([rank, name, product_id]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        try:
+            rank, name, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return int(rank), str(name), int(product_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    # --- Search ---
+
+    def search(self, session: Session, q: str = "", limit: int = 20, cursor: Optional[str] = None) -> dict:
+        """
+        Returns {"items": [...], "next_cursor": str|None, "exact": bool}.
+        An exact barcode match short-circuits through the unique barcode index.
+        """
+        q = (q or "").strip()
+        limit = max(1, min(limit, self.MAX_LIMIT))
+
+        # 1. Fast path: scanner input is almost always a full barcode
+        if q and not cursor:
+            exact = session.exec(select(Product).where(Product.barcode == q)).first()
+            if exact:
+                return {"items": [exact], "next_cursor": None, "exact": True}
+
+        terms = q.lower().split()
+        rank = self._rank_expression(terms)
+
+        stmt = select(Product, rank.label("rank"))
+        for cond in self._match_conditions(session, terms):
+            stmt = stmt.where(cond)
+
+        if cursor:
+            c_rank, c_name, c_id = self.decode_cursor(cursor)
+            stmt = stmt.where(or_(
+                rank > c_rank,
+                and_(rank == c_rank, Product.name > c_name),
+                and_(rank == c_rank, Product.name == c_name, Product.id > c_id),
+            ))
+
+        # Fetch one extra row to know whether there is a next page
+        stmt = stmt.order_by(rank, Product.name, Product.id).limit(limit + 1)
+        rows = session.exec(stmt).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_product, last_rank = rows[-1]
+            next_cursor = self.encode_cursor(last_rank, last_product.name, last_product.id)
+
+        return {"items": [p for p, _ in rows], "next_cursor": next_cursor, "exact": False}
+
+    def _rank_expression(self, terms: List[str]):
+        if not terms:
+            return literal(self.RANK_CONTAINS, Integer)
+
+        full = " ".join(terms)
+        barcode_lc = func.lower(Product.barcode)
+        name_lc = func.lower(Product.name)
+        return case(
+            (barcode_lc == full, self.RANK_BARCODE_EXACT),
+            (barcode_lc.like(self._escape_like(full) + "%", escape="\\"), self.RANK_BARCODE_PREFIX),
+            (name_lc.like(self._escape_like(full) + "%", escape="\\"), self.RANK_NAME_PREFIX),
+            else_=self.RANK_CONTAINS,
+        )
+
+    def _match_conditions(self, session: Session, terms: List[str]):
+        """
+        Every term must match name or barcode (AND of ORs).
+        """
+        if not terms:
+            return []
+
+        dialect = session.get_bind().dialect.name
+        conditions = []
+
+        like_terms = terms
+        if dialect == "sqlite" and self.fts_enabled:
+            # Trigram tokenizer needs at least 3 chars per term; shorter ones go through LIKE
+            fts_terms = [t for t in terms if len(t) >= 3]
+            like_terms = [t for t in terms if len(t) < 3]
+            if fts_terms:
+                match = " AND ".join('"' + t.replace('"', '""') + '"' for t in fts_terms)
+                fts_ids = text("SELECT rowid FROM product_fts WHERE product_fts MATCH :match") \
+                    .bindparams(match=match).columns(rowid=Integer)
+                conditions.append(Product.id.in_(fts_ids))
+
+        for t in like_terms:
+            pattern = "%" + self._escape_like(t) + "%"
+            if dialect == "postgresql":
+                # ILIKE on the raw column is what the gin_trgm_ops indexes accelerate
+                conditions.append(or_(Product.name.ilike(pattern, escape="\\"), Product.barcode.ilike(pattern, escape="\\")))
+            else:
+                conditions.append(or_(
+                    func.lower(Product.name).like(pattern, escape="\\"),
+                    func.lower(Product.barcode).like(pattern, escape="\\"),
+                ))
+        return conditions
+
+    @staticmethod
+    def _escape_like(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -0,0 +1,126 @@
+import os
+import re
+import unicodedata
+from typing import Iterable, Iterator, Optional
+
+CHUNK_ROWS = 5000
+
+
+def is_csv(source) -> bool:
+    if isinstance(source, (str, os.PathLike)):
+        return str(source).lower().endswith(".csv")
+    # File-like: xlsx files are zip archives
+    head = source.read(2)
+    source.seek(0)
+    return head != b"PK"
+
+
+def read_chunks(source, chunk_size: int = CHUNK_ROWS) -> Iterator["pd.DataFrame"]:
+    """
+    Yields the first sheet (xlsx, openpyxl read-only) or a CSV as DataFrames of at most
+    chunk_size rows, so memory stays bounded whatever the file size. The index keeps
+    counting across chunks (0 = first data row), like a single pd.read_excel frame.
+    CSV cells are read as text, so codes keep their leading zeros.
+    """
+    import pandas as pd
+
+    if is_csv(source):
+        yield from pd.read_csv(source, chunksize=chunk_size, dtype=str, skipinitialspace=True)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(h).strip() if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+        width = len(columns)
+
+        batch, index = [], []
+        for number, row in enumerate(rows):
+            if all(v is None for v in row):
+                continue
+            batch.append(tuple(row[:width]) + (None,) * (width - len(row)))
+            index.append(number)
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame(batch, columns=columns, index=index)
+                batch, index = [], []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=index)
+    finally:
+        workbook.close()
+
+
+def count_rows(path: str) -> Optional[int]:
+    """
+    Data rows in the file (header excluded), for progress reporting. None if unknown.
+    """
+    if is_csv(path):
+        lines, last = 0, b"\n"
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                lines += block.count(b"\n")
+                last = block[-1:]
+        if last != b"\n":
+            lines += 1  # no newline after the last row
+        return max(lines - 1, 0)
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True)
+    try:
+        # From the sheet's <dimension> tag; some writers leave it out
+        max_row = workbook.active.max_row
+        return max(max_row - 1, 0) if max_row else None
+    finally:
+        workbook.close()
+
+
+# --- Cell helpers (vectorized) ---
+
+def as_text(values) -> "pd.Series":
+    """
+    Cells as trimmed strings, <NA> when blank. Excel hands numeric codes (barcodes,
+    phones, CUITs) over as floats: whole numbers lose the ".0" (7791234567898.0 -> "7791234567898").
+    """
+    import pandas as pd
+
+    if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        values = values.astype("Int64")
+    elif values.dtype == object:
+        values = values.map(lambda v: str(int(v)) if isinstance(v, float) and v.is_integer() else v, na_action="ignore")
+    values = values.astype("string").str.strip()
+    return values.mask(values.isin(["", "nan"]))
+
+
+def fold(values) -> "pd.Series":
+    """
+    Case- and accent-insensitive comparison key: "  José  PÉREZ" -> "jose perez".
+    """
+    return (
+        values.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+        .str.casefold().str.replace(r"\s+", " ", regex=True).str.strip()
+    )
+
+
+def header_key(name) -> str:
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]", "", text.casefold())
+
+
+def find_column(df, aliases: Iterable[str]) -> "pd.Series":
+    """
+    First column whose header matches one of the aliases, ignoring case, accents,
+    spaces and punctuation ("Razón Social" == "RazonSocial"). All-<NA> when missing.
+    """
+    import pandas as pd
+
+    headers = {header_key(c): c for c in df.columns}
+    for alias in aliases:
+        column = headers.get(header_key(alias))
+        if column is not None:
+            return df[column]
+    return pd.Series(None, index=df.index, dtype="object")
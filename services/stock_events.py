@@ -0,0 +1,120 @@
+import asyncio
+import json
+import threading
+from typing import Dict, List
+
+from sqlalchemy import event
+from sqlmodel import Session
+
+from services.dashboard_metrics import DashboardMetrics
+
+
+class StockSubscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+
+class StockBroadcaster:
+    """
+    Fan-out of stock changes to open POS/picking terminals (SSE).
+    Each client gets a bounded queue; a client that falls behind is dropped
+    (it reconnects and resyncs through /api/products/changes) so publishers never block.
+    """
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> StockSubscription:
+        # Must be called from the event loop that will consume the queue
+        sub = StockSubscription(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: StockSubscription):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, events: List[dict]):
+        """
+        Thread-safe: request handlers run in the threadpool, queues live on the event loop.
+        """
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(self._offer, sub, events)
+            except RuntimeError:
+                # Loop already closed (shutdown)
+                self.unsubscribe(sub)
+
+    def _offer(self, sub: StockSubscription, events: List[dict]):
+        if sub.dropped:
+            return
+        for ev in events:
+            try:
+                sub.queue.put_nowait(ev)
+            except asyncio.QueueFull:
+                sub.dropped = True
+                self.unsubscribe(sub)
+                return
+
+    async def stream(self, sub: StockSubscription, is_disconnected, keepalive: float = 15.0):
+        """
+        Yields SSE frames for one subscriber until it disconnects or gets dropped.
+        """
+        try:
+            yield "retry: 3000\n\n"
+            while not sub.dropped:
+                try:
+                    ev = await asyncio.wait_for(sub.queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: stock\ndata: {json.dumps(ev)}\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+
+stock_broadcaster = StockBroadcaster()
+
+
+# --- Session hooks: publish only what actually committed ---
+
+_PENDING_KEY = "pending_stock_events"
+
+
+def record_stock_change(session: Session, product_id: int, stock_quantity: int):
+    """
+    Queues a stock event on the session; it is published after a successful commit.
+    """
+    pending: Dict[int, int] = session.info.setdefault(_PENDING_KEY, {})
+    pending[product_id] = stock_quantity
+    # Picking receipts only append movements, so they invalidate the dashboard here
+    DashboardMetrics.mark_stale(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        stock_broadcaster.publish([
+            {"product_id": pid, "stock_quantity": qty} for pid, qty in pending.items()
+        ])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
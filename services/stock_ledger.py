@@ -0,0 +1,251 @@
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import case, func, insert, update
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session, select
+
+from database.models import Product, StockMovement
+from services.catalog_service import CatalogService
+
+
+class StockLedger:
+    """
+    Append-only stock movements.
+
+    Product.stock_quantity is a snapshot: the sum of all *applied* movements.
+    Hot paths that only add stock (picking entries) just append a pending movement,
+    without touching the product row; compaction folds pending movements into the
+    snapshot periodically. Available stock = snapshot + pending deltas.
+    Sales still decrement the snapshot directly (guarded, see StockService) because
+    preventing oversell needs the row lock anyway; they are recorded as applied movements.
+    """
+
+    # --- Appending ---
+
+    @staticmethod
+    def append(session: Session, rows: List[dict]):
+        """
+        Bulk-appends movements. Each row: product_id, delta, reason and optionally
+        sale_id, user_id, applied (default False). Does not commit.
+        """
+        if not rows:
+            return
+        now = datetime.utcnow()
+        session.execute(insert(StockMovement.__table__), [
+            {
+                "product_id": r["product_id"],
+                "delta": r["delta"],
+                "reason": r["reason"],
+                "sale_id": r.get("sale_id"),
+                "user_id": r.get("user_id"),
+                "timestamp": r.get("timestamp") or now,
+                "applied": r.get("applied", False),
+            }
+            for r in rows
+        ])
+
+    @staticmethod
+    def set_stock(session: Session, product: Product, new_available: int, reason: str, user_id: Optional[int] = None):
+        """
+        Sets a product's available stock to an absolute value (forms, imports),
+        recording the difference as an applied movement. Does not commit.
+        """
+        pending = StockLedger.pending_deltas(session, [product.id]).get(product.id, 0)
+        delta = new_available - (product.stock_quantity + pending)
+        if delta == 0:
+            return
+        product.stock_quantity += delta
+        session.add(product)
+        StockLedger.append(session, [{"product_id": product.id, "delta": delta, "reason": reason, "user_id": user_id, "applied": True}])
+
+    @staticmethod
+    def set_stock_many(session: Session, targets: Dict[int, int], reason: str, user_id: Optional[int] = None) -> Dict[int, int]:
+        """
+        set_stock for many products at once: one read of current available stock, one
+        CASE UPDATE of the snapshots and one bulk append. Does not commit.
+        Returns the applied {product_id: delta}.
+        """
+        if not targets:
+            return {}
+        current = dict(session.exec(
+            select(Product.id, StockLedger.available_expression())
+            .where(Product.id.in_(list(targets)))
+        ).all())
+        deltas = {pid: targets[pid] - available for pid, available in current.items() if targets[pid] != available}
+        if not deltas:
+            return {}
+        session.execute(
+            update(Product)
+            .where(Product.id.in_(list(deltas)))
+            .values(stock_quantity=Product.stock_quantity + case(deltas, value=Product.id, else_=0))
+            .execution_options(synchronize_session=False)
+        )
+        StockLedger.append(session, [
+            {"product_id": pid, "delta": delta, "reason": reason, "user_id": user_id, "applied": True}
+            for pid, delta in deltas.items()
+        ])
+        return deltas
+
+    # --- Reading ---
+
+    @staticmethod
+    def pending_subquery():
+        """
+        Correlated SUM of pending deltas for the enclosing Product row.
+        """
+        return (
+            select(func.coalesce(func.sum(StockMovement.delta), 0))
+            .where(StockMovement.product_id == Product.id, StockMovement.applied == False)  # noqa: E712
+            .scalar_subquery()
+        )
+
+    @staticmethod
+    def available_expression():
+        """
+        Available stock (snapshot + pending) of the enclosing Product row, for filters
+        and selects. What every screen and form shows as "stock".
+        """
+        return Product.stock_quantity + StockLedger.pending_subquery()
+
+    @staticmethod
+    def pending_deltas(session: Session, product_ids: Iterable[int]) -> Dict[int, int]:
+        ids = list(product_ids)
+        if not ids:
+            return {}
+        rows = session.exec(
+            select(StockMovement.product_id, func.sum(StockMovement.delta))
+            .where(StockMovement.product_id.in_(ids), StockMovement.applied == False)  # noqa: E712
+            .group_by(StockMovement.product_id)
+        ).all()
+        return {pid: int(total) for pid, total in rows}
+
+    @staticmethod
+    def available_stock(session: Session, products: Iterable[Product]) -> Dict[int, int]:
+        """
+        {product_id: available stock} in one statement: snapshot and pending read apart
+        would count a receipt twice (or not at all) if compaction folds it in between.
+        """
+        ids = [p.id for p in products]
+        if not ids:
+            return {}
+        return dict(session.exec(
+            select(Product.id, StockLedger.available_expression()).where(Product.id.in_(ids))
+        ).all())
+
+    @staticmethod
+    def show_available(session: Session, products: Iterable[Product]) -> list:
+        """
+        Loaded products with stock_quantity replaced by available stock (one query),
+        for responses and pages. They are detached from the session, so the value is
+        never flushed back as the snapshot nor seen by later writes in the same session.
+        """
+        products = list(products)
+        available = StockLedger.available_stock(session, products)
+        for p in products:
+            set_committed_value(p, "stock_quantity", available[p.id])
+            session.expunge(p)
+        return products
+
+    @staticmethod
+    def history(session: Session, product_id: int, limit: int = 100, before_id: Optional[int] = None) -> List[StockMovement]:
+        stmt = select(StockMovement).where(StockMovement.product_id == product_id)
+        if before_id:
+            stmt = stmt.where(StockMovement.id < before_id)
+        return session.exec(stmt.order_by(StockMovement.id.desc()).limit(limit)).all()
+
+    # --- Maintenance ---
+
+    @staticmethod
+    def compact(session: Session, batch_size: int = 5000) -> int:
+        """
+        Folds pending movements into Product.stock_quantity. Marks exactly the rows it
+        folds (UPDATE ... RETURNING), so movements committed concurrently are never lost.
+        Returns the number of movements folded.
+        """
+        total = 0
+        while True:
+            batch = select(StockMovement.id).where(StockMovement.applied == False).order_by(StockMovement.id).limit(batch_size)  # noqa: E712
+            marked = session.execute(
+                update(StockMovement)
+                .where(StockMovement.id.in_(batch.scalar_subquery()), StockMovement.applied == False)  # noqa: E712
+                .values(applied=True)
+                .returning(StockMovement.product_id, StockMovement.delta)
+                .execution_options(synchronize_session=False)
+            ).all()
+            if not marked:
+                break
+
+            deltas: Dict[int, int] = {}
+            for pid, delta in marked:
+                deltas[pid] = deltas.get(pid, 0) + delta
+            deltas = {pid: d for pid, d in deltas.items() if d}
+            if deltas:
+                session.execute(
+                    update(Product)
+                    .where(Product.id.in_(list(deltas)))
+                    .values(stock_quantity=Product.stock_quantity + case(deltas, value=Product.id, else_=0))
+                    .execution_options(synchronize_session=False)
+                )
+                CatalogService.touch_products(session, deltas.keys())
+            session.commit()
+            total += len(marked)
+            if len(marked) < batch_size:
+                break
+        return total
+
+    @staticmethod
+    def reconcile(session: Session, fix: bool = False) -> List[dict]:
+        """
+        Checks snapshot == SUM(applied deltas) for every product (one grouped query).
+        Products with no history get an 'opening' movement when fixing; other drifts
+        get a 'reconciliation' movement so the ledger matches the snapshot.
+        """
+        ledger = dict(session.exec(
+            select(StockMovement.product_id, func.sum(StockMovement.delta))
+            .where(StockMovement.applied == True)  # noqa: E712
+            .group_by(StockMovement.product_id)
+        ).all())
+
+        drifts = []
+        fixes = []
+        for pid, snapshot in session.exec(select(Product.id, Product.stock_quantity)).all():
+            ledger_total = ledger.get(pid)
+            if ledger_total is not None and int(ledger_total) == snapshot:
+                continue
+            if ledger_total is None and snapshot == 0:
+                continue
+            drifts.append({"product_id": pid, "snapshot": snapshot, "ledger": int(ledger_total or 0)})
+            fixes.append({
+                "product_id": pid,
+                "delta": snapshot - int(ledger_total or 0),
+                "reason": "opening" if ledger_total is None else "reconciliation",
+                "applied": True,
+            })
+
+        if fix and fixes:
+            StockLedger.append(session, fixes)
+            session.commit()
+        return drifts
+
+    # --- Background compaction ---
+
+    @staticmethod
+    def start_compactor(engine, interval: float = 10.0) -> threading.Event:
+        """
+        Runs compact() every `interval` seconds in a daemon thread. Set the returned event to stop.
+        Safe with several workers: each movement can only be marked applied once.
+        """
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    with Session(engine) as session:
+                        StockLedger.compact(session)
+                except Exception as e:
+                    print(f"WARNING: Stock compaction failed: {e}")
+
+        threading.Thread(target=loop, name="stock-compactor", daemon=True).start()
+        return stop
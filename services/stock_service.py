@@ -1,69 +1,289 @@
-import barcode
-from barcode.writer import ImageWriter
+from sqlalchemy import case, insert, update
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlmodel import Session, select
-from database.models import Product, Sale, SaleItem, User, Payment
-from typing import List, Optional
+from database.models import PickingBatch, Product, Sale, SaleItem, User, Payment
+from services.barcode_cache import BarcodeCache
+from services.catalog_service import CatalogService
+from services.client_ledger import ClientLedger
+from services.sales_rollup import SalesRollup
+from services.stock_events import record_stock_change
+from services.stock_ledger import StockLedger
+from typing import Dict, List, Optional, Tuple
+import json
 import os
 from datetime import datetime
 
+class ProductNotFoundError(ValueError):
+    pass
+
+class InsufficientStockError(ValueError):
+    def __init__(self, product: Product, requested: int, available: Optional[int] = None):
+        super().__init__(f"Insufficient stock for {product.name}")
+        self.product_id = product.id
+        self.product_name = product.name
+        self.requested = requested
+        self.available = product.stock_quantity if available is None else available
+
 class StockService:
     def __init__(self, static_dir: str = "static/barcodes"):
         self.static_dir = static_dir
         os.makedirs(self.static_dir, exist_ok=True)
+        self.barcode_cache = BarcodeCache(self.static_dir)
 
     def generate_barcode(self, product_id: int) -> str:
         """
         Generates a barcode for a product_id. 
-        Returns the filename of the generated barcode image.
-        Format: EAN13 (or Code128 if preferred).
+        Returns the barcode string; the image is rendered on demand by GET /barcodes/{code}.png.
+        """
+        # Id padded to 8 digits: not 12/13, so it always renders as Code128
+        return str(product_id).zfill(8)
+
+    def assign_missing_barcodes(self, session: Session, products: List[Product]) -> List[Product]:
         """
-        # Simple generation using ID padded to 12 digits (EAN13 requires 12 + check digit)
-        # Using Code128 for flexibility with IDs
-        code = barcode.get('code128', str(product_id).zfill(8), writer=ImageWriter())
-        filename = f"product_{product_id}"
-        full_path = os.path.join(self.static_dir, filename)
-        code.save(full_path)
-        return f"{filename}.png"
+        Gives every product without a barcode the same id-based code as generate_barcode,
+        in a single UPDATE. Images are rendered on demand. Does not commit.
+        Returns the products that were updated.
+        """
+        missing = {p.id: str(p.id).zfill(8) for p in products if not p.barcode}
+        if not missing:
+            return []
+        session.execute(
+            update(Product)
+            .where(Product.id.in_(list(missing)))
+            .values(barcode=case(missing, value=Product.id))
+            .execution_options(synchronize_session=False)
+        )
+        updated = [p for p in products if p.id in missing]
+        for p in updated:
+            set_committed_value(p, "barcode", missing[p.id])
+        CatalogService.touch_products(session, missing.keys())
+        return updated
 
-    def process_sale(self, session: Session, user_id: int, items_data: List[dict], payment_method: str = "cash", client_id: Optional[int] = None, amount_paid: Optional[float] = None) -> Sale:
+    def process_sale(self, session: Session, user_id: int, items_data: List[dict], payment_method: str = "cash", client_id: Optional[int] = None, amount_paid: Optional[float] = None, idempotency_key: Optional[str] = None, timestamp: Optional[datetime] = None, commit: bool = True) -> Sale:
         """
         Creates a Sale record and updates product stock.
         If client_id is provided and amount_paid > 0, creates a Payment record.
         items_data expected format: [{"product_id": 1, "quantity": 2}, ...]
+        With commit=False the caller owns the transaction (see process_sale_batch).
+
+        Set-based: one locked IN query for the products, one guarded UPDATE for the
+        stock and one bulk INSERT for the items, regardless of cart size.
         """
-        sale = Sale(user_id=user_id, payment_method=payment_method, client_id=client_id, timestamp=datetime.now())
-        total_sale = 0.0
-        
+        lines = self._parse_lines(items_data, "product_id")
+        products = self._lock_products(session, Product.id, {key for key, _ in lines})
+        missing = [p_id for p_id, _ in lines if p_id not in products]
+        if missing:
+            raise ProductNotFoundError(f"Product {missing[0]} not found")
+        return self._record_sale(session, products, lines, user_id, payment_method, client_id, amount_paid, idempotency_key, timestamp, commit)
+
+    def process_sale_by_barcode(self, session: Session, user_id: int, items_data: List[dict], payment_method: str = "cash", client_id: Optional[int] = None, amount_paid: Optional[float] = None, idempotency_key: Optional[str] = None, timestamp: Optional[datetime] = None, commit: bool = True, reason: str = "sale") -> Sale:
+        """
+        Same engine as process_sale, for scanner-driven flows (picking exit).
+        items_data expected format: [{"barcode": "7790001", "quantity": 2}, ...]
+        All barcodes are resolved in the same single locked IN query.
+        `reason` is recorded on the stock movements (e.g. "picking_exit").
+        """
+        lines = self._parse_lines(items_data, "barcode")
+        by_barcode = self._lock_products(session, Product.barcode, {key for key, _ in lines})
+        missing = sorted({code for code, _ in lines if code not in by_barcode})
+        if missing:
+            raise ProductNotFoundError(f"Producto no encontrado: {', '.join(missing)}")
+        products = {p.id: p for p in by_barcode.values()}
+        id_lines = [(by_barcode[code].id, qty) for code, qty in lines]
+        return self._record_sale(session, products, id_lines, user_id, payment_method, client_id, amount_paid, idempotency_key, timestamp, commit, reason)
+
+    def receive_stock(self, session: Session, user_id: Optional[int], quantities: Dict[int, int], reason: str = "picking_entry", commit: bool = True) -> Dict[int, int]:
+        """
+        Adds stock by appending pending movements only: the product rows are not written,
+        so concurrent receipts of the same SKU never wait on each other. Compaction folds
+        them into the snapshot later. Returns {product_id: available_stock}.
+        """
+        StockLedger.append(session, [
+            {"product_id": p_id, "delta": qty, "reason": reason, "user_id": user_id}
+            for p_id, qty in quantities.items()
+        ])
+        session.flush()
+        available = dict(session.exec(
+            select(Product.id, StockLedger.available_expression())
+            .where(Product.id.in_(list(quantities)))
+        ).all())
+        for p_id, qty in available.items():
+            record_stock_change(session, p_id, qty)
+        if commit:
+            session.commit()
+        return available
+
+    def receive_stock_by_barcode(self, session: Session, user_id: Optional[int], items_data: List[dict], reason: str = "picking_entry", idempotency_key: Optional[str] = None) -> dict:
+        """
+        Batched picking entry. items_data: [{"barcode": "7790001", "quantity": 3}, ...]
+        Repeated barcodes are aggregated, all codes are resolved in one IN query and the
+        known ones are applied in one transaction. Unknown codes and invalid lines are
+        reported, not fatal. With an idempotency_key the result is stored with the
+        movements (see get_picking_batch); a concurrent duplicate fails with IntegrityError.
+        Returns {"received": [...], "unknown": [...], "rejected": [...]}.
+        """
+        if not items_data:
+            raise ValueError("Batch has no items")
+        lines, rejected = [], []
         for item in items_data:
-            p_id = item["product_id"]
-            qty = item["quantity"]
-            
-            product = session.get(Product, p_id)
-            if not product:
-                raise ValueError(f"Product {p_id} not found")
-            
-            if product.stock_quantity < qty:
-                raise ValueError(f"Insufficient stock for {product.name}")
-            
-            # Decrement Stock
-            product.stock_quantity -= qty
-            session.add(product)
-            
-            # Create Sale Item
-            line_total = product.price * qty
-            total_sale += line_total
-            
-            sale_item = SaleItem(
-                product_id=p_id,
-                product_name=product.name,
-                quantity=qty,
-                unit_price=product.price,
-                total=line_total
-            )
-            sale.items.append(sale_item)
-            
-        sale.total_amount = total_sale
+            code, qty = item["barcode"], int(item["quantity"])
+            if not code:
+                rejected.append({"barcode": code, "qty": qty, "detail": "Missing barcode"})
+            elif qty <= 0:
+                rejected.append({"barcode": code, "qty": qty, "detail": f"Invalid quantity for {code}"})
+            else:
+                lines.append((code, qty))
+
+        by_barcode = {
+            p.barcode: p for p in session.exec(
+                select(Product).where(Product.barcode.in_({code for code, _ in lines}))
+            ).all()
+        } if lines else {}
+
+        per_barcode: Dict[str, int] = {}
+        for code, qty in lines:
+            per_barcode[code] = per_barcode.get(code, 0) + qty
+        unknown = sorted(code for code in per_barcode if code not in by_barcode)
+
+        quantities: Dict[int, int] = {}
+        for code, qty in per_barcode.items():
+            if code in by_barcode:
+                p_id = by_barcode[code].id
+                quantities[p_id] = quantities.get(p_id, 0) + qty
+
+        available = self.receive_stock(session, user_id, quantities, reason, commit=False) if quantities else {}
+        received = [
+            {
+                "barcode": code,
+                "product_id": by_barcode[code].id,
+                "name": by_barcode[code].name,
+                "qty": qty,
+                "new_stock": available[by_barcode[code].id],
+            }
+            for code, qty in per_barcode.items() if code in by_barcode
+        ]
+        result = {"received": received, "unknown": unknown, "rejected": rejected}
+        if idempotency_key:
+            session.add(PickingBatch(idempotency_key=idempotency_key, user_id=user_id, result=json.dumps(result)))
+        session.commit()
+        return result
+
+    def get_picking_batch(self, session: Session, idempotency_key: Optional[str]) -> Optional[dict]:
+        """
+        The stored result of an already applied picking entry batch, or None.
+        """
+        if not idempotency_key:
+            return None
+        batch = session.exec(select(PickingBatch).where(PickingBatch.idempotency_key == idempotency_key)).first()
+        return json.loads(batch.result) if batch else None
+
+    def process_sale_batch(self, session: Session, user_id: int, sales_data: List[dict]) -> List[dict]:
+        """
+        Ingests many queued (offline) sales in one transaction. Each sale runs in its own
+        SAVEPOINT, so a stock shortfall only rejects that sale. Already-ingested keys are
+        reported as duplicates. Returns one result per input sale, in order.
+        sales_data: [{"idempotency_key": "...", "items": [...], "client_id", "amount_paid", "payment_method", "timestamp"}]
+        """
+        self._begin_batch_transaction(session)
+        results = []
+        for data in sales_data:
+            key = data.get("idempotency_key")
+            result = {"idempotency_key": key}
+            results.append(result)
+            if not key:
+                result.update(status="error", detail="Missing idempotency_key")
+                continue
+
+            existing = self.get_sale_by_idempotency_key(session, key)
+            if existing:
+                result.update(status="duplicate", sale_id=existing.id)
+                continue
+
+            try:
+                with session.begin_nested():
+                    sale = self.process_sale(
+                        session,
+                        user_id=user_id,
+                        items_data=data.get("items") or [],
+                        payment_method=data.get("payment_method") or "cash",
+                        client_id=data.get("client_id"),
+                        amount_paid=data.get("amount_paid"),
+                        idempotency_key=key,
+                        timestamp=data.get("timestamp"),
+                        commit=False,
+                    )
+                result.update(status="created", sale_id=sale.id)
+            except InsufficientStockError as e:
+                result.update(status="conflict", detail=str(e), shortfall={
+                    "product_id": e.product_id, "product_name": e.product_name,
+                    "requested": e.requested, "available": e.available,
+                })
+            except ValueError as e:
+                result.update(status="error", detail=str(e))
+
+        session.commit()
+        return results
+
+    def _begin_batch_transaction(self, session: Session):
+        # pysqlite defers BEGIN until the first DML, so a SAVEPOINT issued before it would
+        # open (and RELEASE would commit) its own transaction. Start it explicitly.
+        conn = session.connection()
+        if conn.dialect.name == "sqlite" and not conn.connection.dbapi_connection.in_transaction:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    def get_sale_by_idempotency_key(self, session: Session, idempotency_key: Optional[str]) -> Optional[Sale]:
+        if not idempotency_key:
+            return None
+        return session.exec(select(Sale).where(Sale.idempotency_key == idempotency_key)).first()
+
+    def _parse_lines(self, items_data: List[dict], key: str) -> List[Tuple]:
+        lines = [(item[key], int(item["quantity"])) for item in items_data]
+        if not lines:
+            raise ValueError("Sale has no items")
+        for k, qty in lines:
+            if qty <= 0:
+                raise ValueError(f"Invalid quantity for {k}")
+        return lines
+
+    def _record_sale(self, session: Session, products: Dict[int, Product], lines: List[Tuple[int, int]], user_id: int, payment_method: str, client_id: Optional[int], amount_paid: Optional[float], idempotency_key: Optional[str], timestamp: Optional[datetime], commit: bool, reason: str = "sale") -> Sale:
+        # 1. Aggregate per product (the same SKU can be scanned on several lines)
+        quantities = {}
+        for p_id, qty in lines:
+            quantities[p_id] = quantities.get(p_id, 0) + qty
+
+        # Available = snapshot + receipts not compacted yet
+        pending = StockLedger.pending_deltas(session, quantities.keys())
+        for p_id, qty in quantities.items():
+            available = products[p_id].stock_quantity + pending.get(p_id, 0)
+            if available < qty:
+                raise InsufficientStockError(products[p_id], qty, available)
+
+        # 2. Sale header first: a duplicate idempotency key fails here, before touching stock
+        sale = Sale(user_id=user_id, payment_method=payment_method, client_id=client_id, timestamp=timestamp or datetime.now(), idempotency_key=idempotency_key)
+        sale.total_amount = sum(products[p_id].price * qty for p_id, qty in lines)
         session.add(sale)
+        session.flush()  # sale.id for the items
+
+        # 3. Decrement stock atomically
+        new_stock = self._decrement_stock(session, products, quantities, pending)
+
+        session.execute(insert(SaleItem), [
+            {
+                "sale_id": sale.id,
+                "product_id": p_id,
+                "product_name": products[p_id].name,  # Snapshot in case product name changes
+                "quantity": qty,
+                "unit_price": products[p_id].price,
+                "total": products[p_id].price * qty,
+            }
+            for p_id, qty in lines
+        ])
+
+        # The decrement is already in the snapshot, so the movements go in applied
+        StockLedger.append(session, [
+            {"product_id": p_id, "delta": -qty, "reason": reason, "sale_id": sale.id, "user_id": user_id, "applied": True}
+            for p_id, qty in quantities.items()
+        ])
         
         # Handle Payment if Client is selected
         if client_id and amount_paid is not None and amount_paid > 0:
@@ -76,7 +296,63 @@ class StockService:
                 note=f"Pago inmediato en Venta" 
             )
             session.add(payment)
+        
+        # Current account: the sale adds debt, an immediate payment takes it back (one UPDATE)
+        paid = amount_paid if client_id and amount_paid is not None and amount_paid > 0 else 0.0
+        ClientLedger.apply(session, client_id, sale.total_amount - paid)
+        
+        # Re-read in one statement: `pending` may have been folded into the snapshot since
+        for p_id, qty in StockLedger.available_stock(session, [products[p_id] for p_id in new_stock]).items():
+            record_stock_change(session, p_id, qty)
+        # Bump catalog versions so delta clients pick up the new stock
+        CatalogService.touch_products(session, quantities.keys())
+        SalesRollup.record_sale(session, sale)
             
-        session.commit()
-        session.refresh(sale)
+        if commit:
+            session.commit()
+            session.refresh(sale)
+        else:
+            session.flush()
         return sale
+
+    def _lock_products(self, session: Session, column, keys) -> Dict:
+        """
+        Loads the products matching `column IN keys` with SELECT ... FOR UPDATE (ignored on SQLite),
+        keyed by that column. Ordered by id so concurrent sales always lock rows in the same order.
+        """
+        stmt = (
+            select(Product)
+            .where(column.in_(list(keys)))
+            .order_by(Product.id)
+            .with_for_update()
+        )
+        return {getattr(p, column.key): p for p in session.exec(stmt).all()}
+
+    def _decrement_stock(self, session: Session, products: Dict[int, Product], quantities: Dict[int, int], pending: Dict[int, int]) -> Dict[int, int]:
+        """
+        UPDATE product SET stock_quantity = stock_quantity - q WHERE id IN (...) AND stock_quantity + pending >= q,
+        as a single statement. The guard keeps available stock from going negative even where the
+        row lock is not available (SQLite). Returns {product_id: new_snapshot}.
+        """
+        qty_case = case(quantities, value=Product.id, else_=0)
+        stmt = (
+            update(Product)
+            .where(Product.id.in_(list(quantities)))
+            .where(StockLedger.available_expression() >= qty_case)
+            .values(stock_quantity=Product.stock_quantity - qty_case)
+            .returning(Product.id, Product.stock_quantity)
+            .execution_options(synchronize_session=False)
+        )
+        new_stock = {row.id: row.stock_quantity for row in session.execute(stmt)}
+
+        short = [p_id for p_id in quantities if p_id not in new_stock]
+        if short:
+            # Lost a race for the last units. Part of the batch may be applied:
+            # the caller's transaction must be rolled back (never committed).
+            p_id = short[0]
+            raise InsufficientStockError(products[p_id], quantities[p_id], products[p_id].stock_quantity + pending.get(p_id, 0))
+
+        # Keep loaded instances consistent with the Core UPDATE
+        for p_id, qty in new_stock.items():
+            set_committed_value(products[p_id], "stock_quantity", qty)
+        return new_stock
@@ -0,0 +1,68 @@
+// Offline storage for the POS (IndexedDB)
+// - outbox:  completed carts waiting to be uploaded (keyed by idempotency key)
+// - catalog: local product snapshot kept fresh through /api/products/changes
+// - meta:    small key/value store (catalog version)
+
+const OfflineStore = (() => {
+    const DB_NAME = 'nexpos-pos';
+    const DB_VERSION = 1;
+    let dbPromise = null;
+
+    function open() {
+        if (!window.indexedDB) return Promise.reject(new Error('IndexedDB no disponible'));
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const req = indexedDB.open(DB_NAME, DB_VERSION);
+                req.onupgradeneeded = () => {
+                    const db = req.result;
+                    if (!db.objectStoreNames.contains('outbox')) db.createObjectStore('outbox', { keyPath: 'idempotency_key' });
+                    if (!db.objectStoreNames.contains('catalog')) db.createObjectStore('catalog', { keyPath: 'id' });
+                    if (!db.objectStoreNames.contains('meta')) db.createObjectStore('meta');
+                };
+                req.onsuccess = () => resolve(req.result);
+                req.onerror = () => reject(req.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    // Runs fn(store(s)) inside one transaction and resolves when it completes
+    async function tx(storeNames, mode, fn) {
+        const db = await open();
+        return new Promise((resolve, reject) => {
+            const t = db.transaction(storeNames, mode);
+            const stores = Array.isArray(storeNames) ? storeNames.map(n => t.objectStore(n)) : t.objectStore(storeNames);
+            let result;
+            const req = fn(stores);
+            if (req && 'onsuccess' in req) req.onsuccess = () => { result = req.result; };
+            t.oncomplete = () => resolve(result);
+            t.onerror = () => reject(t.error);
+            t.onabort = () => reject(t.error);
+        });
+    }
+
+    return {
+        // --- Outbox ---
+        enqueueSale: (sale) => tx('outbox', 'readwrite', s => s.put(sale)),
+        pendingSales: () => tx('outbox', 'readonly', s => s.getAll()),
+        removeSale: (key) => tx('outbox', 'readwrite', s => s.delete(key)),
+
+        // --- Catalog snapshot ---
+        // deleted: tombstones ({id, version}) from /api/products/changes
+        putProducts: (products, deleted = [], version = null) => tx(['catalog', 'meta'], 'readwrite', ([catalog, meta]) => {
+            products.forEach(p => catalog.put(p));
+            // A tombstone only wins over a row that is not newer than it (ids can be reused);
+            // requests run in order, so the get sees the puts above
+            deleted.forEach(d => {
+                const req = catalog.get(d.id);
+                req.onsuccess = () => {
+                    const stored = req.result;
+                    if (stored && (stored.version || 0) <= d.version) catalog.delete(d.id);
+                };
+            });
+            if (version !== null) meta.put(version, 'catalogVersion');
+        }),
+        getCatalogVersion: () => tx('meta', 'readonly', s => s.get('catalogVersion')),
+        allProducts: () => tx('catalog', 'readonly', s => s.getAll()),
+    };
+})();
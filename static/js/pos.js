@@ -1,12 +1,267 @@
 let cart = [];
-let allProducts = []; // Expose globally
+let allProducts = []; // Products currently shown (last search page), exposed globally
 let allClients = [];
 
-document.addEventListener('DOMContentLoaded', async () => {
-    // Load Products
-    const res = await fetch('/api/products');
-    allProducts = await res.json();
+// Server-side search state
+let searchSeq = 0;          // Ignore responses that arrive out of order
+let searchTimer = null;
+let nextCursor = null;
+let currentTerm = '';
+let catalogVersion = null;  // Catalog version the shown products are fresh as of
+
+async function fetchSearch(term, cursor = null) {
+    const params = new URLSearchParams({ q: term, limit: 40 });
+    if (cursor) params.set('cursor', cursor);
+    let res = null;
+    try {
+        res = await fetch('/api/products/search?' + params.toString());
+    } catch (err) {
+        res = null; // Network error
+    }
+    if (res && res.ok) return res.json();
+    if ((res && res.status < 500) || cursor) throw new Error('Search failed');
+    // Server unreachable: search the local catalog snapshot instead
+    return searchOffline(term);
+}
+
+async function searchOffline(term) {
+    const products = await OfflineStore.allProducts();
+    const exact = products.find(p => p.barcode === term);
+    if (exact) return { items: [exact], next_cursor: null, exact: true, version: catalogVersion };
+    const words = term.toLowerCase().split(/\s+/).filter(Boolean);
+    const items = products
+        .filter(p => words.every(w => p.name.toLowerCase().includes(w) || (p.barcode || '').toLowerCase().includes(w)))
+        .sort((a, b) => a.name.localeCompare(b.name))
+        .slice(0, 40);
+    return { items, next_cursor: null, exact: false, version: catalogVersion };
+}
+
+// Runs a search and renders it. Returns the response (or null if superseded).
+function searchProducts(term) {
+    const seq = ++searchSeq;
+    currentTerm = term;
+    return fetchSearch(term).then(data => {
+        if (seq !== searchSeq) return null;
+        allProducts = data.items;
+        nextCursor = data.next_cursor;
+        catalogVersion = data.version;
+        renderProducts(allProducts);
+        return data;
+    }).catch(err => {
+        console.error("Error searching products:", err);
+        return null;
+    });
+}
+
+async function loadMoreProducts() {
+    if (!nextCursor) return;
+    const seq = searchSeq;
+    const data = await fetchSearch(currentTerm, nextCursor);
+    if (seq !== searchSeq) return;
+    allProducts = allProducts.concat(data.items);
+    nextCursor = data.next_cursor;
+    renderProducts(allProducts);
+}
+
+// Pull only what changed since catalogVersion and patch the shown products in place
+async function syncCatalog() {
+    if (catalogVersion === null) return;
+    let since = catalogVersion;
+    let afterId = 0;
+    let more = true;
+    while (more) {
+        const res = await fetch(`/api/products/changes?since=${since}&after_id=${afterId}`);
+        if (!res.ok) return;
+        const data = await res.json();
+        applyCatalogChanges(data.products, data.deleted);
+        since = data.version;
+        afterId = data.after_id;
+        more = data.has_more;
+    }
+    catalogVersion = since;
+    renderProducts(allProducts);
+}
+
+function applyCatalogChanges(products, deleted) {
+    const index = new Map(allProducts.map((p, i) => [p.id, i]));
+    products.forEach(p => {
+        const i = index.get(p.id);
+        if (i !== undefined) allProducts[i] = p;
+    });
+    // A tombstone only wins over a row that is not newer than it (ids can be reused)
+    const gone = new Set(deleted
+        .filter(d => {
+            const i = index.get(d.id);
+            return i !== undefined && (allProducts[i].version || 0) <= d.version;
+        })
+        .map(d => d.id));
+    if (gone.size > 0) allProducts = allProducts.filter(p => !gone.has(p.id));
+}
+
+// --- Offline support: local catalog snapshot + queued sales ---
+
+// Keeps the IndexedDB snapshot current: full download once, deltas afterwards.
+// One refresh at a time, so catalogVersion is never written out of order.
+let refreshingSnapshot = false;
+
+async function refreshCatalogSnapshot() {
+    if (refreshingSnapshot) return;
+    refreshingSnapshot = true;
+    try {
+        let since = await OfflineStore.getCatalogVersion();
+        let afterId = 0;
+        let more = true;
+        while (more) {
+            const params = new URLSearchParams({ after_id: afterId });
+            if (since !== undefined && since !== null) params.set('since', since);
+            const res = await fetch('/api/products/changes?' + params.toString());
+            if (!res.ok) return;
+            const data = await res.json();
+            more = data.has_more;
+            await OfflineStore.putProducts(data.products, data.deleted, more ? null : data.version);
+            since = data.version;
+            afterId = data.after_id;
+        }
+    } catch (err) {
+        console.warn("Catalog snapshot not refreshed:", err);
+    } finally {
+        refreshingSnapshot = false;
+    }
+}
+
+async function queueSaleOffline(salesData, key) {
+    await OfflineStore.enqueueSale({
+        ...salesData,
+        idempotency_key: key,
+        timestamp: new Date().toISOString(),
+        status: 'pending'
+    });
+}
+
+// Uploads the queued sales in chunks the server accepts (max 500 per request)
+const OUTBOX_CHUNK = 500;
+// Failed uploads in a row before the cashier is told (the server may just be restarting)
+const OUTBOX_FAILURES_SHOWN = 3;
+let flushing = false;
+let outboxFailures = 0;
+
+async function flushOutbox() {
+    if (flushing || !navigator.onLine) return;
+    flushing = true;
+    let queued = [];
+    let sent = 0;
+    try {
+        queued = (await OfflineStore.pendingSales()).filter(s => s.status === 'pending');
+        if (queued.length === 0) {
+            setOutboxFailure(null, 0);
+            return;
+        }
+
+        const problems = [];
+        for (; sent < queued.length; sent += OUTBOX_CHUNK) {
+            const chunk = queued.slice(sent, sent + OUTBOX_CHUNK);
+            const res = await fetch('/api/sales/batch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    sales: chunk.map(({ status, detail, ...sale }) => sale)
+                })
+            });
+            if (!res.ok) {
+                // Keep the rest queued (idempotency keys make the resend safe) and try again later
+                let detail = `HTTP ${res.status}`;
+                try {
+                    const body = await res.json();
+                    if (body.detail) detail += ` - ${body.detail}`;
+                } catch (e) { /* not JSON (proxy error page) */ }
+                throw new Error(detail);
+            }
+            const data = await res.json();
+
+            for (let i = 0; i < data.results.length; i++) {
+                const result = data.results[i];
+                if (result.status === 'created' || result.status === 'duplicate') {
+                    await OfflineStore.removeSale(result.idempotency_key);
+                } else {
+                    // Stock shortfall or invalid sale: keep it for review, stop resending
+                    await OfflineStore.enqueueSale({ ...chunk[i], status: result.status, detail: result.detail });
+                    problems.push(result.detail);
+                }
+            }
+        }
+        setOutboxFailure(null, 0);
+        if (problems.length > 0) {
+            alert('Algunas ventas sin conexión no se pudieron registrar:\n' + problems.join('\n'));
+        }
+        syncCatalog();
+    } catch (err) {
+        console.warn("Outbox not flushed:", err);
+        setOutboxFailure(err.message, queued.length - sent);
+        if (sent > 0) syncCatalog();
+    } finally {
+        flushing = false;
+    }
+}
+
+// Persistent banner while queued sales can't be uploaded; cleared by the next successful flush
+function setOutboxFailure(message, pending) {
+    outboxFailures = message === null ? 0 : outboxFailures + 1;
+    const box = document.getElementById('outbox-status');
+    if (!box) return;
+    if (outboxFailures < OUTBOX_FAILURES_SHOWN) {
+        if (outboxFailures === 0) box.style.display = 'none';
+        return;
+    }
+    document.getElementById('outbox-status-text').textContent =
+        `${pending} venta(s) sin conexión pendientes de envío: ${message}. Se reintentará automáticamente.`;
+    box.style.display = 'flex';
+}
 
+// Live stock updates from other tills / picking (Server-Sent Events)
+let stockStream = null;
+let renderPending = false;
+
+function connectStockStream() {
+    if (!window.EventSource) return;
+    stockStream = new EventSource('/api/stream/stock');
+    let reconnecting = false;
+
+    stockStream.addEventListener('stock', (e) => {
+        const ev = JSON.parse(e.data);
+        const product = allProducts.find(p => p.id === ev.product_id);
+        if (!product) return;
+        product.stock_quantity = ev.stock_quantity;
+        // Coalesce bursts (e.g. a big picking exit) into one render
+        if (!renderPending) {
+            renderPending = true;
+            requestAnimationFrame(() => {
+                renderPending = false;
+                renderProducts(allProducts);
+            });
+        }
+    });
+
+    stockStream.addEventListener('open', () => {
+        // Events may have been missed while disconnected (or dropped for being slow)
+        if (reconnecting) syncCatalog();
+        reconnecting = true;
+    });
+}
+
+// Exact barcode lookup (scanner). Resolves to the product or null.
+async function lookupBarcode(code) {
+    const data = await fetchSearch(code.trim());
+    return data.exact ? data.items[0] : null;
+}
+
+function resetSearch() {
+    const input = document.getElementById('product-search');
+    input.value = '';
+    searchProducts('');
+    input.focus();
+}
+
+document.addEventListener('DOMContentLoaded', async () => {
     // Load Clients
     try {
         const resClients = await fetch('/api/clients');
@@ -28,26 +283,28 @@ document.addEventListener('DOMContentLoaded', async () => {
         console.error("Error loading clients:", err);
     }
 
-    // ... logic continues ...
-    renderProducts(allProducts);
+    // First page of products (no full catalog download)
+    searchProducts('');
+    connectStockStream();
+
+    // Offline support runs in the background
+    refreshCatalogSnapshot();
+    flushOutbox();
+    window.addEventListener('online', flushOutbox);
+    setInterval(() => { flushOutbox(); refreshCatalogSnapshot(); }, 30000);
 
-    // Filter products
+    // Filter products (debounced, server-side)
     document.getElementById('product-search').addEventListener('input', (e) => {
-        const term = e.target.value.toLowerCase();
-        const filtered = allProducts.filter(p =>
-            p.name.toLowerCase().includes(term) ||
-            (p.barcode && p.barcode.includes(term))
-        );
-        renderProducts(filtered);
-
-        // Auto-add if exact barcode match
-        const exactMatch = allProducts.find(p => p.barcode === term);
-        if (exactMatch) {
-            addToCart(exactMatch);
-            e.target.value = ''; // Clear for next scan
-            renderProducts(allProducts);
-            document.getElementById('product-search').focus();
-        }
+        const term = e.target.value.trim();
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(async () => {
+            const data = await searchProducts(term);
+            // Auto-add if exact barcode match
+            if (data && data.exact && e.target.value.trim() === term) {
+                addToCart(data.items[0]);
+                resetSearch();
+            }
+        }, 150);
     });
 
     // Handle Enter on Quantity Input -> Focus Search
@@ -62,33 +319,19 @@ document.addEventListener('DOMContentLoaded', async () => {
     }
 
     // Handle Enter on Product Search -> Add First Result if any
-    document.getElementById('product-search').addEventListener('keydown', (e) => {
+    document.getElementById('product-search').addEventListener('keydown', async (e) => {
         if (e.key === 'Enter') {
             e.preventDefault();
-            const term = e.target.value.toLowerCase();
+            const term = e.target.value.trim();
             // If empty, do nothing
             if (!term) return;
 
-            // Check if exact match exists (already handled by input, but safe to double check)
-            const exact = allProducts.find(p => p.barcode === term);
-            if (exact) {
-                // Input handler might have caught it, but if not:
-                addToCart(exact);
-                e.target.value = '';
-                renderProducts(allProducts);
-                return;
-            }
-
-            // Otherwise pick first visible result
-            const filtered = allProducts.filter(p =>
-                p.name.toLowerCase().includes(term) ||
-                (p.barcode && p.barcode.includes(term))
-            );
-
-            if (filtered.length > 0) {
-                addToCart(filtered[0]);
-                e.target.value = '';
-                renderProducts(allProducts);
+            // Scanners send Enter right after the code: search now instead of waiting for the debounce
+            clearTimeout(searchTimer);
+            const data = await searchProducts(term);
+            if (data && data.items.length > 0) {
+                addToCart(data.items[0]);
+                resetSearch();
             }
         }
     });
@@ -103,13 +346,19 @@ function renderProducts(products) {
             <div style="color: var(--primary-color); font-weight: 700;">$${p.price}</div>
             <div style="font-size: 0.8rem; color: #666;">Stock: ${p.stock_quantity}</div>
         </div>
-    `).join('');
+    `).join('') + (nextCursor ? `
+        <div onclick="loadMoreProducts()"
+             style="cursor: pointer; padding: 12px; border: 1px dashed rgba(0,0,0,0.2); border-radius: 8px; text-align: center; color: #666;">
+            Ver más...
+        </div>` : '');
 }
 
 function addToCart(product) {
     const qtyInput = document.getElementById('pos-qty');
     const qty = parseInt(qtyInput.value) || 1;
 
+    pendingSaleKey = null; // Different cart, different sale
+
     const existing = cart.find(item => item.product_id === product.id);
     if (existing) {
         existing.quantity += qty;
@@ -150,9 +399,35 @@ function updateCart() {
 
 function removeFromCart(id) {
     cart = cart.filter(i => i.product_id !== id);
+    pendingSaleKey = null; // Different cart, different sale
     updateCart();
 }
 
+// Idempotency: one key per cart, reused by every retry of that cart
+let pendingSaleKey = null;
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
+// Retries network errors and 5xx with backoff; safe because the server dedupes by key
+async function postSale(salesData, key, attempts = 5) {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const res = await fetch('/api/sales', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+                body: JSON.stringify(salesData)
+            });
+            if (res.status < 500 || attempt >= attempts - 1) return res;
+        } catch (e) {
+            if (attempt >= attempts - 1) throw e;
+        }
+        await new Promise(r => setTimeout(r, Math.min(250 * 2 ** attempt, 4000)));
+    }
+}
+
 function checkout() {
     if (cart.length === 0) return alert("El carrito está vacío");
 
@@ -201,15 +476,30 @@ async function confirmCheckout() {
     btn.disabled = true;
     btn.innerText = "Procesando...";
 
+    if (!pendingSaleKey) pendingSaleKey = newIdempotencyKey();
+
     try {
-        const res = await fetch('/api/sales', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(salesData)
-        });
+        let res = null;
+        try {
+            if (navigator.onLine) res = await postSale(salesData, pendingSaleKey);
+        } catch (networkErr) {
+            console.warn("Sale not sent, queueing offline:", networkErr);
+        }
+
+        if (!res || res.status >= 500) {
+            // Server unreachable: keep selling, upload later in one batch
+            await queueSaleOffline(salesData, pendingSaleKey);
+            pendingSaleKey = null;
+            closePaymentModal();
+            alert('Sin conexión: la venta quedó guardada y se enviará automáticamente.');
+            cart = [];
+            updateCart();
+            return;
+        }
 
         if (res.ok) {
             const sale = await res.json();
+            pendingSaleKey = null;
 
             closePaymentModal();
 
@@ -221,10 +511,8 @@ async function confirmCheckout() {
             cart = [];
             updateCart();
 
-            // Reload products to update stock
-            const pRes = await fetch('/api/products');
-            allProducts = await pRes.json();
-            renderProducts(allProducts);
+            // Pull stock deltas instead of reloading products
+            syncCatalog();
         } else {
             const err = await res.json();
             alert('Error: ' + err.detail);
@@ -0,0 +1,185 @@
+import gzip
+import hashlib
+import io
+import json
+import uuid
+from datetime import date
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from database.models import Client, Payment, Product, Sale, SaleItem, SalesDailyRollup, Settings, StockMovement
+from services.backup import DatabaseBackup, DatabaseRestore
+
+
+def test_stream_covers_every_table_with_manifest(engine, session):
+    session.add_all([Settings(), Client(name="Ana"), Product(name="Ojota", barcode="A1", price=10)])
+    session.commit()
+    sale = Sale(total_amount=10, client_id=1)
+    session.add(sale)
+    session.commit()
+    session.add(SaleItem(sale_id=sale.id, product_id=1, product_name="Ojota", quantity=1, unit_price=10, total=10))
+    session.commit()
+
+    # Incompressible names: enough output to be streamed in several chunks
+    session.add_all([Product(name=uuid.uuid4().hex, barcode=f"B{i}") for i in range(3000)])
+    session.commit()
+
+    chunks = list(DatabaseBackup.stream(engine))
+    assert len(chunks) > 1
+
+    lines = gzip.decompress(b"".join(chunks)).splitlines(keepends=True)
+    header, manifest = json.loads(lines[0])["_backup"], json.loads(lines[-1])["_manifest"]
+    assert set(header["tables"]) == {t.name for t in DatabaseBackup.tables()}
+    assert header["tables"].index("sale") < header["tables"].index("saleitem")
+
+    sections, current = {}, None
+    for line in lines[1:-1]:
+        record = json.loads(line)
+        if "_table" in record:
+            current = sections.setdefault(record["_table"], [])
+        else:
+            current.append(line)
+    for table, info in manifest["tables"].items():
+        assert info["rows"] == len(sections[table])
+        assert info["sha256"] == hashlib.sha256(b"".join(sections[table])).hexdigest()
+
+    assert manifest["tables"]["saleitem"]["rows"] == 1
+    sale_row = json.loads(sections["sale"][0])
+    assert sale_row["client_id"] == 1 and sale_row["timestamp"].startswith("20")
+
+
+@pytest.fixture
+def target():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def backup(engine, since=None) -> bytes:
+    return b"".join(DatabaseBackup.stream(engine, since=since))
+
+
+def dump(engine) -> dict:
+    with engine.connect() as connection:
+        return {t.name: connection.execute(select(t).order_by(*t.primary_key.columns)).all() for t in DatabaseBackup.tables()}
+
+
+def seed(session):
+    session.add_all([
+        Settings(), Client(name="Ana"), Client(name="Beto"),
+        Product(name="Ojota", barcode="A1", price=10, stock_quantity=3),
+        SalesDailyRollup(day=date(2024, 5, 1), payment_method="cash", sale_count=1, total=10),
+    ])
+    session.commit()
+    session.add(Sale(id=1, total_amount=10, client_id=1))
+    session.add(SaleItem(sale_id=1, product_id=1, product_name="Ojota", quantity=1, unit_price=10, total=10))
+    session.add(StockMovement(product_id=1, delta=-1, reason="sale", sale_id=1))
+    session.commit()
+
+
+def test_full_restore_replaces_tables(engine, session, target):
+    seed(session)
+    with Session(target) as other:
+        other.add(Product(name="Viejo", barcode="OLD"))
+        other.commit()
+
+    result = DatabaseRestore.restore(target, io.BytesIO(backup(engine)))
+
+    assert not result["incremental"] and result["tables"]["saleitem"] == 1
+    assert dump(target) == dump(engine)
+    with Session(target) as other:  # ids keep counting after the restored ones
+        other.add(Client(name="Nuevo"))
+        other.commit()
+        assert other.exec(select(Client.id).where(Client.name == "Nuevo")).one() == 3
+
+
+def test_incremental_ships_new_history_and_applies_on_base(engine, session, target):
+    seed(session)
+    full = backup(engine)
+    since = DatabaseBackup.read_manifest(io.BytesIO(full))["watermarks"]
+    assert since["sale"] == 1 and since["stockmovement"] == 0  # movement 1 still pending
+
+    # New history, a settled movement, an edited and a deleted client
+    session.add(Sale(id=2, total_amount=5, client_id=1))
+    session.add(Payment(client_id=1, amount=5))
+    session.exec(select(StockMovement)).one().applied = True
+    session.get(Client, 1).balance = 15
+    session.delete(session.get(Client, 2))
+    session.commit()
+
+    incremental = backup(engine, since=since)
+    rows = [json.loads(line) for line in gzip.decompress(incremental).splitlines()]
+    sale_section = rows.index({"_table": "sale", "columns": list(Sale.__table__.columns.keys()), "mode": "append", "after": 1})
+    assert rows[sale_section + 1]["id"] == 2 and "_table" in rows[sale_section + 2]
+
+    DatabaseRestore.restore(target, io.BytesIO(full))
+    result = DatabaseRestore.restore(target, io.BytesIO(incremental))
+
+    assert result["incremental"] and result["tables"]["sale"] == 1
+    assert result["pruned"] == {"client": 1}
+    assert dump(target) == dump(engine)
+
+
+def test_incremental_needs_its_base(engine, session, target):
+    seed(session)
+    since = DatabaseBackup.read_manifest(io.BytesIO(backup(engine)))["watermarks"]
+    session.add(Sale(id=2, total_amount=5))
+    session.commit()
+
+    with pytest.raises(ValueError, match="base backup"):
+        DatabaseRestore.restore(target, io.BytesIO(backup(engine, since=since)))
+
+
+def test_bad_backup_leaves_database_untouched(engine, session, target):
+    seed(session)
+    with Session(target) as other:
+        other.add(Product(name="Viejo", barcode="OLD"))
+        other.commit()
+    before = dump(target)
+
+    lines = gzip.decompress(backup(engine)).splitlines(keepends=True)
+    with pytest.raises(ValueError, match="truncated"):
+        DatabaseRestore.restore(target, io.BytesIO(gzip.compress(b"".join(lines[:-1]))))
+    tampered = b"".join(lines).replace(b'"Ojota"', b'"Ojotas"', 1)
+    with pytest.raises(ValueError, match="manifest"):
+        DatabaseRestore.restore(target, io.BytesIO(gzip.compress(tampered)))
+
+    assert dump(target) == before
+
+
+def test_watermark_waits_for_ids_still_in_flight(tmp_path, target, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'shop.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        seed(session)
+
+    # Postgres hands out ids at insert time: id 3 is committed, while id 2 belongs to a
+    # transaction that only commits after the backup's snapshot
+    with Session(engine) as session:
+        session.add(Sale(id=3, total_amount=3))
+        session.commit()
+    late = engine.connect()
+    late.begin()
+    late.execute(Sale.__table__.insert().values(id=2, total_amount=2))
+    # What Postgres reports for that snapshot (SQLite has a single writer)
+    monkeypatch.setattr(DatabaseBackup, "_writers_in_flight", staticmethod(lambda connection: True))
+
+    full = backup(engine)
+    late.commit()
+    late.close()
+    since = DatabaseBackup.read_manifest(io.BytesIO(full))["watermarks"]
+    assert since["sale"] == 1  # not 3: id 2 may still appear
+
+    incremental = backup(engine, since=since)
+    DatabaseRestore.restore(target, io.BytesIO(full))
+    DatabaseRestore.restore(target, io.BytesIO(incremental))  # id 3 again: upserted
+    assert [row.id for row in dump(target)["sale"]] == [1, 2, 3]
+    assert dump(target) == dump(engine)
+
+    # Nothing in flight: gaps are permanent and the watermark moves to the top
+    monkeypatch.setattr(DatabaseBackup, "_writers_in_flight", staticmethod(lambda connection: False))
+    assert DatabaseBackup.read_manifest(io.BytesIO(backup(engine, since=since)))["watermarks"]["sale"] == 3
+    engine.dispose()
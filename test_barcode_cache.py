@@ -0,0 +1,73 @@
+import os
+import threading
+
+import pytest
+
+from services.barcode_cache import BarcodeCache
+
+
+def test_renders_once_then_serves_from_lru_and_disk(tmp_path):
+    cache = BarcodeCache(str(tmp_path))
+
+    first = cache.get_png("ABC-123")
+    assert first.startswith(b"\x89PNG") and cache.misses == 1
+    assert cache.get_png("ABC-123") == first and cache.misses == 1
+
+    # A fresh process only has the disk store
+    cold = BarcodeCache(str(tmp_path))
+    assert cold.ensure_file("ABC-123") == cache.filename("code128", "ABC-123")
+    assert cold.get_png("ABC-123") == first and cold.misses == 0
+
+    # Writer options are part of the key
+    assert cache.filename("code128", "ABC-123", {"module_height": 8}) != cache.filename("code128", "ABC-123")
+
+
+def test_symbology_and_concurrent_writes(tmp_path):
+    assert BarcodeCache.resolve_symbology("7791234567898") == "ean13"
+    assert BarcodeCache.resolve_symbology("7791234567890") == "code128"  # bad check digit
+    assert BarcodeCache.resolve_symbology("210 NEGRO") == "code128"
+
+    cache = BarcodeCache(str(tmp_path), max_entries=2)
+    threads = [threading.Thread(target=cache.get_png, args=("SAME",)) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert sorted(os.listdir(tmp_path)) == [cache.filename("code128", "SAME")]  # no temp files left
+
+
+def test_batch_render_on_process_pool(tmp_path):
+    cache = BarcodeCache(str(tmp_path))
+    cache.start_pool(max_workers=2)
+    cache.ensure_file("A-1")
+    try:
+        names = cache.ensure_files(["A-1", "B-2", "779123456789", "B-2"], parallel_threshold=0)
+        # The pool outlives the batch
+        assert cache.ensure_files(["C-3"], parallel_threshold=0) == {"C-3": cache.filename("code128", "C-3")}
+    finally:
+        cache.shutdown_pool()
+
+    assert list(names) == ["A-1", "B-2", "779123456789"]
+    assert names["779123456789"] == cache.filename("ean13", "779123456789")
+    assert cache.misses == 4  # A-1 once, then only the new codes
+    assert sorted(os.listdir(tmp_path)) == sorted([*names.values(), cache.filename("code128", "C-3")])
+
+
+def test_svg_renders_without_pil_and_has_its_own_key(tmp_path):
+    cache = BarcodeCache(str(tmp_path))
+    svg = cache.get("210 NEGRO", fmt="svg")
+
+    assert b"<svg" in svg
+    assert cache.filename("code128", "210 NEGRO", fmt="svg").endswith(".svg")
+    assert cache.key("code128", "210 NEGRO", fmt="svg") != cache.key("code128", "210 NEGRO")
+
+
+def test_validation_and_unpersisted_codes(tmp_path):
+    cache = BarcodeCache(str(tmp_path), max_entries=2)
+    for code, symbology in (("", "code128"), ("X" * 49, "code128"), ("ñandú", "code128"), ("12345", "ean13")):
+        with pytest.raises(ValueError):
+            cache.validate(code, symbology)
+    cache.validate("210 NEGRO", "code128")
+
+    # Codes that aren't product barcodes are served from the LRU, never written to disk
+    data = cache.get("NOT-A-PRODUCT", persist=False)
+    assert data.startswith(b"\x89PNG") and os.listdir(tmp_path) == []
+    assert cache.get("NOT-A-PRODUCT", persist=False) == data and cache.misses == 1
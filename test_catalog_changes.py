@@ -0,0 +1,137 @@
+from datetime import datetime
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from database.models import CatalogVersionLease, Product
+from services.catalog_service import CatalogService
+from services.stock_service import StockService
+
+
+def test_changes_feed_returns_only_deltas_and_tombstones(session, tmp_path):
+    CatalogService.ensure_sequence(session)
+    a, b, c = Product(name="A", barcode="A1", stock_quantity=10), Product(name="B", barcode="B1", stock_quantity=10), Product(name="C", barcode="C1")
+    session.add_all([a, b, c])
+    session.flush()
+    CatalogService.touch_products(session, [a.id, b.id, c.id])
+    session.commit()
+
+    snapshot = CatalogService.changes_since(session)
+    assert {p.name for p in snapshot["products"]} == {"A", "B", "C"}
+    since = snapshot["version"]
+    assert CatalogService.changes_since(session, since=since)["products"] == []
+
+    StockService(static_dir=str(tmp_path)).process_sale(session, user_id=None, items_data=[{"product_id": a.id, "quantity": 3}])
+    c_id = c.id
+    session.delete(c)
+    CatalogService.record_deletion(session, c_id)
+    session.commit()
+
+    delta = CatalogService.changes_since(session, since=since)
+    assert [(p.name, p.stock_quantity) for p in delta["products"]] == [("A", 7)]
+    assert [d["id"] for d in delta["deleted"]] == [c_id]
+    assert delta["version"] > since
+
+
+def test_changes_feed_pages_within_one_version(session):
+    products = [Product(name=f"P{i}", barcode=f"P{i}") for i in range(5)]
+    session.add_all(products)
+    session.flush()
+    CatalogService.touch_products(session, [p.id for p in products])
+    session.commit()
+
+    seen, since, after_id = [], 0, 0
+    while True:
+        page = CatalogService.changes_since(session, since=since, after_id=after_id, limit=2)
+        seen.extend(p.id for p in page["products"])
+        since, after_id = page["version"], page["after_id"]
+        if not page["has_more"]:
+            break
+    assert seen == [p.id for p in products]
+
+
+@pytest.fixture
+def leased_engine(tmp_path, monkeypatch):
+    # The Postgres path, on a file database so the lease gets a connection of its own
+    monkeypatch.setattr(CatalogService, "LEASED_DIALECTS", ("sqlite",))
+    engine = create_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_leased_version_is_held_back_until_commit(leased_engine):
+    with Session(leased_engine) as setup:
+        product = Product(name="A", barcode="A1")
+        setup.add(product)
+        setup.commit()
+        pid = product.id
+
+    with Session(leased_engine) as writer, Session(leased_engine) as reader:
+        version = CatalogService.touch_products(writer, [pid])
+        # The counter is already committed, the product change is not
+        assert CatalogService.touch_products(writer, [pid]) == version
+        assert CatalogService.current_version(reader) == version - 1
+        assert CatalogService.changes_since(reader, since=0)["products"] == []
+        writer.commit()
+
+        assert CatalogService.current_version(reader) == version
+        page = CatalogService.changes_since(reader, since=0)
+        assert [p.id for p in page["products"]] == [pid] and page["version"] == version
+        assert reader.exec(select(CatalogVersionLease)).all() == []
+
+
+def test_rolled_back_and_abandoned_leases_are_released(leased_engine):
+    with Session(leased_engine) as writer:
+        first = CatalogService.next_version(writer)
+        writer.rollback()
+    with Session(leased_engine) as writer:
+        second = CatalogService.next_version(writer)
+    # Closed without commit as well
+    with Session(leased_engine) as reader:
+        assert second == first + 1
+        assert reader.exec(select(CatalogVersionLease)).all() == []
+        assert CatalogService.current_version(reader) == second
+
+        # A lease left by a dead process stops holding the feed back after LEASE_TTL
+        third = CatalogService._lease(leased_engine)
+        assert CatalogService.current_version(reader) == second
+        lease = reader.get(CatalogVersionLease, third)
+        lease.created_at = datetime.utcnow() - CatalogService.LEASE_TTL * 2
+        reader.add(lease)
+        reader.commit()
+        assert CatalogService.current_version(reader) == third
+
+
+def test_lease_survives_rolled_back_savepoint_and_ends_with_the_batch(leased_engine, tmp_path, monkeypatch):
+    from services.sales_rollup import SalesRollup
+
+    with Session(leased_engine) as setup:
+        product = Product(name="A", barcode="A1", price=10, stock_quantity=10)
+        setup.add(product)
+        setup.commit()
+        pid = product.id
+
+    # The second sale fails after its product touch: its savepoint rolls back, the batch commits
+    record_sale = SalesRollup.record_sale
+    calls = []
+
+    def failing_second(session, sale):
+        calls.append(sale)
+        if len(calls) == 2:
+            raise ValueError("rollup failed")
+        record_sale(session, sale)
+
+    monkeypatch.setattr(SalesRollup, "record_sale", staticmethod(failing_second))
+    sales = [{"idempotency_key": key, "items": [{"product_id": pid, "quantity": 1}]} for key in ("s1", "s2")]
+    with Session(leased_engine) as session:
+        # SQLite only: lease before the batch takes the single write lock (Postgres has no such limit)
+        version = CatalogService.next_version(session)
+        results = StockService(static_dir=str(tmp_path)).process_sale_batch(session, user_id=None, sales_data=sales)
+    assert [r["status"] for r in results] == ["created", "error"]
+
+    with Session(leased_engine) as reader:
+        assert reader.exec(select(CatalogVersionLease)).all() == []
+        assert CatalogService.current_version(reader) == version
+        page = CatalogService.changes_since(reader, since=version - 1)
+        assert [(p.id, p.version, p.stock_quantity) for p in page["products"]] == [(pid, version, 9)]
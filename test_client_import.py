@@ -0,0 +1,30 @@
+import pytest
+from sqlmodel import select
+
+from database.models import Client
+from services.client_import import ClientImporter
+
+pd = pytest.importorskip("pandas")
+
+
+def test_dedupes_on_folded_name_and_cuit_and_maps_extended_fields(tmp_path, session):
+    session.add_all([Client(name="José Pérez"), Client(name="Otro", cuit="20-12345678-9")])
+    session.commit()
+
+    path = tmp_path / "clientes.xlsx"
+    pd.DataFrame({
+        "Nombre": ["  JOSE  perez", "Ana", "ana", "Beto", "Carla", None],
+        "CUIT": [None, "27-1-2", None, 20123456789, "30111", "1"],
+        "Razón Social": [None, "Ana SRL", None, None, "Carla SA", None],
+        "IVA": [None, "Responsable Inscripto", None, None, "Monotributo", None],
+        "Phone": [None, 1155551234, None, None, None, None],
+        "Transporte": [None, "Expreso Sur", None, None, None, None],
+    }).to_excel(path, index=False)
+
+    report = ClientImporter.run(session, path, user_id=None, chunk_size=2)
+
+    assert (report["added"], report["skipped"], report["errors"]) == (2, 3, [])
+    ana = session.exec(select(Client).where(Client.name == "Ana")).one()
+    assert (ana.cuit, ana.razon_social, ana.iva_category, ana.phone, ana.transport_name) == ("27-1-2", "Ana SRL", "Responsable Inscripto", "1155551234", "Expreso Sur")
+    assert ana.balance == 0
+    assert sorted(session.exec(select(Client.name)).all()) == ["Ana", "Carla", "José Pérez", "Otro"]
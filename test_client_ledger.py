@@ -0,0 +1,34 @@
+from sqlmodel import select
+
+from database.models import Client, Product, Payment
+from services.client_ledger import ClientLedger
+from services.stock_service import StockService
+
+
+def test_balance_follows_sales_and_payments(tmp_path, session):
+    service = StockService(static_dir=str(tmp_path / "barcodes"))
+    client, other = Client(name="Ana"), Client(name="Beto")
+    product = Product(name="A", barcode="A1", price=100, stock_quantity=10)
+    session.add_all([client, other, product])
+    session.commit()
+
+    service.process_sale(session, user_id=None, items_data=[{"product_id": product.id, "quantity": 3}], client_id=client.id, amount_paid=50)
+    ClientLedger.register_payment(session, client.id, 100)
+    session.commit()
+
+    session.refresh(client)
+    assert client.balance == 150
+    assert ClientLedger.computed_balances(session) == {client.id: 150}
+    assert ClientLedger.verify(session) == []
+
+
+def test_verify_rebuilds_drifted_balances(session):
+    client = Client(name="Ana", balance=999)
+    session.add(client)
+    session.commit()
+    session.add(Payment(client_id=client.id, amount=20))
+    session.commit()
+
+    assert ClientLedger.verify(session, fix=True) == [{"client_id": client.id, "balance": 999, "expected": -20}]
+    assert session.exec(select(Client.balance)).one() == -20
+    assert ClientLedger.verify(session) == []
@@ -0,0 +1,46 @@
+from datetime import date, datetime
+
+from database.models import Client, Payment, Sale
+from services.client_statement import ClientStatement
+
+
+def _history(session):
+    client, other = Client(name="Ana"), Client(name="Beto")
+    session.add_all([client, other])
+    session.commit()
+    session.add_all([
+        Sale(id=1, client_id=client.id, total_amount=100, timestamp=datetime(2024, 1, 1, 10)),
+        Sale(id=2, client_id=client.id, total_amount=50, timestamp=datetime(2024, 2, 1, 9)),
+        Payment(client_id=client.id, amount=30, date=datetime(2024, 1, 1, 10), note="efectivo"),
+        Payment(client_id=client.id, amount=20, date=datetime(2024, 3, 1, 12)),
+        Sale(id=3, client_id=other.id, total_amount=999, timestamp=datetime(2024, 2, 1, 9)),
+    ])
+    session.commit()
+    return client
+
+
+def test_running_balance_and_keyset_pages(session):
+    client = _history(session)
+
+    first = ClientStatement.page(session, client.id, limit=3)
+    assert [(m["description"], m["balance"]) for m in first["items"]] == [
+        ("Abono: ", 100), ("Venta #2", 120), ("Abono: efectivo", 70),
+    ]
+    assert first["next_cursor"]
+
+    rest = ClientStatement.page(session, client.id, cursor=first["next_cursor"], limit=3)
+    assert [(m["type"], m["debit"], m["balance"]) for m in rest["items"]] == [("sale", 100, 100)]
+    assert rest["next_cursor"] is None
+
+
+def test_date_filter_keeps_balance_from_earlier_history(session, engine):
+    client = _history(session)
+
+    page = ClientStatement.page(session, client.id, date_from=date(2024, 2, 1), date_to=date(2024, 2, 1))
+    assert [(m["id"], m["balance"]) for m in page["items"]] == [(2, 120)]
+
+    csv_text = "".join(ClientStatement.stream_csv(engine, client.id, date_from=date(2024, 2, 1)))
+    assert csv_text.splitlines()[1:] == ["2024-02-01 09:00,Venta #2,50.0,,120.0", "2024-03-01 12:00,Abono: ,,20.0,100.0"]
+
+    pdf = b"".join(ClientStatement.stream_pdf(engine, client.id))
+    assert pdf.startswith(b"%PDF-1.4") and b"/Count 1" in pdf
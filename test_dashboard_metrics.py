@@ -0,0 +1,33 @@
+from database.models import Product
+from services.dashboard_metrics import dashboard_metrics as metrics
+from services.stock_service import StockService
+
+
+def test_cached_until_a_relevant_commit(tmp_path, session):
+    service = StockService(static_dir=str(tmp_path / "barcodes"))
+    product = Product(name="A", barcode="A1", price=10, stock_quantity=1, min_stock_level=5)
+    session.add(product)
+    session.commit()
+    product_id = product.id
+
+    metrics.invalidate()
+    misses = metrics.misses
+    assert metrics.get(session)["low_stock"] == 1
+    assert metrics.get(session)["low_stock"] == 1
+    assert metrics.misses == misses + 1
+
+    # Work that is rolled back never invalidates
+    service.receive_stock(session, None, {product_id: 10}, commit=False)
+    session.rollback()
+    metrics.get(session)
+    assert metrics.misses == misses + 1
+
+    # Picking receipt (pending movements only) counts once committed
+    service.receive_stock(session, None, {product_id: 10})
+    assert metrics.get(session)["low_stock"] == 0
+
+    service.process_sale(session, user_id=None, items_data=[{"product_id": product_id, "quantity": 2}])
+    figures = metrics.get(session)
+    assert figures["today_sales_total"] == 20
+    assert [s["total_amount"] for s in figures["recent_sales"]] == [20]
+    assert metrics.misses == misses + 3
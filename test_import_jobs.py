@@ -0,0 +1,68 @@
+import io
+import os
+from datetime import datetime
+
+import pytest
+from sqlmodel import select
+
+from database.models import ImportJob, Product
+from services.import_jobs import ImportJobRunner
+from services.product_import import ProductImporter
+
+pytest.importorskip("pandas")
+
+
+def test_job_imports_csv_in_chunks_and_reports_progress(tmp_path, engine, session):
+    runner = ImportJobRunner(engine, str(tmp_path / "uploads"), handlers={
+        "products": lambda s, path, user_id, progress: ProductImporter.run(s, path, user_id, chunk_size=2, progress=progress),
+    })
+    csv = "Name,Barcode,Price,Stock\nA,0001,10,1\nB,0002,x,1\nC,0003,5,2\nD,,7,0\nE,0001,11,\n"
+
+    job = runner.submit(session, "products", io.BytesIO(csv.encode()), "lista.csv", user_id=None)
+    assert job.total_rows == 5
+    runner.shutdown(wait=True)
+
+    session.expire_all()
+    job = ImportJobRunner.to_dict(session.get(ImportJob, job.id))
+    assert (job["status"], job["processed_rows"], job["percent"]) == ("done", 5, 100)
+    assert (job["added"], job["updated"], job["error_count"]) == (3, 1, 1)
+    assert job["errors"] == ["Row 1: invalid Price 'x'"]
+    assert {"read_ms", "normalize_ms", "lookup_ms", "write_ms", "total_ms"} <= set(job["timing"])
+    assert os.listdir(tmp_path / "uploads") == []
+
+    # CSV cells are text: leading zeros survive
+    assert {"0001", "0003"} <= set(session.exec(select(Product.barcode)).all())
+    assert session.exec(select(Product.price).where(Product.barcode == "0001")).one() == 11
+
+
+def test_rejects_unknown_file_types(tmp_path, engine, session):
+    runner = ImportJobRunner(engine, str(tmp_path), handlers={"products": ProductImporter.run})
+    with pytest.raises(ValueError):
+        runner.submit(session, "products", io.BytesIO(b"x"), "lista.pdf", user_id=None)
+    runner.shutdown()
+
+
+def test_recover_only_fails_jobs_without_a_live_owner(tmp_path, engine, session):
+    other = ImportJobRunner(engine, str(tmp_path), handlers={})
+    restarted = ImportJobRunner(engine, str(tmp_path), handlers={})
+    now = datetime.utcnow()
+    live = ImportJob(kind="products", filename="a.csv", path="a", status="running", owner=other.owner, heartbeat_at=now)
+    dead = ImportJob(kind="products", filename="b.csv", path="b", status="queued", owner="gone", heartbeat_at=now - ImportJobRunner.STALE_AFTER * 2)
+    legacy = ImportJob(kind="products", filename="c.csv", path="c", status="running")  # from before heartbeats
+    session.add_all([live, dead, legacy])
+    session.commit()
+
+    # Another worker starting up (rolling deploy) leaves the live job alone
+    assert restarted.recover() == 2
+    session.expire_all()
+    assert [session.get(ImportJob, j.id).status for j in (live, dead, legacy)] == ["running", "failed", "failed"]
+
+    # Once its owner stops beating, it goes too
+    job = session.get(ImportJob, live.id)
+    job.heartbeat_at = now - ImportJobRunner.STALE_AFTER * 2
+    session.add(job)
+    session.commit()
+    other.heartbeat()  # still beating: the owner refreshes it
+    assert restarted.recover() == 0
+    other.shutdown()
+    restarted.shutdown()
@@ -0,0 +1,23 @@
+from services.barcode_cache import BarcodeCache
+from services.label_pdf import LabelPdfWriter
+
+
+def test_each_label_drawn_once_and_stamped_per_copy(tmp_path):
+    writer = LabelPdfWriter(BarcodeCache(str(tmp_path)))
+    labels = [({"name": "Ojota (lisa)", "price": 1750, "barcode": "210 NEGRO"}, 2000), ({"name": "B", "price": 5, "barcode": "7791234567898"}, 2)]
+
+    chunks = list(writer.stream(labels))
+    pdf = b"".join(chunks)
+
+    assert len(chunks) > 1  # streamed, not built in one piece
+    assert pdf.startswith(b"%PDF-1.4") and pdf.rstrip().endswith(b"%%EOF")
+    assert pdf.count(b"/Type /Page ") == 2002
+    assert pdf.count(b"/Subtype /Image") == 2
+    assert b"/Count 2002" in pdf
+
+    # xref offsets point at their objects
+    xref_at = int(pdf.rsplit(b"startxref\n", 1)[1].split(b"\n")[0])
+    entries = pdf[xref_at:].split(b"\n")[3:]
+    for number, entry in enumerate(entries[:10], start=1):
+        offset = int(entry[:10])
+        assert pdf[offset:].startswith(b"%d 0 obj" % number)
@@ -0,0 +1,73 @@
+import io
+
+import pytest
+from sqlmodel import select
+
+from database.models import Client, Product, StockMovement
+from services.legacy_migration import LegacyMigration
+from services.mysql_dump import MysqlDump
+
+DUMP = """/*!40101 SET NAMES utf8 */;
+CREATE TABLE `producto` (
+  `id` int(9) NOT NULL AUTO_INCREMENT,
+  `codigo` varchar(50) DEFAULT NULL,
+  `nombre` varchar(255) DEFAULT NULL,
+  `precioventa` float DEFAULT NULL,
+  `stock` int(9) DEFAULT NULL,
+  `especificaciones` text,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='stock; precios';
+
+INSERT  INTO `cliente`(`id`,`nombre`,`descuento`,`habilitado`) VALUES (1,'Cliente Contado','0',1),(2,'O\\'Higgins (sucursal), \\"Sur\\"','0',1),
+(3,'JOSÉ  perez','0',1),(4,'José Pérez','10',1);
+INSERT INTO `iva` VALUES (1,'Sin Impuesto (0%)',0,1);
+INSERT INTO `producto` VALUES (1,'A1','Ojota ''Playa''',100.5,3,'línea 1\\nlínea 2; (talle 40)'),(2,'A2','Zueco',NULL,NULL,NULL),
+(3,'A1','Repetida',1,1,NULL),(4,NULL,'Sin código',1,1,NULL),(5,'A5','Mal precio','abc',1,NULL),(6,'OLD','Ya existe',1,1,NULL);
+"""
+
+
+@pytest.mark.parametrize("read_size", [MysqlDump.READ_SIZE, 7])
+def test_tokenizer_handles_escapes_nulls_and_block_boundaries(monkeypatch, read_size):
+    monkeypatch.setattr(MysqlDump, "READ_SIZE", read_size)
+
+    rows = list(MysqlDump.rows(io.StringIO(DUMP)))
+
+    assert [t for t, _, _ in rows] == ["cliente"] * 4 + ["iva"] + ["producto"] * 6
+    assert rows[1][2] == ["2", 'O\'Higgins (sucursal), "Sur"', "0", "1"]
+    assert rows[4][2] == ["1", "Sin Impuesto (0%)", "0", "1"]
+    # No column list: names come from CREATE TABLE
+    table, columns, values = rows[5]
+    assert columns == ["id", "codigo", "nombre", "precioventa", "stock", "especificaciones"]
+    assert values == ["1", "A1", "Ojota 'Playa'", "100.5", "3", "línea 1\nlínea 2; (talle 40)"]
+    assert rows[6][2] == ["2", "A2", "Zueco", None, None, None]
+
+
+def test_tokenizer_rejects_truncated_dump():
+    with pytest.raises(ValueError):
+        list(MysqlDump.rows(io.StringIO("INSERT INTO `cliente` VALUES (1,'sin cerrar")))
+
+
+def test_migration_dedupes_against_database_and_dump(session):
+    session.add_all([Client(name="Cliente Contado"), Product(name="Vieja", barcode="OLD")])
+    session.commit()
+
+    result = LegacyMigration.run(session, io.StringIO(DUMP), batch_size=1)
+
+    assert (result["clients"], result["products"], result["skipped"]) == (2, 2, 4)
+    assert result["error_count"] == 2 and "Producto 4" in result["errors"][0] and "precioventa" in result["errors"][1]
+    assert sorted(session.exec(select(Client.name)).all()) == ["Cliente Contado", "JOSÉ  perez", 'O\'Higgins (sucursal), "Sur"']
+
+    ojota = session.exec(select(Product).where(Product.barcode == "A1")).one()
+    assert (ojota.name, ojota.price, ojota.stock_quantity, ojota.min_stock_level) == ("Ojota 'Playa'", 100.5, 3, 5)
+    assert ojota.version > 0
+    opening = session.exec(select(StockMovement).where(StockMovement.product_id == ojota.id)).one()
+    assert (opening.delta, opening.reason, opening.applied) == (3, "opening", True)
+
+    # Re-running the same dump changes nothing
+    again = LegacyMigration.run(session, io.StringIO(DUMP))
+    assert (again["clients"], again["products"]) == (0, 0)
+
+
+def test_migrates_shipped_legacy_dump(session):
+    result = LegacyMigration.run(session, "legacy_data/dump.sql")
+    assert (result["clients"], result["products"], result["error_count"]) == (1, 0, 0)
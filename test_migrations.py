@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from database import migrations
+
+
+@pytest.fixture
+def blank(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'nexpos.db'}")
+    yield engine
+    engine.dispose()
+
+
+def test_fresh_database_gets_schema_and_version(blank):
+    applied = migrations.migrate(blank)
+
+    assert applied == [m.name for m in migrations.MIGRATIONS]
+    assert migrations.current_version(blank) == migrations.latest_version()
+    tables = set(inspect(blank).get_table_names())
+    assert {"product", "sale", "stockmovement", "import_job", "schema_version", "product_fts"} <= tables
+    # Second deploy: nothing to do, and the startup check is a no-op
+    assert migrations.migrate(blank) == []
+    assert migrations.ensure_current(blank, auto_migrate=False) == []
+
+
+def test_upgrades_pre_migration_database(blank):
+    # Shape of a first-generation database, before the v5 columns and indexes
+    with blank.begin() as conn:
+        conn.execute(text("CREATE TABLE product (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, barcode VARCHAR NOT NULL UNIQUE, "
+                          "description VARCHAR, price FLOAT, cost_price FLOAT, stock_quantity INTEGER, min_stock_level INTEGER, "
+                          "image_url VARCHAR, curve_quantity INTEGER)"))
+        conn.execute(text("CREATE TABLE client (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, phone VARCHAR, email VARCHAR, "
+                          "address VARCHAR, notes VARCHAR, credit_limit FLOAT)"))
+        conn.execute(text("CREATE TABLE sale (id INTEGER PRIMARY KEY, timestamp DATETIME, total_amount FLOAT, payment_method VARCHAR, "
+                          "user_id INTEGER, client_id INTEGER)"))
+        conn.execute(text("INSERT INTO client (id, name) VALUES (1, 'Ana')"))
+        conn.execute(text("INSERT INTO sale (id, timestamp, total_amount, payment_method, client_id) VALUES (1, '2024-05-01 10:00:00', 150, 'cuenta', 1)"))
+
+    with pytest.raises(RuntimeError, match="migrate_schema"):
+        migrations.ensure_current(blank, auto_migrate=False)
+    migrations.ensure_current(blank, auto_migrate=True)
+
+    inspector = inspect(blank)
+    assert {"category", "version", "updated_at"} <= {c["name"] for c in inspector.get_columns("product")}
+    assert "ix_sale_client_id" in {i["name"] for i in inspector.get_indexes("sale")}
+    assert "payment" in inspector.get_table_names()
+    with blank.connect() as conn:
+        assert conn.execute(text("SELECT balance FROM client WHERE id = 1")).scalar() == 150
+        recorded = conn.execute(text("SELECT version, name FROM schema_version ORDER BY version")).all()
+    assert [tuple(r) for r in recorded] == [(m.version, m.name) for m in migrations.MIGRATIONS]
+
+
+def test_only_pending_migrations_run(blank, monkeypatch):
+    migrations.migrate(blank)
+    calls = []
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [
+        migrations.Migration(99, "add note", lambda conn: calls.append(migrations.add_column(conn, "tax", "note", "TEXT"))),
+    ])
+
+    assert migrations.ensure_current(blank, auto_migrate=True) == ["add note"]
+    assert migrations.migrate(blank) == []
+    assert calls == [True]
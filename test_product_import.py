@@ -0,0 +1,44 @@
+import pytest
+from sqlmodel import select
+
+from database.models import Product, StockMovement
+from services.product_import import ProductImporter
+from services.stock_ledger import StockLedger
+
+pd = pytest.importorskip("pandas")
+
+
+def test_bulk_upsert_keeps_report_and_ledger(tmp_path, session):
+    existing = Product(name="Ojota", barcode="7791234567898", price=10, stock_quantity=3, category="Calzado")
+    session.add(existing)
+    session.flush()
+    StockLedger.append(session, [{"product_id": existing.id, "delta": 3, "reason": "opening", "applied": True}])
+    session.commit()
+
+    path = tmp_path / "lista.xlsx"
+    pd.DataFrame({
+        "Name": ["Ojota nueva", "Zapatilla", None, "Bota", "Sin codigo", "Zapatilla"],
+        "Barcode": [7791234567898, "Z-1", "X", "B-1", None, "Z-1"],
+        "Price": [12.5, 30, 1, "caro", 5, 31],
+        "Stock": [8, 2, 1, 1, 4, None],
+        "Category": [None, "Deportivo", None, None, None, "Deportivo"],
+    }).to_excel(path, index=False)
+
+    report = ProductImporter.run(session, path, user_id=None)
+
+    assert (report["added"], report["updated"]) == (2, 2)
+    assert report["errors"] == ["Row 3: invalid Price 'caro'"]
+    assert set(report["timing"]) == {"read_ms", "normalize_ms", "lookup_ms", "write_ms", "total_ms"}
+
+    products = {p.name: p for p in session.exec(select(Product)).all()}
+    # Existing product: price updated, name and category kept, stock set through the ledger
+    ojota = products["Ojota"]
+    assert (ojota.price, ojota.category, ojota.stock_quantity) == (12.5, "Calzado", 8)
+    assert products["Zapatilla"].price == 31 and products["Zapatilla"].stock_quantity == 0
+    assert products["Sin codigo"].barcode == str(products["Sin codigo"].id).zfill(8)
+    assert products["Sin codigo"].stock_quantity == 4
+    assert all(p.version > 0 for p in products.values())
+
+    movements = session.exec(select(StockMovement.product_id, StockMovement.delta)).all()
+    assert sorted(movements) == sorted([(ojota.id, 3), (ojota.id, 5), (products["Sin codigo"].id, 4)])
+    assert StockLedger.reconcile(session) == []
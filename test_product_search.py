@@ -0,0 +1,69 @@
+import pytest
+
+from database.models import Product
+from services.search_service import ProductSearchService
+
+
+@pytest.fixture
+def search(engine, session):
+    service = ProductSearchService()
+    service.ensure_indexes(engine)
+    session.add_all([
+        Product(name="Ojota lisa", barcode="210 NEGRO", price=1750),
+        Product(name="Ojota faja lisa", barcode="7059 NEGRO", price=4200),
+        Product(name="Gomones", barcode="128BB ROSA", price=3500),
+        Product(name="Faja", barcode="795 NEGRO", price=5500),
+        Product(name="Sandalia velcro", barcode="417BLANCO", price=13000),
+        Product(name="Entrededo", barcode="401/6", price=3000),
+    ])
+    session.commit()
+    return service
+
+
+def test_exact_barcode_fast_path(search, session):
+    result = search.search(session, "7059 NEGRO")
+    assert result["exact"] is True
+    assert [p.name for p in result["items"]] == ["Ojota faja lisa"]
+
+
+def test_name_prefix_ranks_before_substring(search, session):
+    result = search.search(session, "faja")
+    assert [p.name for p in result["items"]] == ["Faja", "Ojota faja lisa"]
+
+
+def test_all_terms_must_match(search, session):
+    result = search.search(session, "ojota lisa negro")
+    assert {p.name for p in result["items"]} == {"Ojota lisa", "Ojota faja lisa"}
+    assert search.search(session, "ojota rosa")["items"] == []
+
+
+def test_short_terms_and_fts_sync(search, session):
+    product = session.get(Product, 3)
+    product.name = "Gomon BB"
+    session.add(product)
+    session.commit()
+    assert [p.name for p in search.search(session, "gomon bb")["items"]] == ["Gomon BB"]
+    assert search.search(session, "gomones")["items"] == []
+
+
+def test_cursor_pagination_walks_every_row(search, session):
+    seen = []
+    cursor = None
+    while True:
+        page = search.search(session, "", limit=4, cursor=cursor)
+        seen.extend(p.id for p in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(seen) == [1, 2, 3, 4, 5, 6]
+    assert len(seen) == len(set(seen))
+
+
+def test_like_fallback_without_fts(session, search):
+    search.fts_enabled = False
+    assert {p.name for p in search.search(session, "NEGRO")["items"]} == {"Ojota lisa", "Ojota faja lisa", "Faja"}
+
+
+def test_invalid_cursor(search, session):
+    with pytest.raises(ValueError):
+        search.search(session, "x", cursor="not-a-cursor")
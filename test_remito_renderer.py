@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from fastapi.templating import Jinja2Templates
+
+from database.models import Client, Product, Settings
+from services.remito_renderer import RemitoRenderer
+from services.stock_service import StockService
+
+
+def test_remitos_rendered_once_and_batched(tmp_path, session):
+    service = StockService(static_dir=str(tmp_path / "barcodes"))
+    client = Client(name="Ana", address="Calle 1")
+    product = Product(name="Ojota", barcode="A1", price=10, stock_quantity=10)
+    session.add_all([client, product])
+    session.commit()
+    first = service.process_sale(session, user_id=None, items_data=[{"product_id": product.id, "quantity": 2}], client_id=client.id)
+    second = service.process_sale(session, user_id=None, items_data=[{"product_id": product.id, "quantity": 1}])
+
+    renderer = RemitoRenderer(Jinja2Templates(directory="templates").env, max_entries=1)
+    settings = Settings(company_name="NexPos")
+    html = renderer.render_page(session, [first.id], settings)
+    assert "REMITO #%06d" % first.id in html and "Calle 1" in html and "$20.00" in html
+    assert renderer.render_page(session, [first.id], settings) == html
+    assert (renderer.hits, renderer.misses) == (1, 1)
+
+    batch = renderer.render_page(session, [second.id, first.id, 999], settings)
+    assert batch.count('<div class="remito">') == 2
+    assert batch.index("REMITO #%06d" % second.id) < batch.index("REMITO #%06d" % first.id)
+    assert renderer.render_page(session, [999], settings) is None
+
+    # A different company header is a different cache entry
+    assert "Otra" in renderer.render_page(session, [first.id], Settings(company_name="Otra"))
+
+
+def test_client_edit_misses_cached_remito_in_every_worker(tmp_path, session):
+    service = StockService(static_dir=str(tmp_path / "barcodes"))
+    client = Client(name="Ana", address="Calle 1")
+    product = Product(name="Ojota", barcode="A1", price=10, stock_quantity=10)
+    session.add_all([client, product])
+    session.commit()
+    sale = service.process_sale(session, user_id=None, items_data=[{"product_id": product.id, "quantity": 1}], client_id=client.id)
+
+    env = Jinja2Templates(directory="templates").env
+    settings = Settings(company_name="NexPos")
+    workers = [RemitoRenderer(env), RemitoRenderer(env)]
+    assert all("Calle 1" in w.render_page(session, [sale.id], settings) for w in workers)
+
+    # Edited through one worker: no clear() reaches the other, the client stamp does
+    client.address = "Calle 2"
+    client.updated_at = datetime.utcnow()
+    session.add(client)
+    session.commit()
+    assert all("Calle 2" in w.render_page(session, [sale.id], settings) for w in workers)
+    assert [w.misses for w in workers] == [2, 2]
@@ -0,0 +1,62 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlmodel import SQLModel, Session, create_engine, select, func
+
+from database.models import Product, SaleItem
+from services.stock_service import StockService
+
+STOCK = 60
+ATTEMPTS = 150
+WORKERS = 16
+
+
+@pytest.fixture
+def file_engine(tmp_path):
+    # Real file + separate connections: concurrent writers actually contend
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'concurrency.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+        pool_size=WORKERS,
+    )
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_parallel_sales_never_oversell(file_engine, tmp_path):
+    service = StockService(static_dir=str(tmp_path / "barcodes"))
+    with Session(file_engine) as session:
+        hot, other = Product(name="Hot SKU", barcode="HOT", price=10, stock_quantity=STOCK), Product(name="Other", barcode="OTHER", price=5, stock_quantity=10_000)
+        session.add_all([hot, other])
+        session.commit()
+        hot_id, other_id = hot.id, other.id
+
+    def sell(_):
+        with Session(file_engine) as session:
+            try:
+                service.process_sale(session, user_id=None, items_data=[
+                    {"product_id": other_id, "quantity": 1},
+                    {"product_id": hot_id, "quantity": 1},
+                ])
+                return True
+            except ValueError:
+                return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(sell, range(ATTEMPTS)))
+    elapsed = time.perf_counter() - started
+
+    sold = sum(results)
+    print(f"\n{ATTEMPTS} concurrent sales ({WORKERS} workers) in {elapsed:.2f}s -> {ATTEMPTS / elapsed:.0f} sales/s")
+
+    with Session(file_engine) as session:
+        assert sold == STOCK
+        assert session.get(Product, hot_id).stock_quantity == 0
+        # Rejected sales must not leave partial writes behind
+        assert session.get(Product, other_id).stock_quantity == 10_000 - STOCK
+        hot_items = session.exec(select(func.sum(SaleItem.quantity)).where(SaleItem.product_id == hot_id)).one()
+        assert hot_items == STOCK
+    assert elapsed < 30
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from database.models import Product, SalesDailyRollup
+from services.sales_rollup import SalesRollup
+from services.stock_service import StockService
+
+
+def test_rollup_is_maintained_per_sale_and_matches_rebuild(tmp_path, session):
+    service = StockService(static_dir=str(tmp_path / "barcodes"))
+    product = Product(name="A", barcode="A1", price=10, stock_quantity=100)
+    session.add(product)
+    session.commit()
+
+    day1, day2 = datetime(2026, 3, 1, 12, 0), datetime(2026, 3, 2, 12, 0)
+    for ts, method, qty in [(day1, "cash", 1), (day1, "card", 2), (day1, "cash", 3), (day2, "cash", 1)]:
+        service.process_sale(session, user_id=None, items_data=[{"product_id": product.id, "quantity": qty}], payment_method=method, timestamp=ts)
+
+    daily = SalesRollup.daily(session)
+    assert [(d["date"], d["count"], d["total"]) for d in daily] == [
+        (SalesRollup.store_day(day2).isoformat(), 1, 10.0),
+        (SalesRollup.store_day(day1).isoformat(), 3, 60.0),
+    ]
+    assert daily[1]["by_method"] == {"cash": 40.0, "card": 20.0}
+
+    maintained = sorted((r.day, r.payment_method, r.sale_count, r.total) for r in session.exec(select(SalesDailyRollup)).all())
+    assert SalesRollup.rebuild(session) == 3
+    assert sorted((r.day, r.payment_method, r.sale_count, r.total) for r in session.exec(select(SalesDailyRollup)).all()) == maintained
+
+
+def test_rebuild_locks_out_sales_until_it_commits(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rollup.db'}", connect_args={"timeout": 0.1})
+    SQLModel.metadata.create_all(engine)
+    service = StockService(static_dir=str(tmp_path / "barcodes"))
+    with Session(engine) as session:
+        product = Product(name="A", barcode="A1", price=10, stock_quantity=100)
+        session.add(product)
+        session.commit()
+        service.process_sale(session, user_id=None, items_data=[{"product_id": product.id, "quantity": 1}])
+        pid = product.id
+
+    # A sale arriving between the scan and the rewrite must wait instead of being overwritten
+    blocked = []
+    with Session(engine) as session:
+        @event.listens_for(session, "do_orm_execute")
+        def sale_before_delete(state):
+            if state.is_delete and not blocked:
+                with Session(engine) as other:
+                    try:
+                        service.process_sale(other, user_id=None, items_data=[{"product_id": pid, "quantity": 1}])
+                        blocked.append(False)
+                    except OperationalError:
+                        blocked.append(True)
+
+        assert SalesRollup.rebuild(session) == 1
+    assert blocked == [True]
+    engine.dispose()
@@ -0,0 +1,45 @@
+import asyncio
+
+from database.models import Product
+from services.stock_events import StockBroadcaster, stock_broadcaster, record_stock_change
+
+
+def test_slow_subscriber_is_dropped_without_blocking_others():
+    async def scenario():
+        broadcaster = StockBroadcaster(queue_size=2)
+        fast, slow = broadcaster.subscribe(), broadcaster.subscribe()
+        received = []
+        for qty in (9, 8, 7):
+            broadcaster.publish([{"product_id": 1, "stock_quantity": qty}])
+            await asyncio.sleep(0)
+            received.append(fast.queue.get_nowait()["stock_quantity"])  # fast client keeps up
+        return broadcaster, fast, slow, received
+
+    broadcaster, fast, slow, received = asyncio.run(scenario())
+    assert received == [9, 8, 7]
+    assert not fast.dropped
+    assert slow.dropped
+    assert broadcaster.subscriber_count == 1
+
+
+def test_events_publish_only_after_commit(session):
+    async def scenario():
+        sub = stock_broadcaster.subscribe()
+        try:
+            product = Product(name="A", barcode="A1", stock_quantity=5)
+            session.add(product)
+            session.commit()
+
+            record_stock_change(session, product.id, 4)
+            session.rollback()
+            await asyncio.sleep(0)
+            assert sub.queue.empty()
+
+            record_stock_change(session, product.id, 3)
+            session.commit()
+            await asyncio.sleep(0)
+            return sub.queue.get_nowait()
+        finally:
+            stock_broadcaster.unsubscribe(sub)
+
+    assert asyncio.run(scenario()) == {"product_id": 1, "stock_quantity": 3}
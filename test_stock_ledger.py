@@ -0,0 +1,129 @@
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from database.models import Product, StockMovement
+from services.catalog_service import CatalogService
+import services.stock_service as stock_service
+from services.stock_ledger import StockLedger
+from services.stock_service import StockService, InsufficientStockError
+
+
+@pytest.fixture
+def service(tmp_path):
+    return StockService(static_dir=str(tmp_path / "barcodes"))
+
+
+def test_receipts_are_pending_until_compacted(service, session):
+    product = Product(name="A", barcode="A1", price=10, stock_quantity=2)
+    session.add(product)
+    session.commit()
+
+    available = service.receive_stock(session, None, {product.id: 5})
+    assert available == {product.id: 7}
+    session.refresh(product)
+    assert product.stock_quantity == 2  # row untouched, only the ledger grew
+
+    # Pending receipts count towards what can be sold
+    service.process_sale(session, user_id=None, items_data=[{"product_id": product.id, "quantity": 6}])
+    with pytest.raises(InsufficientStockError) as exc:
+        service.process_sale(session, user_id=None, items_data=[{"product_id": product.id, "quantity": 2}])
+    assert exc.value.available == 1
+    session.rollback()
+
+    assert StockLedger.compact(session) == 1
+    session.refresh(product)
+    assert product.stock_quantity == 1
+    assert StockLedger.pending_deltas(session, [product.id]) == {}
+    # The initial 2 units predate the ledger: reconcile reports them
+    assert StockLedger.reconcile(session) == [{"product_id": product.id, "snapshot": 1, "ledger": -1}]
+
+
+def test_reconcile_records_opening_and_drift(service, session):
+    a = Product(name="A", barcode="A1", stock_quantity=4)
+    b = Product(name="B", barcode="B1", stock_quantity=0)
+    session.add_all([a, b])
+    session.commit()
+
+    drifts = StockLedger.reconcile(session, fix=True)
+    assert drifts == [{"product_id": a.id, "snapshot": 4, "ledger": 0}]
+    assert StockLedger.reconcile(session) == []
+
+    service.process_sale(session, user_id=None, items_data=[{"product_id": a.id, "quantity": 3}])
+    assert StockLedger.reconcile(session) == []
+
+    history = StockLedger.history(session, a.id)
+    assert [(m.reason, m.delta, m.applied) for m in history] == [("sale", -3, True), ("opening", 4, True)]
+    assert history[0].sale_id is not None
+
+    # Out-of-band edit to the snapshot shows up as drift
+    session.get(Product, a.id).stock_quantity = 10
+    session.commit()
+    assert StockLedger.reconcile(session, fix=True) == [{"product_id": a.id, "snapshot": 10, "ledger": 1}]
+    fix = session.exec(select(StockMovement).order_by(StockMovement.id.desc())).first()
+    assert (fix.reason, fix.delta) == ("reconciliation", 9)
+
+
+def test_edit_form_keeps_pending_receipts(service, engine):
+    with Session(engine) as session:
+        product = Product(name="A", barcode="A1", price=10, stock_quantity=10)
+        session.add(product)
+        session.commit()
+        pid = product.id
+        service.receive_stock(session, None, {pid: 5})
+
+    # Products page / API: the edit form is pre-filled with available stock
+    with Session(engine) as session:
+        shown = StockLedger.show_available(session, session.exec(select(Product)).all())
+        assert [p.stock_quantity for p in shown] == [15]
+        assert [p.stock_quantity for p in CatalogService.changes_since(session)["products"]] == [15]
+
+    # Saving the form unchanged (other fields edited) must not cancel the pending receipt
+    with Session(engine) as session:
+        product = session.get(Product, pid)
+        product.price = 12
+        StockLedger.set_stock(session, product, shown[0].stock_quantity, "adjustment")
+        session.commit()
+        assert StockLedger.available_stock(session, [product]) == {pid: 15}
+
+        StockLedger.compact(session)
+        session.refresh(product)
+        assert product.stock_quantity == 15
+
+
+def test_available_stock_survives_compaction_between_reads(service, tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ledger.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        product = Product(name="A", barcode="A1", price=10, stock_quantity=10)
+        session.add(product)
+        session.commit()
+        pid = product.id
+        service.receive_stock(session, None, {pid: 5})
+
+    def compact():
+        with Session(engine) as other:
+            assert StockLedger.compact(other) == 1
+
+    # Page: the product was loaded before the receipt was folded into its snapshot
+    with Session(engine) as session:
+        product = session.get(Product, pid)
+        compact()
+        assert [p.stock_quantity for p in StockLedger.show_available(session, [product])] == [15]
+
+    with Session(engine) as session:
+        service.receive_stock(session, None, {pid: 5})
+
+    # Sale: pending is read, compaction folds it, then the new stock is published
+    pending_deltas, published = StockLedger.pending_deltas, []
+
+    def compact_after_read(session, product_ids):
+        pending = pending_deltas(session, product_ids)
+        compact()
+        return pending
+
+    monkeypatch.setattr(StockLedger, "pending_deltas", staticmethod(compact_after_read))
+    monkeypatch.setattr(stock_service, "record_stock_change", lambda session, p_id, qty: published.append((p_id, qty)))
+    with Session(engine) as session:
+        service.process_sale(session, user_id=None, items_data=[{"product_id": pid, "quantity": 3}])
+    assert published == [(pid, 17)]
+    engine.dispose()
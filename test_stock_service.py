@@ -0,0 +1,133 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from database.models import Product, Sale, SaleItem, StockMovement
+from services.stock_service import StockService, ProductNotFoundError
+
+
+@pytest.fixture
+def service(tmp_path):
+    return StockService(static_dir=str(tmp_path / "barcodes"))
+
+
+def test_sale_by_barcode_aggregates_lines_and_bulk_inserts(service, session):
+    session.add_all([Product(name=f"P{i}", barcode=f"779{i:04d}", price=10, stock_quantity=5) for i in range(250)])
+    session.commit()
+
+    items = [{"barcode": f"779{i:04d}", "quantity": 1} for i in range(250)]
+    items.append({"barcode": "7790000", "quantity": 2})  # scanned again
+    sale = service.process_sale_by_barcode(session, user_id=None, items_data=items)
+
+    assert sale.total_amount == 2520
+    assert len(session.exec(select(SaleItem).where(SaleItem.sale_id == sale.id)).all()) == 251
+    first = session.exec(select(Product).where(Product.barcode == "7790000")).one()
+    assert first.stock_quantity == 2
+    item = session.exec(select(SaleItem).where(SaleItem.product_id == first.id)).first()
+    assert item.product_name == "P0" and item.total == 10
+
+
+def test_sale_by_barcode_reports_unknown_codes_without_writing(service, session):
+    session.add(Product(name="A", barcode="A1", stock_quantity=5))
+    session.commit()
+
+    with pytest.raises(ProductNotFoundError, match="NOPE"):
+        service.process_sale_by_barcode(session, user_id=None, items_data=[
+            {"barcode": "A1", "quantity": 1}, {"barcode": "NOPE", "quantity": 1},
+        ])
+    session.rollback()
+    assert session.exec(select(Sale)).all() == []
+    assert session.exec(select(Product)).one().stock_quantity == 5
+
+
+def test_insufficient_stock_counts_duplicate_lines(service, session):
+    session.add(Product(name="A", barcode="A1", stock_quantity=3))
+    session.commit()
+    with pytest.raises(ValueError, match="Insufficient stock for A"):
+        service.process_sale(session, user_id=None, items_data=[
+            {"product_id": 1, "quantity": 2}, {"product_id": 1, "quantity": 2},
+        ])
+
+
+def test_duplicate_idempotency_key_fails_before_touching_stock(service, session):
+    from sqlalchemy.exc import IntegrityError
+
+    session.add(Product(name="A", barcode="A1", price=10, stock_quantity=5))
+    session.commit()
+    sale = service.process_sale(session, user_id=None, items_data=[{"product_id": 1, "quantity": 1}], idempotency_key="k-1")
+
+    with pytest.raises(IntegrityError):
+        service.process_sale(session, user_id=None, items_data=[{"product_id": 1, "quantity": 1}], idempotency_key="k-1")
+    session.rollback()
+
+    assert service.get_sale_by_idempotency_key(session, "k-1").id == sale.id
+    assert session.get(Product, 1).stock_quantity == 4
+
+
+def test_batch_isolates_shortfalls_and_reports_duplicates(service, session):
+    session.add_all([Product(name="A", barcode="A1", price=10, stock_quantity=3), Product(name="B", barcode="B1", price=5, stock_quantity=10)])
+    session.commit()
+    service.process_sale(session, user_id=None, items_data=[{"product_id": 2, "quantity": 1}], idempotency_key="already-sent")
+
+    results = service.process_sale_batch(session, user_id=None, sales_data=[
+        {"idempotency_key": "s1", "items": [{"product_id": 1, "quantity": 2}]},
+        {"idempotency_key": "s2", "items": [{"product_id": 2, "quantity": 1}, {"product_id": 1, "quantity": 2}]},
+        {"idempotency_key": "already-sent", "items": [{"product_id": 2, "quantity": 1}]},
+        {"idempotency_key": "s3", "items": [{"product_id": 2, "quantity": 4}]},
+        {"items": [{"product_id": 2, "quantity": 1}]},
+    ])
+
+    assert [r["status"] for r in results] == ["created", "conflict", "duplicate", "created", "error"]
+    assert results[1]["shortfall"] == {"product_id": 1, "product_name": "A", "requested": 2, "available": 1}
+
+    session.expire_all()
+    assert session.get(Product, 1).stock_quantity == 1
+    assert session.get(Product, 2).stock_quantity == 5  # 10 - 1 (earlier) - 4; the rejected sale left nothing
+    assert service.get_sale_by_idempotency_key(session, "s2") is None
+    assert len(session.exec(select(Sale)).all()) == 3
+
+
+def test_batched_entry_aggregates_and_reports_unknown(service, session):
+    session.add_all([Product(name="A", barcode="A1", stock_quantity=1), Product(name="B", barcode="B1", stock_quantity=0)])
+    session.commit()
+
+    result = service.receive_stock_by_barcode(session, user_id=None, items_data=[
+        {"barcode": "A1", "quantity": 2}, {"barcode": "B1", "quantity": 1},
+        {"barcode": "A1", "quantity": 3}, {"barcode": "NOPE", "quantity": 1},
+    ])
+
+    assert result["unknown"] == ["NOPE"]
+    assert {r["barcode"]: (r["qty"], r["new_stock"]) for r in result["received"]} == {"A1": (5, 6), "B1": (1, 1)}
+    assert len(session.exec(select(StockMovement)).all()) == 2
+
+
+def test_batched_entry_rejects_bad_lines_and_replays_by_key(service, session):
+    session.add(Product(name="A", barcode="A1", stock_quantity=1))
+    session.commit()
+    items = [{"barcode": "A1", "quantity": 2}, {"barcode": "A1", "quantity": 0}, {"barcode": "", "quantity": 1}]
+
+    result = service.receive_stock_by_barcode(session, user_id=None, items_data=items, idempotency_key="batch-1")
+    assert [(r["barcode"], r["new_stock"]) for r in result["received"]] == [("A1", 3)]
+    assert [r["qty"] for r in result["rejected"]] == [0, 1]
+
+    # A retry of the same upload is answered from the stored result, stock is not added again
+    assert service.get_picking_batch(session, "batch-1") == result
+    assert service.get_picking_batch(session, "batch-2") is None
+    with pytest.raises(IntegrityError):
+        service.receive_stock_by_barcode(session, user_id=None, items_data=items, idempotency_key="batch-1")
+    session.rollback()
+    assert len(session.exec(select(StockMovement)).all()) == 1
+
+
+def test_assign_missing_barcodes_in_one_update(service, session):
+    products = [Product(name="A", barcode=""), Product(name="B", barcode="KEEP")]
+    session.add_all(products)
+    session.commit()
+
+    updated = service.assign_missing_barcodes(session, products)
+    session.commit()
+
+    assert [p.name for p in updated] == ["A"]
+    assert [p.barcode for p in session.exec(select(Product).order_by(Product.id)).all()] == [
+        str(products[0].id).zfill(8), "KEEP"
+    ]